@@ -0,0 +1,221 @@
+#pragma once
+#include "utills.hpp"
+#include <algorithm>
+#include <fstream>
+#include <string>
+#include <vector>
+#include <charconv>
+#include <cstring>
+#include <limits>
+#include <stdexcept>
+
+//parallel csv loader, the file is split into byte ranges that start right after a newline and every range is
+//parsed on the thread pool, only the requested columns are converted and the ranges are merged into one soaPoints
+//rows with NaN (empty or non numeric cell) in any requested column are skipped, same as rapidcsv ConverterParams(true)
+//quoted cells are read, line breaks inside quotes are not supported (same as the rapidcsv default)
+
+//bytes per range, every running task holds one range in memory
+constexpr size_t csvRangeBytes = size_t{32} << 20;
+
+//find the end of the cell that starts at cell, a quoted cell can hold the separator
+inline const char* csvCellEnd(const char* cell, const char* lineEnd){
+    if(cell < lineEnd && *cell == '"'){
+        cell++;
+        while(cell < lineEnd){
+            if(*cell == '"'){
+                //"" is an escaped quote
+                if(cell + 1 < lineEnd && cell[1] == '"'){
+                    cell += 2;
+                    continue;
+                }
+                cell++;
+                break;
+            }
+            cell++;
+        }
+    }
+    const char* comma = static_cast<const char*>(std::memchr(cell, ',', lineEnd - cell));
+    return comma ? comma : lineEnd;
+}
+
+//trim the spaces, the line end and the quotes of a cell
+inline void csvTrim(const char*& first, const char*& last){
+    while(first < last && (*first == ' ' || *first == '\t')) first++;
+    while(last > first && (last[-1] == ' ' || last[-1] == '\t' || last[-1] == '\r')) last--;
+    if(last - first >= 2 && *first == '"' && last[-1] == '"'){
+        first++;
+        last--;
+    }
+}
+
+//convert a cell to float, empty or non numeric cells are NaN
+inline float csvParseFloat(const char* first, const char* last){
+    csvTrim(first, last);
+    if(first < last && *first == '+') first++;
+
+    float value;
+    auto [ptr, ec] = std::from_chars(first, last, value);
+    if(first == last || ec != std::errc() || ptr != last){
+        return std::numeric_limits<float>::quiet_NaN();
+    }
+    return value;
+}
+
+//get the cells of the header line
+inline std::vector<std::string> csvHeaders(const std::string& line){
+    const char* first = line.data();
+    const char* lineEnd = first + line.size();
+    //utf-8 byte order mark
+    if(line.size() >= 3 && std::memcmp(first, "\xEF\xBB\xBF", 3) == 0) first += 3;
+
+    std::vector<std::string> headers;
+    while(true){
+        const char* cellEnd = csvCellEnd(first, lineEnd);
+        const char* a = first;
+        const char* b = cellEnd;
+        csvTrim(a, b);
+        headers.emplace_back(a, b);
+        if(cellEnd == lineEnd) break;
+        first = cellEnd + 1;
+    }
+    return headers;
+}
+
+//parse the rows of one byte range, the valid rows are appended to one column per field
+inline void csvParseRange(const std::string& path, size_t begin, size_t end, const std::vector<std::vector<size_t>>& fieldsOfColumn, size_t numDims, std::vector<std::vector<float>>& out){
+    std::ifstream file(path, std::ios::binary);
+    std::string buf(end - begin, '\0');
+    file.seekg(begin);
+    file.read(buf.data(), buf.size());
+
+    out.assign(numDims, {});
+    std::vector<float> row(numDims);
+    size_t lastColumn = fieldsOfColumn.size() - 1;
+
+    const char* p = buf.data();
+    const char* bufEnd = p + buf.size();
+    while(p < bufEnd){
+        const char* lineEnd = static_cast<const char*>(std::memchr(p, '\n', bufEnd - p));
+        if(!lineEnd) lineEnd = bufEnd;
+
+        std::fill(row.begin(), row.end(), std::numeric_limits<float>::quiet_NaN());
+        const char* cell = p;
+        for(size_t c{0}; c <= lastColumn; c++){
+            const char* cellEnd = csvCellEnd(cell, lineEnd);
+            if(!fieldsOfColumn[c].empty()){
+                float value = csvParseFloat(cell, cellEnd);
+                for(auto j : fieldsOfColumn[c]){
+                    row[j] = value;
+                }
+            }
+            if(cellEnd == lineEnd) break;
+            cell = cellEnd + 1;
+        }
+
+        //skip the rows with NaN
+        bool valid{true};
+        for(auto v : row){
+            if(std::isnan(v)){
+                valid = false;
+                break;
+            }
+        }
+        if(valid){
+            for(size_t j{0}; j < numDims; j++){
+                out[j].push_back(row[j]);
+            }
+        }
+        p = lineEnd + 1;
+    }
+}
+
+//load the fields of the csv into one contiguous soaPoints, the byte ranges are parsed on the pool
+inline soaPoints loadCsv(const std::string& path, const std::vector<std::string>& fields, threadPool& pool, size_t numThreads){
+    std::ifstream file(path, std::ios::binary | std::ios::ate);
+    if(!file){
+        throw std::runtime_error("Could not open the dataset " + path);
+    }
+    size_t size = static_cast<size_t>(file.tellg());
+    file.seekg(0);
+
+    std::string headerLine;
+    std::getline(file, headerLine);
+    size_t dataStart = file.eof() ? size : static_cast<size_t>(file.tellg());
+    std::vector<std::string> headers = csvHeaders(headerLine);
+
+    //the csv columns of every field
+    size_t numDims = fields.size();
+    std::vector<size_t> columnOfField;
+    size_t lastColumn{0};
+    for(auto& f : fields){
+        auto it = std::find(headers.begin(), headers.end(), f);
+        if(it == headers.end()){
+            throw std::runtime_error("Field '" + f + "' is not in the dataset");
+        }
+        columnOfField.push_back(it - headers.begin());
+        lastColumn = std::max(lastColumn, columnOfField.back());
+    }
+    std::vector<std::vector<size_t>> fieldsOfColumn(lastColumn + 1);
+    for(size_t j{0}; j < numDims; j++){
+        fieldsOfColumn[columnOfField[j]].push_back(j);
+    }
+
+    //range boundaries, every boundary is moved to the start of the next line
+    size_t numRanges = std::max(numThreads, (size - dataStart) / csvRangeBytes + 1);
+    std::vector<size_t> bounds{dataStart};
+    std::vector<char> probe(4096);
+    for(size_t r{1}; r < numRanges; r++){
+        size_t offset = dataStart + (size - dataStart) * r / numRanges;
+        if(offset <= bounds.back()) continue;
+
+        file.clear();
+        file.seekg(offset - 1);
+        size_t pos = offset - 1;
+        bool found{false};
+        while(!found && pos < size){
+            file.read(probe.data(), probe.size());
+            size_t n = static_cast<size_t>(file.gcount());
+            if(n == 0) break;
+            const char* nl = static_cast<const char*>(std::memchr(probe.data(), '\n', n));
+            if(nl){
+                pos += nl - probe.data() + 1;
+                found = true;
+            }else{
+                pos += n;
+            }
+        }
+        if(!found || pos >= size) break;
+        if(pos > bounds.back()) bounds.push_back(pos);
+    }
+    bounds.push_back(size);
+
+    //parse the ranges on all threads
+    size_t numParts = bounds.size() - 1;
+    std::vector<std::vector<std::vector<float>>> parts(numParts);
+    std::vector<std::future<void>> futures;
+    for(size_t r{0}; r < numParts; r++){
+        futures.push_back(pool.enqueue([&, r](){
+            csvParseRange(path, bounds[r], bounds[r + 1], fieldsOfColumn, numDims, parts[r]);
+        }));
+    }
+    for(auto& f : futures){
+        f.get();
+    }
+
+    //merge the ranges in file order
+    size_t numPoints{0};
+    for(auto& part : parts){
+        numPoints += part[0].size();
+    }
+    soaPoints points(numPoints, numDims);
+    size_t offset{0};
+    for(auto& part : parts){
+        for(size_t j{0}; j < numDims; j++){
+            std::copy(part[j].begin(), part[j].end(), points.dim(j) + offset);
+        }
+        offset += part[0].size();
+        part.clear();
+        part.shrink_to_fit();
+    }
+    return points;
+}
@@ -8,78 +8,30 @@
 #include <queue>
 #include <future>
 
-struct point{
+//structure of arrays for any number of dimensions, dimension j of point i is at values[j * numPoints + i]
+//every dimension is one contiguous array, so the loops over the points vectorize for any d
+struct soaPoints{
     public:
-        point() = default;
-        point(float x, float y, float z) : x(x),y(y),z(z){}
-        float x,y,z;
+        soaPoints() = default;
+        soaPoints(size_t numPoints, size_t numDims) : numPoints(numPoints), numDims(numDims), values(numPoints * numDims) {}
+        size_t numPoints{0}, numDims{0};
+        std::vector<float> values;
 
-        float squaredNorm(){
-            return x*x + y*y + z*z;
+        float* dim(size_t j){
+            return values.data() + j * numPoints;
         }
-        bool operator==(const point& a) const{
-            auto eq = [](float a, float b){
-                return std::fabs(a - b) < 1e-6f;
-            };
-            return eq(x, a.x) && eq(y, a.y) && eq(z, a.z);
+        const float* dim(size_t j) const{
+            return values.data() + j * numPoints;
         }
 
-        point operator-(const point& a) const{
-            return point((x-a.x), (y-a.y), (z-a.z));
-        }
-
-};
-
-class cluster{
-    public:
-        cluster() = default;
-        cluster(const point& center) : center(center) {}
-
-        point getCenter() const{
-            return center;
-        }
-
-        void calculateCenter(){
-            if(points.empty()) return;
-            
-            float newX(0), newY(0), newZ(0);
-            for(const auto& i : points){
-                newX += i.x;
-                newY += i.y;
-                newZ += i.z;
+        //L1 distance from point i to a center stored as numDims contiguous floats
+        float d(size_t i, const float* center) const{
+            float dist{0.0f};
+            for(size_t j{0}; j < numDims; j++){
+                dist += std::fabs(dim(j)[i] - center[j]);
             }
-
-            newX /= points.size();
-            newY /= points.size();
-            newZ /= points.size();
-
-            center.x = newX;
-            center.y = newY;
-            center.z = newZ;
+            return dist;
         }
-
-        void addPoint(const point& a){
-            points.push_back(a);
-        }
-
-        float d(const point& a){
-            return fabs(center.x - a.x) + fabs(center.y - a.y) + fabs(center.z - a.z);
-        }
-
-        void clearPoints(){
-            points.clear();
-        }
-
-        const std::vector<point>& getPoints() const{
-            return points;
-        }
-
-        size_t numPoints(){
-            return points.size();
-        }
-    private:
-        point center;
-        std::vector<point> points;
 };
 
 class threadPool{
@@ -1,192 +1,449 @@
 #include "../include/json.hpp"
-#include "../include/rapidcsv.h"
 #include "../include/utills.hpp"
+#include "../include/csvLoader.hpp"
 #include <random>
 #include <iostream>
+#include <cstdint>
+#include <numeric>
+#include <algorithm>
+#include <iterator>
+#include <chrono>
+#ifdef _WIN32
+#include <io.h>
+#include <fcntl.h>
+#endif
 
 using json = nlohmann::ordered_json;
-using rapidcsv::Document;
 int main(){
     constexpr int numIterations = 100;
     constexpr float eps2 = 1e-8f;
+    //number of points processed together in the assignment, the distance loops run over a tile
+    constexpr size_t tileSize = 256;
 
     //parse the json object passed as a runtime argument
     json input;
-    
+
     std::cin >> input;
 
-    //open the dataset specified
-    Document dataset(input["dataset"].get<std::string>(),rapidcsv::LabelParams(0, -1), rapidcsv::SeparatorParams(','), rapidcsv::ConverterParams(true));
-    
-    //declare the clusters and reserve space for them
     int numClusters = input["numClusters"].get<int>();
-    std::vector<cluster> clusters;
-    clusters.reserve(numClusters);
-
-    //get the data from the points in the dataset
-    std::vector<point> instances;
-    std::string x = input["fields"][0].get<std::string>();
-    std::string y = input["fields"][1].get<std::string>();
-    std::string z = input["fields"][2].get<std::string>();
-    auto xs = dataset.GetColumn<float>(x);
-    auto ys = dataset.GetColumn<float>(y);
-    auto zs = dataset.GetColumn<float>(z);
-    for(size_t i{0}; i < xs.size(); i++){
-        if(std::isnan(xs[i]) || std::isnan(ys[i]) || std::isnan(zs[i])){
-            continue;
-        }
-        instances.emplace_back(xs[i], ys[i], zs[i]);
+
+    //seeding of the centers, kmeans|| is only in the numpy engines
+    std::string init = input.value("init", std::string("random"));
+    if(init != "random" && init != "kmeans++"){
+        std::cerr << "unknown init: " << init;
+        return 1;
+    }
+
+    //"hamerly" keeps an upper bound of the distance to the own center and a lower bound of the distance to every
+    //other center for each instance, the centers are only compared when the bounds overlap (same labels as "lloyd")
+    std::string assignment = input.value("assignment", std::string("lloyd"));
+    if(assignment != "lloyd" && assignment != "hamerly"){
+        std::cerr << "unknown assignment: " << assignment;
+        return 1;
     }
-    
+    bool bounded = assignment == "hamerly";
+
+    //number of threads, all cores by default, "threads" sets it for benchmarks
+    int numThreads = input.value("threads", 0);
+    if(numThreads <= 0){
+        numThreads = std::max(1u, std::thread::hardware_concurrency());
+    }
+    //the pool size is an uint8_t, more threads would wrap around (256 -> 0 threads)
+    numThreads = std::min(numThreads, 255);
+    threadPool pool(static_cast<uint8_t>(numThreads));
+
+    //get the data from the points in the dataset, any number of fields
+    std::vector<std::string> fields = input["fields"].get<std::vector<std::string>>();
+    size_t numDims = fields.size();
+    if(numDims == 0){
+        std::cerr << "fields are required";
+        return 1;
+    }
+
+    //the file is parsed in byte ranges on all threads, the rows with NaN are skipped
+    soaPoints instances;
+    try{
+        instances = loadCsv(input["dataset"].get<std::string>(), fields, pool, numThreads);
+    }catch(const std::exception& e){
+        std::cerr << e.what();
+        return 1;
+    }
+    int numOfPoints = instances.numPoints;
+
     //get the cluster centroid needed for validation
-    int numOfPoints = instances.size();
-    float cx{0}, cy{0}, cz{0};
-    for(auto& i : instances){
-        cx += i.x;
-        cy += i.y;
-        cz += i.z;
+    std::vector<double> datasetCentroid(numDims, 0.0);
+    for(size_t j{0}; j < numDims; j++){
+        const float* xs = instances.dim(j);
+        for(auto i{0}; i < numOfPoints; i++){
+            datasetCentroid[j] += xs[i];
+        }
+        datasetCentroid[j] /= numOfPoints;
     }
-    point datasetCentroid((cx/instances.size()), (cy/instances.size()), (cz/instances.size()));
+
+    //the centers, numDims contiguous floats for every cluster
+    std::vector<float> centers;
+    centers.reserve(numClusters * numDims);
+    auto addCenter = [&](size_t i){
+        for(size_t j{0}; j < numDims; j++){
+            centers.push_back(instances.dim(j)[i]);
+        }
+    };
 
     if(!input.contains("centers")){
-        //sample random instances from the dataset for centroids
-        std::random_device rd;
-        std::mt19937 gen(rd());
-        std::uniform_int_distribution<> distrib(0, numOfPoints - 1);
-        for(auto i{0}; i < numClusters; i++){
-            clusters.emplace_back(instances[distrib(gen)]);
+        if(numClusters > numOfPoints){
+            std::cerr << "numClusters is larger than the number of valid rows";
+            return 1;
+        }
+
+        //a fixed seed makes the run reproducible
+        std::mt19937 gen(input.contains("seed") ? input["seed"].get<uint32_t>() : std::random_device{}());
+
+        if(init == "kmeans++"){
+            //k-means++, every next center is sampled with probability D(x)^2
+            std::uniform_int_distribution<> distrib(0, numOfPoints - 1);
+            std::vector<float> d2(numOfPoints, std::numeric_limits<float>::max());
+            std::vector<bool> chosen(numOfPoints, false);
+            int next = distrib(gen);
+            for(auto i{0}; i < numClusters; i++){
+                chosen[next] = true;
+                addCenter(next);
+                if(i == numClusters - 1) break;
+
+                const float* last = centers.data() + i * numDims;
+                double total{0.0};
+                for(auto p{0}; p < numOfPoints; p++){
+                    float d = chosen[p] ? 0.0f : instances.d(p, last);
+                    d2[p] = std::min(d2[p], d * d);
+                    total += d2[p];
+                }
+
+                if(total > 0.0){
+                    std::discrete_distribution<> weighted(d2.begin(), d2.end());
+                    next = weighted(gen);
+                }else{
+                    //every point is on a center already, take any instance that is not chosen yet
+                    do{
+                        next = distrib(gen);
+                    }while(chosen[next]);
+                }
+            }
+        }else{
+            //sample distinct random instances from the dataset for centroids
+            std::vector<int> indexes(numOfPoints);
+            std::iota(indexes.begin(), indexes.end(), 0);
+            std::vector<int> sampled;
+            std::sample(indexes.begin(), indexes.end(), std::back_inserter(sampled), numClusters, gen);
+            std::shuffle(sampled.begin(), sampled.end(), gen);
+            for(auto i : sampled){
+                addCenter(i);
+            }
         }
     }else{
-        //get the centers of the clusters and prepare them for clustering
+        //get the centers of the clusters, {"x":..,"y":..,"z":..} for up to 3 fields or an array of numDims values
+        const char* keys[3] = {"x", "y", "z"};
         for(auto& c : input["centers"]){
-            point center(c["x"].get<float>(), c["y"].get<float>(), c["z"].get<float>());
-            clusters.emplace_back(center);
+            if(c.is_array()){
+                if(c.size() != numDims){
+                    std::cerr << "Each center needs " << numDims << " coordinates";
+                    return 1;
+                }
+                for(auto& v : c){
+                    centers.push_back(v.get<float>());
+                }
+            }else{
+                if(numDims > 3){
+                    std::cerr << "Centers for more than 3 fields must be arrays";
+                    return 1;
+                }
+                for(size_t j{0}; j < numDims; j++){
+                    centers.push_back(c[keys[j]].get<float>());
+                }
+            }
         }
+        numClusters = centers.size() / numDims;
     }
 
-    int numThreads = std::thread::hardware_concurrency();
-    threadPool pool(numThreads);
+    //the cluster index of every instance
+    std::vector<int32_t> labels(numOfPoints);
+
+    //with "progress": true every iteration writes one json line to stderr, the ui shows it and can kill the process
+    bool progress = input.value("progress", false);
+    auto startTime = std::chrono::steady_clock::now();
 
     //the clustering algorithm
     int iteration{0};
     float eps{1.0};
-    size_t chunkSize = static_cast<size_t>(std::ceil(static_cast<float>(instances.size()) / numThreads));
-    std::vector<point> oldCenters(numClusters);
+    size_t chunkSize = static_cast<size_t>(std::ceil(static_cast<float>(numOfPoints) / numThreads));
+    std::vector<float> oldCenters(centers.size());
+    std::vector<int64_t> counts(numClusters);
+
+    //the bounds of every instance, the half distance from every center to its closest other center and the shift
+    //of every center in the last update (the largest one is the shift of maxShiftCluster)
+    std::vector<float> upper, lower;
+    if(bounded){
+        upper.resize(numOfPoints);
+        lower.resize(numOfPoints);
+    }
+    std::vector<float> halfGap(numClusters), shifts(numClusters, 0.0f);
+    int maxShiftCluster{0};
+    float largestShift{0.0f}, secondShift{0.0f};
+
     while(iteration < numIterations && eps > eps2){
         //get the centroids from the earlier iterartion, important for calculating the rate of change
-        for(auto i{0} ; i < numClusters; i++){
-            clusters[i].clearPoints();
-            oldCenters[i] = clusters[i].getCenter();
+        oldCenters = centers;
+
+        if(bounded){
+            for(auto k{0}; k < numClusters; k++){
+                float gap = std::numeric_limits<float>::max();
+                for(auto other{0}; other < numClusters; other++){
+                    if(other == k) continue;
+                    float d{0.0f};
+                    for(size_t j{0}; j < numDims; j++){
+                        d += std::fabs(centers[k * numDims + j] - centers[other * numDims + j]);
+                    }
+                    gap = std::min(gap, d);
+                }
+                halfGap[k] = 0.5f * gap;
+            }
         }
-        //split the dataset into chunks to allow paralelization
-        std::vector<std::vector<std::vector<point>>> threadLocalPoints(numThreads, std::vector<std::vector<point>>(numClusters));
+
+        //split the dataset into chunks to allow paralelization, every thread sums its points per cluster
+        std::vector<std::vector<double>> threadLocalSums(numThreads, std::vector<double>(numClusters * numDims, 0.0));
+        std::vector<std::vector<int64_t>> threadLocalCounts(numThreads, std::vector<int64_t>(numClusters, 0));
         std::vector<std::future<void>> futures;
         for(auto t{0}; t < numThreads; t++){
-            auto start = t * chunkSize;
-            auto end = std::min(start + chunkSize, instances.size());
-            
+            size_t start = t * chunkSize;
+            size_t end = std::min(start + chunkSize, static_cast<size_t>(numOfPoints));
+
+            //the bounded assignment, a point is compared with every center only when its bounds overlap
+            if(bounded){
+                futures.push_back(pool.enqueue([&, t, start, end](){
+                    auto& sums = threadLocalSums[t];
+                    auto& localCounts = threadLocalCounts[t];
+                    for(size_t i{start}; i < end; i++){
+                        bool scan = iteration == 0;
+                        if(!scan){
+                            int32_t a = labels[i];
+                            upper[i] += shifts[a];
+                            lower[i] -= a == maxShiftCluster ? secondShift : largestShift;
+
+                            float bound = std::max(halfGap[a], lower[i]);
+                            if(upper[i] > bound){
+                                upper[i] = instances.d(i, centers.data() + a * numDims);
+                                scan = upper[i] > bound;
+                            }
+                        }
+
+                        if(scan){
+                            float first = std::numeric_limits<float>::max();
+                            float second = std::numeric_limits<float>::max();
+                            int32_t best{0};
+                            for(auto k{0}; k < numClusters; k++){
+                                float d = instances.d(i, centers.data() + k * numDims);
+                                if(d < first){
+                                    second = first;
+                                    first = d;
+                                    best = k;
+                                }else if(d < second){
+                                    second = d;
+                                }
+                            }
+                            labels[i] = best;
+                            upper[i] = first;
+                            lower[i] = second;
+                        }
+
+                        localCounts[labels[i]]++;
+                        for(size_t j{0}; j < numDims; j++){
+                            sums[labels[i] * numDims + j] += instances.dim(j)[i];
+                        }
+                    }
+                }));
+                continue;
+            }
+
             //calculate the smallest distance for every point and store it
             futures.push_back(pool.enqueue([&, t, start, end](){
-                for(auto i{start}; i < end; i++){
-                    const point& p = instances[i];
-                    int best{0};
-                    float minD = std::numeric_limits<float>::max();
+                std::vector<float> minD(tileSize), dist(tileSize);
+                std::vector<int32_t> best(tileSize);
+                for(size_t tileStart{start}; tileStart < end; tileStart += tileSize){
+                    size_t n = std::min(tileSize, end - tileStart);
+                    std::fill(minD.begin(), minD.end(), std::numeric_limits<float>::max());
 
                     for(auto k{0}; k < numClusters; k++){
-                        float dist = clusters[k].d(p);
-                        if(dist < minD){
-                            minD = dist;
-                            best = k;
+                        std::fill(dist.begin(), dist.end(), 0.0f);
+                        for(size_t j{0}; j < numDims; j++){
+                            const float* xs = instances.dim(j) + tileStart;
+                            float c = centers[k * numDims + j];
+                            for(size_t i{0}; i < n; i++){
+                                dist[i] += std::fabs(xs[i] - c);
+                            }
+                        }
+                        for(size_t i{0}; i < n; i++){
+                            if(dist[i] < minD[i]){
+                                minD[i] = dist[i];
+                                best[i] = k;
+                            }
+                        }
+                    }
+
+                    auto& sums = threadLocalSums[t];
+                    auto& localCounts = threadLocalCounts[t];
+                    for(size_t i{0}; i < n; i++){
+                        labels[tileStart + i] = best[i];
+                        localCounts[best[i]]++;
+                    }
+                    for(size_t j{0}; j < numDims; j++){
+                        const float* xs = instances.dim(j) + tileStart;
+                        for(size_t i{0}; i < n; i++){
+                            sums[best[i] * numDims + j] += xs[i];
                         }
                     }
-                    threadLocalPoints[t][best].push_back(p);
                 }
             }));
         }
 
-        //synchronize the threads to the main program 
+        //synchronize the threads to the main program
         for(auto& f : futures){
             f.get();
         }
         futures.clear();
 
-        //assign the points to the nearest cluster
+        //update the centroids, empty clusters keep their center
         for(auto k{0}; k < numClusters; k++){
+            counts[k] = 0;
             for(auto t{0}; t < numThreads; t++){
-                for(auto& p : threadLocalPoints[t][k]){
-                    clusters[k].addPoint(p);
+                counts[k] += threadLocalCounts[t][k];
+            }
+            if(counts[k] == 0) continue;
+            for(size_t j{0}; j < numDims; j++){
+                double sum{0.0};
+                for(auto t{0}; t < numThreads; t++){
+                    sum += threadLocalSums[t][k * numDims + j];
                 }
+                centers[k * numDims + j] = static_cast<float>(sum / counts[k]);
             }
         }
 
-        //update the centroids
-        for(auto k{0}; k < numClusters; k++){
-            futures.push_back(pool.enqueue([&, k](){
-                clusters[k].calculateCenter();
-            }));
-        }
-        for(auto& f : futures){
-            f.get();
+        //the L1 shift of every center moves the bounds at the start of the next assignment
+        if(bounded){
+            largestShift = 0.0f;
+            secondShift = 0.0f;
+            for(auto k{0}; k < numClusters; k++){
+                shifts[k] = 0.0f;
+                for(size_t j{0}; j < numDims; j++){
+                    shifts[k] += std::fabs(centers[k * numDims + j] - oldCenters[k * numDims + j]);
+                }
+                if(shifts[k] > largestShift){
+                    secondShift = largestShift;
+                    largestShift = shifts[k];
+                    maxShiftCluster = k;
+                }else if(shifts[k] > secondShift){
+                    secondShift = shifts[k];
+                }
+            }
         }
-        futures.clear();
 
         //calculate the change, if its under the threshold break
         float maxShift{0.0f};
-        for(auto i{0}; i < numClusters; i++){
-            float shift = (clusters[i].getCenter() - oldCenters[i]).squaredNorm();
+        for(auto k{0}; k < numClusters; k++){
+            float shift{0.0f};
+            for(size_t j{0}; j < numDims; j++){
+                float diff = centers[k * numDims + j] - oldCenters[k * numDims + j];
+                shift += diff * diff;
+            }
             maxShift = std::max(maxShift, shift);
         }
 
         eps = maxShift;
         iteration++;
+
+        if(progress){
+            json event;
+            event["event"] = "iteration";
+            event["iteration"] = iteration;
+            event["eps"] = eps;
+            event["elapsed"] = std::chrono::duration<double>(std::chrono::steady_clock::now() - startTime).count();
+            std::cerr << event.dump() << std::endl;
+        }
     }
 
     //calculate BCSS and WCSS using the thread pool
-    std::vector<std::future<float>> futures;
-    float BCSS(0.0);
-    for(auto i{0}; i < numClusters; i++){
-        float bcss(0.0);
-        futures.push_back(pool.enqueue([&clusters, &datasetCentroid, i](){
-            return clusters[i].numPoints() * (clusters[i].getCenter() - datasetCentroid).squaredNorm();
-        }));
+    double BCSS{0.0};
+    for(auto k{0}; k < numClusters; k++){
+        double squaredNorm{0.0};
+        for(size_t j{0}; j < numDims; j++){
+            double diff = centers[k * numDims + j] - datasetCentroid[j];
+            squaredNorm += diff * diff;
+        }
+        BCSS += counts[k] * squaredNorm;
     }
-    for(auto& i : futures){
-        BCSS += i.get();
-    }
-    futures.clear();
-    float WCSS{0.0};
-    for(auto& c : clusters){
-        futures.push_back(pool.enqueue([c](){
-            float wcss{0.0};
-            point clusterCentroid = c.getCenter();
-            for(const auto& i : c.getPoints()){
-                wcss += (i - clusterCentroid).squaredNorm();
+    std::vector<std::future<double>> wcssFutures;
+    for(auto t{0}; t < numThreads; t++){
+        size_t start = t * chunkSize;
+        size_t end = std::min(start + chunkSize, static_cast<size_t>(numOfPoints));
+        wcssFutures.push_back(pool.enqueue([&, start, end](){
+            double wcss{0.0};
+            for(size_t j{0}; j < numDims; j++){
+                const float* xs = instances.dim(j);
+                for(size_t i{start}; i < end; i++){
+                    double diff = xs[i] - centers[labels[i] * numDims + j];
+                    wcss += diff * diff;
+                }
             }
             return wcss;
         }));
     }
-    for(auto& i : futures){
-        WCSS += i.get();
+    double WCSS{0.0};
+    for(auto& f : wcssFutures){
+        WCSS += f.get();
     }
 
     //calculate the CH index
-    float CH = (BCSS / (numClusters - 1)) / (WCSS / (numOfPoints - numClusters));
+    double CH = (BCSS / (numClusters - 1)) / (WCSS / (numOfPoints - numClusters));
+
+    //binary output: header, centers and the label of every instance, the points are not sent back
+    if(input.value("output", std::string("json")) == "binary"){
+#ifdef _WIN32
+        _setmode(_fileno(stdout), _O_BINARY);
+#endif
+        auto write = [](const void* data, size_t size){
+            std::cout.write(static_cast<const char*>(data), size);
+        };
+        const uint32_t header[3] = {
+            static_cast<uint32_t>(numOfPoints),
+            static_cast<uint32_t>(numClusters),
+            static_cast<uint32_t>(numDims)
+        };
+        write("KMB1", 4);
+        write(header, sizeof(header));
+        write(&CH, sizeof(CH));
+        std::vector<double> outputCenters(centers.begin(), centers.end());
+        write(outputCenters.data(), outputCenters.size() * sizeof(double));
+        write(labels.data(), labels.size() * sizeof(int32_t));
+        std::cout.flush();
+        return 0;
+    }
 
     //parse the result from the clustering in a JSON object
     json output;
     output["CH_index"] = CH;
-    for(auto c{0} ; c < clusters.size(); c++){
-        std::string key = "C" + std::to_string(c);
-        point center = clusters[c].getCenter();
-        output["centers"].push_back({center.x, center.y, center.z});
-        std::vector<point> outputCluster = clusters[c].getPoints();
-        output[key] = json::array();
-        for(auto p:outputCluster){
-            output[key].push_back({p.x, p.y, p.z});
-        } 
+    for(auto k{0}; k < numClusters; k++){
+        output["centers"].push_back(std::vector<float>(centers.begin() + k * numDims, centers.begin() + (k + 1) * numDims));
+    }
+    std::vector<json> outputClusters(numClusters, json::array());
+    for(auto i{0}; i < numOfPoints; i++){
+        json p = json::array();
+        for(size_t j{0}; j < numDims; j++){
+            p.push_back(instances.dim(j)[i]);
+        }
+        outputClusters[labels[i]].push_back(std::move(p));
+    }
+    for(auto k{0}; k < numClusters; k++){
+        output["C" + std::to_string(k)] = std::move(outputClusters[k]);
     }
 
     //print the results
     std::cout << output.dump(2);
     return 0;
-}
\ No newline at end of file
+}
@@ -0,0 +1,121 @@
+# startup benchmark, import time of the headless modules and cold start of the ui to the first frame
+#
+# usage:
+#   python bench_startup.py [--runs 5] [--max-headless-ms 400] [--max-first-frame-ms 4000]
+#
+# every measurement runs in a fresh interpreter, the median of the runs is compared with the threshold,
+# the exit code is 1 when a threshold is exceeded or a plotting backend is loaded at import time
+# imports
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gorkov_py_cpp_k_means")
+
+# modules used by the batch jobs and the ui without a graph
+HEADLESS_MODULES = ("K_means_api", "K_means_batch")
+
+# plotting backends, they must be loaded only when a graph is opened
+HEAVY_MODULES = ("plotly", "matplotlib")
+
+# printed by K_means_calc_main.main when K_MEANS_STARTUP_PROBE is set
+FIRST_FRAME_MARKER = "K_MEANS_FIRST_FRAME"
+
+IMPORT_PROBE = """
+import sys, time
+t = time.perf_counter()
+import {module}
+print((time.perf_counter() - t) * 1000)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+# fn to check if a module can be imported without importing it here
+def has_module(name: str) -> bool:
+    probe = subprocess.run([sys.executable, "-c", f"import importlib.util, sys; sys.exit(importlib.util.find_spec({name!r}) is None)"])
+    return probe.returncode == 0
+
+
+# fn to import a module in a fresh interpreter, returns the import time in ms and the loaded heavy modules
+def measure_import(module: str) -> tuple[float, list[str]]:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=SOURCE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+    return float(out[0]), [m for m in out[1].split(",") if m]
+
+
+# fn to start the ui and wait for the first frame, returns the time from the start of the process in ms
+def measure_first_frame(timeout: float) -> float:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "K_means_calc_main.py"],
+        cwd=SOURCE_DIR,
+        env=dict(os.environ, K_MEANS_STARTUP_PROBE="1"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    try:
+        for line in process.stdout:
+            if line.strip() == FIRST_FRAME_MARKER:
+                return (time.perf_counter() - start) * 1000
+            if time.perf_counter() - start > timeout:
+                break
+        raise RuntimeError("The ui did not reach the first frame")
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Startup benchmark of the k-means app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-headless-ms", type=float, default=400.0)
+    parser.add_argument("--max-first-frame-ms", type=float, default=4000.0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for the first frame")
+    args = parser.parse_args()
+
+    failed = False
+
+    # headless imports (batch jobs, api users)
+    for module in HEADLESS_MODULES:
+        times, heavy = [], set()
+        for _ in range(args.runs):
+            ms, loaded = measure_import(module)
+            times.append(ms)
+            heavy.update(loaded)
+        median = statistics.median(times)
+        ok = median <= args.max_headless_ms and not heavy
+        failed |= not ok
+        print(f"import {module:<20} {median:8.1f} ms (max {args.max_headless_ms:.0f})  {'ok' if ok else 'REGRESSION'}")
+        if heavy:
+            print(f"  plotting backends loaded at import: {', '.join(sorted(heavy))}")
+
+    # the ui, only when flet is installed
+    if not has_module("flet"):
+        print("flet is not installed, skipping the ui cold start")
+        return 1 if failed else 0
+
+    ms, heavy = measure_import("K_means_calc_main")
+    print(f"import {'K_means_calc_main':<20} {ms:8.1f} ms")
+    if heavy:
+        failed = True
+        print(f"  plotting backends loaded at import: {', '.join(sorted(heavy))}  REGRESSION")
+
+    median = statistics.median(measure_first_frame(args.timeout) for _ in range(args.runs))
+    ok = median <= args.max_first_frame_ms
+    failed |= not ok
+    print(f"{'cold start to first frame':<27} {median:8.1f} ms (max {args.max_first_frame_ms:.0f})  {'ok' if ok else 'REGRESSION'}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
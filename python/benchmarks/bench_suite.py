@@ -0,0 +1,307 @@
+# benchmark suite, times every phase of a run on the bundled datasets and on synthetic gaussian blobs
+#
+# usage:
+#   python bench_suite.py --out results.json
+#   python bench_suite.py --blob-rows 1e4,1e5,1e6,1e7 --exe v1=../gorkov_py_cpp_k_means/release_build_v1.0.exe --exe v2=../../cpp/build/kmeans
+#   python bench_suite.py --baseline baseline.json --tolerance 0.2
+#
+# phases of the numpy engine: csv_parse, csv_cached (column cache), seeding (k-means++), iterations,
+# metrics (inertia, CH, Davies-Bouldin and sampled silhouette), serialization (binary result), result_parsing (binary result to the
+# CH_index/centers/C{i} dict), plot_build (projection, decimation and the plotly figure), restarts
+# (nInit on 1..n processes), the exe engines are timed as engine (whole process) and result_parsing, and
+# as iterations from the progress events of the exe (the time of its loop, builds without progress skip it)
+#
+# the iterations of the numpy engine and of every exe start from the same k-means++ centers, the numpy
+# and exe iterations (and the time per iteration, the float32 exe can take a few iterations more or less)
+# are compared at the end of the run and written to "iterations" in the results
+#
+# every measurement is the median of --repeat runs, the results are written as json, one record per
+# (dataset, rows, engine, threads, phase), with --baseline every record is compared with the same
+# record of an earlier run and the exit code is 1 when one is slower than the tolerance
+# imports
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gorkov_py_cpp_k_means")
+DATASETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "datasets")
+sys.path.insert(0, SOURCE_DIR)
+
+from K_means_dataset import load_dataset
+from K_means_engine import init_centers, kmeans, run_kmeans_on_data
+from K_means_metrics import cluster_metrics
+from K_means_parallel import map_shared
+from K_means_plot import project_3d, decimate, GRAPH_POINT_BUDGET
+from K_means_transport import pack_result, unpack_result, result_to_dict, is_binary_result
+
+# bundled datasets and the fields used for them
+BUNDLED_DATASETS = {
+    "abalone": ("abalone.csv", ["LongestShell", "Diameter", "Height"]),
+    "autos": ("autos.csv", ["wheel_base", "length", "width"]),
+    "bike-sharing": ("bike-sharing.csv", ["temp", "hum", "windspeed"]),
+}
+
+# synthetic blobs, BLOB_CENTERS gaussian clusters in 3 dimensions
+BLOB_CENTERS = 8
+BLOB_FIELDS = ["x", "y", "z"]
+BLOB_CHUNK_ROWS = 1_000_000
+
+NUM_CLUSTERS = 8
+NUM_RESTARTS = 4
+
+# the CH_index/centers/C{i} dict holds every point as a python list, it is skipped for bigger datasets
+RESULT_DICT_MAX_ROWS = 1_000_000
+
+# records faster than this are not compared with the baseline, the noise is bigger than the time
+MIN_COMPARED_SECONDS = 0.005
+
+
+# fn to time fn() repeat times, returns the median in seconds and the last return value
+def timed(fn, repeat: int):
+    times = []
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), value
+
+
+# fn to write the gaussian blob dataset once, later runs reuse the file
+def blob_dataset(data_dir: str, rows: int) -> str:
+    path = os.path.join(data_dir, f"blobs_{rows}.csv")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(data_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(-10.0, 10.0, (BLOB_CENTERS, len(BLOB_FIELDS)))
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(",".join(BLOB_FIELDS) + "\n")
+        for start in range(0, rows, BLOB_CHUNK_ROWS):
+            n = min(BLOB_CHUNK_ROWS, rows - start)
+            points = centers[rng.integers(0, BLOB_CENTERS, n)] + rng.normal(0.0, 1.0, (n, len(BLOB_FIELDS)))
+            np.savetxt(f, points, fmt="%.6f", delimiter=",")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+# fn to benchmark the numpy engine phase by phase
+def bench_numpy(path: str, fields: list[str], repeat: int, threads: list[int], record):
+    parse_s, data = timed(lambda: load_dataset(path, fields, use_cache=False), 1)
+    record("csv_parse", parse_s)
+    load_dataset(path, fields)
+    record("csv_cached", timed(lambda: load_dataset(path, fields), repeat)[0])
+
+    k = min(NUM_CLUSTERS, data.shape[0])
+    seeding_s, centers = timed(lambda: init_centers(data, k, "kmeans++", np.random.default_rng(0)), repeat)
+    record("seeding", seeding_s)
+
+    iterations_s, clustering = timed(lambda: kmeans(data, k, centers.copy()), repeat)
+    record("iterations", iterations_s, iterations=clustering["iterations"], per_iteration=iterations_s / clustering["iterations"])
+
+    centers, labels = clustering["centers"], clustering["labels"]
+    record("metrics", timed(lambda: cluster_metrics(data, centers, labels, seed=0), repeat)[0])
+
+    serialization_s, buf = timed(lambda: pack_result(0.0, centers, labels), repeat)
+    record("serialization", serialization_s, bytes=len(buf))
+
+    if data.shape[0] <= RESULT_DICT_MAX_ROWS:
+        record("result_parsing", timed(lambda: result_to_dict(data, unpack_result(buf)), repeat)[0])
+
+    record("plot_build", timed(lambda: plot_build(data, centers, labels, fields), repeat)[0])
+
+    jobs = [({"numClusters": k, "seed": s, "init": "kmeans++"},) for s in range(NUM_RESTARTS)]
+    for t in threads:
+        record("restarts", timed(lambda: map_shared(data, run_kmeans_on_data, jobs, processes=t), 1)[0], threads=t)
+
+
+# fn to build the graph like the ui does, the plotly figure only when plotly is installed
+def plot_build(data: np.ndarray, centers: np.ndarray, labels: np.ndarray, fields: list[str]):
+    points_3d, centers_3d, titles = project_3d(data, centers, fields)
+    kept = decimate(points_3d, GRAPH_POINT_BUDGET)
+    try:
+        from K_means_plot import build_figure
+        build_figure(points_3d[kept], labels[kept], centers_3d, titles, "bench")
+    except ImportError:
+        pass
+
+
+# fn to benchmark an exe, the engine phase is the whole process, older builds answer in json
+def bench_exe(exe_path: str, path: str, fields: list[str], repeat: int, threads: list[int], record):
+    data = load_dataset(path, fields)
+    k = min(NUM_CLUSTERS, data.shape[0])
+    centers = init_centers(data, k, "kmeans++", np.random.default_rng(0))
+
+    # x/y/z centers are read by every exe version
+    payload = {
+        "dataset": path,
+        "numClusters": k,
+        "fields": fields,
+        "centers": [dict(zip(("x", "y", "z"), map(float, c))) for c in centers],
+        "output": "binary",
+    }
+
+    for t in threads:
+        input_bytes = json.dumps(dict(payload, threads=t)).encode("utf-8")
+
+        def run():
+            process = subprocess.run([exe_path], input=input_bytes, capture_output=True, check=True)
+            return process.stdout
+
+        engine_s, stdout = timed(run, repeat)
+        record("engine", engine_s, threads=t, bytes=len(stdout))
+
+        # the loop alone, the last progress event has the seconds since the loop started
+        progress_bytes = json.dumps(dict(payload, threads=t, progress=True)).encode("utf-8")
+        events = [last_iteration_event(exe_path, progress_bytes) for _ in range(repeat)]
+        if all(events):
+            iterations_s = statistics.median(e["elapsed"] for e in events)
+            iterations = events[-1]["iteration"]
+            record("iterations", iterations_s, threads=t, iterations=iterations, per_iteration=iterations_s / iterations)
+
+    def parse():
+        if is_binary_result(stdout):
+            if data.shape[0] <= RESULT_DICT_MAX_ROWS:
+                return result_to_dict(data, unpack_result(stdout))
+            return unpack_result(stdout)
+        return json.loads(stdout.decode("utf-8").lstrip("\ufeff"))
+
+    record("result_parsing", timed(parse, repeat)[0])
+
+
+# fn to run an exe with the progress events and get the last iteration event, None for builds without them
+def last_iteration_event(exe_path: str, input_bytes: bytes) -> dict | None:
+    process = subprocess.run([exe_path], input=input_bytes, capture_output=True, check=True)
+    events = []
+    for line in process.stderr.decode("utf-8", errors="replace").splitlines():
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(event, dict) and event.get("event") == "iteration":
+            events.append(event)
+    return events[-1] if events else None
+
+
+# fn to compare the numpy iterations with the iterations of the exe builds on the same dataset
+def compare_iterations(records: list[dict]) -> list[dict]:
+    numpy_iterations = {(r["dataset"], r["rows"]): r for r in records if r["phase"] == "iterations" and r["engine"] == "numpy"}
+    comparison = []
+    for r in records:
+        numpy = numpy_iterations.get((r["dataset"], r["rows"]))
+        if r["phase"] != "iterations" or r["engine"] == "numpy" or numpy is None:
+            continue
+        comparison.append({
+            "dataset": r["dataset"],
+            "rows": r["rows"],
+            "engine": r["engine"],
+            "threads": r["threads"],
+            "numpy_seconds": numpy["seconds"],
+            "numpy_iterations": numpy["iterations"],
+            "exe_seconds": r["seconds"],
+            "exe_iterations": r["iterations"],
+            # > 1 when the numpy engine is slower per iteration
+            "per_iteration_ratio": numpy["per_iteration"] / r["per_iteration"],
+        })
+    return comparison
+
+
+# fn to compare the records with a baseline, returns the slower records
+def compare(records: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    def key(r):
+        return (r["dataset"], r["rows"], r["engine"], r["threads"], r["phase"])
+
+    old = {key(r): r for r in baseline}
+    slower = []
+    for r in records:
+        b = old.get(key(r))
+        if b is None or b["seconds"] < MIN_COMPARED_SECONDS:
+            continue
+        ratio = r["seconds"] / b["seconds"]
+        r["baseline_seconds"] = b["seconds"]
+        r["ratio"] = ratio
+        if ratio > 1.0 + tolerance:
+            slower.append(r)
+    return slower
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark suite of the k-means engines")
+    parser.add_argument("--out", default="bench_results.json", help="json file for the results")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--blob-rows", default="1e4,1e5,1e6", help="comma separated sizes of the blob datasets, e.g. 1e4,1e5,1e6,1e7")
+    parser.add_argument("--threads", default=None, help="comma separated thread/process counts (default: 1 and the number of cpus)")
+    parser.add_argument("--exe", action="append", default=[], help="name=path of an exe build to benchmark, can be given more than once")
+    parser.add_argument("--no-numpy", action="store_true", help="benchmark only the exe builds")
+    parser.add_argument("--data-dir", default=os.path.join(os.path.expanduser("~"), ".k_means_cache", "bench"), help="dir for the generated blob datasets")
+    parser.add_argument("--baseline", default=None, help="json results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    threads = sorted({int(t) for t in args.threads.split(",")}) if args.threads else sorted({1, os.cpu_count() or 1})
+    exes = [e.split("=", 1) if "=" in e else (os.path.basename(e), e) for e in args.exe]
+
+    datasets = [(name, os.path.join(DATASETS_DIR, file), fields) for name, (file, fields) in BUNDLED_DATASETS.items()]
+    for rows in (int(float(r)) for r in args.blob_rows.split(",") if r):
+        datasets.append(("blobs", blob_dataset(args.data_dir, rows), BLOB_FIELDS))
+
+    records = []
+    for name, path, fields in datasets:
+        rows = load_dataset(path, fields).shape[0]
+
+        def recorder(engine: str):
+            def record(phase: str, seconds: float, threads: int = 1, **extra):
+                records.append(dict({"dataset": name, "rows": rows, "engine": engine, "threads": threads, "phase": phase, "seconds": seconds}, **extra))
+                print(f"{name:<13} {rows:>9} {engine:<8} {threads:>2} {phase:<15} {seconds * 1000:10.2f} ms", file=sys.stderr)
+            return record
+
+        if not args.no_numpy:
+            bench_numpy(path, fields, args.repeat, threads, recorder("numpy"))
+        for exe_name, exe_path in exes:
+            bench_exe(exe_path, path, fields, args.repeat, threads, recorder(exe_name))
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": records,
+        "iterations": compare_iterations(records),
+    }
+
+    for c in results["iterations"]:
+        print(
+            f"{c['dataset']:<13} {c['rows']:>9} iterations numpy {c['numpy_seconds'] * 1000:.2f} ms ({c['numpy_iterations']}), "
+            f"{c['engine']} threads={c['threads']} {c['exe_seconds'] * 1000:.2f} ms ({c['exe_iterations']}), "
+            f"numpy / exe per iteration {c['per_iteration_ratio']:.2f}",
+            file=sys.stderr,
+        )
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            slower = compare(records, json.load(f)["results"], args.tolerance)
+        for r in slower:
+            print(f"REGRESSION {r['dataset']} {r['rows']} {r['engine']} threads={r['threads']} {r['phase']}: {r['ratio']:.2f}x of the baseline", file=sys.stderr)
+        results["regressions"] = len(slower)
+        failed = bool(slower)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
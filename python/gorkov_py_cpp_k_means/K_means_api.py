@@ -0,0 +1,454 @@
+# importable clustering api, no ui imports, used by the flet app and the batch cli
+# imports
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from multiprocessing import util
+
+import numpy as np
+
+from K_means_dataset import load_dataset, check_fields, dataset_identity, has_rows_of
+from K_means_engine import run_kmeans_on_data, run_minibatch, warm_start_centers, get_scaling, CENTER_KEYS, MODES, ASSIGNMENT_MODES, INIT_MODES
+from K_means_metrics import SILHOUETTE_SAMPLE_ROWS, SILHOUETTE_CONFIDENCE
+from K_means_progress import POLL_INTERVAL, progress_guard
+from K_means_scaling import SCALING_MODES, scaling_weights
+from K_means_result_cache import result_key, get_result, put_result
+from K_means_trace import tracing, span, count, record_iteration, export_jsonl
+from K_means_transport import is_binary_result, unpack_result, result_to_dict, result_from_dict
+from K_means_worker import KMeansWorker
+
+# engines, "exe" runs the c++ build, "numpy" runs in-process, "worker" runs numpy in a long-lived process
+ENGINES = ("numpy", "worker", "exe")
+DEFAULT_EXE_PATH = "release_build_v1.0.exe"
+
+# the seedings of the exe, kmeans|| is only in the numpy engines
+EXE_INIT_MODES = ("random", "kmeans++")
+
+# every run appends its trace to this file (json lines) when K_MEANS_TRACE_FILE is set
+TRACE_PATH = os.environ.get("K_MEANS_TRACE_FILE")
+
+# the worker is started on the first run with the "worker" engine
+default_worker = None
+
+
+# fn to get the worker, it is started once and restarted when the health check fails
+def get_worker() -> KMeansWorker:
+    global default_worker
+
+    if default_worker is None:
+        default_worker = KMeansWorker()
+        # the worker is not a daemon, multiprocessing waits for its children at exit (also in a pool process,
+        # where atexit does not run), the finalizer stops it before that wait
+        util.Finalize(default_worker, stop_worker, exitpriority=10)
+    default_worker.ensure_alive()
+    return default_worker
+
+
+# fn to stop the worker if it was started
+def stop_worker():
+    if default_worker is not None:
+        default_worker.stop()
+
+
+# fn to parse the centers typed as text, "x,y,z" per center, empty or invalid → None (auto-select)
+def parse_centers_text(values: list[str]) -> list | None:
+    centers = []
+
+    for value in values:
+        value = (value or "").strip()
+
+        # Empty field → auto-select
+        if not value:
+            return None
+
+        # Expect format: x,y or x,y,z or one value per field
+        parts = [p.strip() for p in value.split(",")]
+
+        try:
+            nums = [float(p) for p in parts]
+        except ValueError:
+            return None
+
+        # more than 3 fields, the center is a list of values
+        if len(nums) > 3:
+            centers.append(nums)
+            continue
+
+        centers.append(dict(zip(("x", "y", "z"), nums)))
+
+    return centers if centers else None
+
+
+# fn to validate the options and build the payload (the same json the exe reads from stdin)
+def build_payload(
+    dataset_path: str,
+    num_clusters: int,
+    fields: list[str] | None = None,
+    centers: list | None = None,
+    engine: str = "numpy",
+    init: str = "random",
+    seed: int | None = None,
+    mode: str = "full",
+    n_init: int = 1,
+    k_range: list[int] | None = None,
+    warm_start: bool = False,
+    assignment: str = "lloyd",
+    output: str = "binary",
+    scaling: str = "none",
+    silhouette_sample: int = SILHOUETTE_SAMPLE_ROWS,
+    silhouette_confidence: float = SILHOUETTE_CONFIDENCE,
+) -> dict:
+    # validation
+    if not dataset_path:
+        raise ValueError("dataset_path is required")
+
+    if not isinstance(num_clusters, int) or num_clusters <= 0:
+        raise ValueError("numClusters must be a positive integer")
+
+    if fields:
+        if not isinstance(fields, list):
+            raise ValueError("fields must be a list")
+        # the bundled release build still reads exactly 3 fields, the numpy engines take any number
+        if engine == "exe" and len(fields) > 3:
+            raise ValueError("Maximum of 3 fields allowed for the exe engine")
+
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+
+    if init not in INIT_MODES:
+        raise ValueError(f"Unknown seeding mode: {init}")
+
+    if init not in EXE_INIT_MODES and engine == "exe" and not centers:
+        raise ValueError(f"{init} seeding needs the numpy or worker engine")
+
+    if mode == "minibatch" and engine == "exe":
+        raise ValueError("Mini-batch mode needs the numpy or worker engine")
+
+    if n_init > 1 and engine == "exe":
+        raise ValueError("Restarts need the numpy or worker engine")
+
+    if k_range and engine == "exe":
+        raise ValueError("k sweep needs the numpy or worker engine")
+
+    if assignment not in ASSIGNMENT_MODES:
+        raise ValueError(f"Unknown assignment mode: {assignment}")
+
+    if scaling not in SCALING_MODES:
+        raise ValueError(f"Unknown scaling mode: {scaling}")
+
+    if scaling != "none" and engine == "exe":
+        raise ValueError("Feature scaling needs the numpy or worker engine")
+
+    if not isinstance(silhouette_sample, int) or silhouette_sample < 0:
+        raise ValueError("silhouette_sample must be a non-negative integer")
+
+    if not 0.0 < silhouette_confidence < 1.0:
+        raise ValueError("silhouette_confidence must be between 0 and 1")
+
+    if centers:
+        if not isinstance(centers, list):
+            raise ValueError("centers must be a list")
+        for c in centers:
+            if not isinstance(c, (dict, list)):
+                raise ValueError("Each center must be a dict or a list")
+
+    # build JSON for gorkov c++ algo
+    payload = {
+        "dataset": dataset_path,
+        "numClusters": num_clusters,
+    }
+
+    if fields:
+        payload["fields"] = fields
+
+    # if centers is None or empty auto-select in C++
+    if centers:
+        payload["centers"] = centers
+    else:
+        payload["init"] = init
+
+    # a fixed seed makes the auto-select reproducible
+    if seed is not None:
+        payload["seed"] = seed
+
+    # independent restarts in parallel, the best one is kept
+    if n_init > 1 and not centers:
+        payload["nInit"] = n_init
+
+    # k sweep, every k in the range on the same loaded dataset, the result is the recommended k
+    if k_range:
+        payload["kRange"] = k_range
+        payload["warmStart"] = warm_start
+
+    # "minibatch" streams the dataset in batches for the numpy engines
+    payload["mode"] = mode
+
+    # bounded (Hamerly) assignment step, the same labels as lloyd with fewer distance evaluations
+    payload["assignment"] = assignment
+
+    # per-field scaling of the distance (K_means_scaling.py), the centers stay in the dataset units
+    if scaling != "none":
+        payload["scaling"] = scaling
+
+    # sampled silhouette of the numpy engines (K_means_metrics.py), the exe only gives the CH index
+    if silhouette_sample != SILHOUETTE_SAMPLE_ROWS:
+        payload["silhouetteSample"] = silhouette_sample
+    if silhouette_confidence != SILHOUETTE_CONFIDENCE:
+        payload["silhouetteConfidence"] = silhouette_confidence
+
+    # the json output is only for debugging, the binary one does not grow with the text of the dataset
+    payload["output"] = output
+
+    return payload
+
+
+# fn to read the progress lines of the exe from stderr, the other lines are kept for the error message
+def read_exe_stderr(stream, events: queue.Queue, errors: list):
+    for line in stream:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+        if isinstance(event, dict) and "event" in event:
+            events.put(event)
+        else:
+            errors.append(line.decode("utf-8", errors="replace"))
+
+
+# fn to add an iteration event of the exe to the trace, the exe has no trace of its own
+def trace_exe_event(event: dict):
+    if event.get("event") == "iteration":
+        count("iterations")
+        record_iteration(event["iteration"], event["eps"])
+
+
+# fn to run the exe and pass its progress events on, the exe is killed when progress raises (cancel, timeout)
+def communicate_with_progress(process: subprocess.Popen, input_bytes: bytes, progress) -> tuple[bytes, str]:
+    stdout = []
+    events = queue.Queue()
+    errors = []
+    readers = [
+        threading.Thread(target=lambda: stdout.append(process.stdout.read()), daemon=True),
+        threading.Thread(target=read_exe_stderr, args=(process.stderr, events, errors), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    try:
+        process.stdin.write(input_bytes)
+        process.stdin.close()
+        while process.poll() is None or not events.empty():
+            try:
+                event = events.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                progress(None)
+                continue
+            trace_exe_event(event)
+            progress(event)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+
+    for reader in readers:
+        reader.join()
+    while not events.empty():
+        event = events.get()
+        trace_exe_event(event)
+        progress(event)
+
+    return stdout[0] if stdout else b"", "".join(errors)
+
+
+# fn to run the exe, returns the binary result arrays or the parsed json (debug output or older builds)
+def run_exe(payload: dict, exe_path: str = DEFAULT_EXE_PATH, progress=None) -> dict:
+    process = subprocess.Popen(
+        exe_path,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    if progress is None:
+        stdout, stderr = process.communicate(json.dumps(payload).encode("utf-8"))
+        stderr = stderr.decode("utf-8", errors="replace")
+    else:
+        stdout, stderr = communicate_with_progress(process, json.dumps(dict(payload, progress=True)).encode("utf-8"), progress)
+
+    if process.returncode != 0:
+        raise RuntimeError(f"K-means executable failed (code {process.returncode}):\n{stderr}")
+
+    if is_binary_result(stdout):
+        return unpack_result(stdout)
+
+    # handle UTF-8 BOM
+    text = stdout.decode("utf-8").lstrip("\ufeff")
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"Failed to parse EXE output as JSON:\n{text}") from e
+
+
+# fn to run the clustering on the engine
+def run_on_engine(payload: dict, engine: str, exe_path: str, guard, data=None) -> dict:
+    if engine == "worker":
+        return get_worker().run(payload, guard)
+
+    if engine == "exe":
+        # the progress lines of the exe are read for the trace even without a progress callback
+        result = run_exe(dict(payload, output="binary"), exe_path, guard or (lambda event: None))
+        if "labels" not in result:
+            # older builds (release_build_v1.0.exe) ignore the binary output and print the json with the points
+            if data is None:
+                data = load_dataset(payload["dataset"], payload["fields"])
+            with span("result_parsing"):
+                result = result_from_dict(data, result)
+        return result
+
+    if payload.get("mode") == "minibatch":
+        return run_minibatch(payload, guard)
+    if data is None:
+        data = load_dataset(payload["dataset"], payload["fields"])
+    return run_kmeans_on_data(data, payload, guard)
+
+
+# fn to keep a result to start a later run from, see apply_warm_start
+def previous_run(payload: dict, result: dict) -> dict:
+    return {
+        "dataset": payload["dataset"],
+        "identity": dataset_identity(payload["dataset"]),
+        "fields": payload["fields"],
+        "centers": result["centers"],
+        "labels": result.get("labels"),
+    }
+
+
+# fn to start the run from a previous result (previous_run), the centers of the previous result are split
+# or merged to numClusters and given to the engine as the payload centers
+#   returns the payload and the warm start stats, given centers, k sweeps and the mini-batch mode start as usual,
+#   and so does a run with a chosen seeding, seed or restarts, or on another dataset (or another version of it)
+def apply_warm_start(payload: dict, previous: dict | None, data=None) -> tuple[dict, dict | None]:
+    if not previous or payload.get("centers") or payload.get("kRange") or payload.get("mode") == "minibatch":
+        return payload, None
+
+    if payload.get("init", "random") != "random" or payload.get("seed") is not None or payload.get("nInit", 1) > 1:
+        return payload, None
+
+    # the same file, or the same rows with appended ones
+    if previous.get("identity") is None or not has_rows_of(payload["dataset"], previous["identity"]):
+        return payload, None
+
+    labels = previous.get("labels")
+    centers = previous.get("centers")
+    if previous.get("fields") != payload["fields"]:
+        centers = None
+
+    with span("warm_start"):
+        if data is None:
+            data = load_dataset(payload["dataset"], payload["fields"])
+        seed = payload.get("seed")
+        weights = scaling_weights(get_scaling(payload))
+        centers, info = warm_start_centers(data, payload["numClusters"], centers, labels, np.random.default_rng(seed), weights)
+    if centers is None:
+        return payload, None
+
+    # x/y/z centers are read by every exe version
+    if centers.shape[1] <= len(CENTER_KEYS):
+        centers = [dict(zip(CENTER_KEYS, map(float, c))) for c in centers]
+    else:
+        centers = centers.tolist()
+
+    payload = {key: value for key, value in payload.items() if key not in ("init", "nInit")}
+    payload["centers"] = centers
+    return payload, info
+
+
+# fn to run the clustering, a run with a fixed seed or given centers is stored in the result cache and a
+# repeated run is read from it
+def run_cached(payload: dict, engine: str, exe_path: str, guard, use_cache: bool, data=None, previous: dict | None = None) -> dict:
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    if not payload.get("fields"):
+        raise ValueError("fields are required")
+
+    payload, warm_start = apply_warm_start(payload, previous, data)
+
+    key = result_key(payload, engine, exe_path) if use_cache else None
+    result = get_result(key) if key is not None else None
+    if key is not None:
+        count("result_cache_hits" if result is not None else "result_cache_misses")
+
+    if result is None:
+        with span("engine"):
+            result = run_on_engine(payload, engine, exe_path, guard, data)
+        if key is not None:
+            put_result(key, result)
+
+    if warm_start is not None:
+        result["stats"] = dict(result.get("stats", {}), warm_start=warm_start)
+    return result
+
+
+# fn to finish the trace of a run, it is returned with the result and appended to trace_path as one json line
+def finish_trace(trace, payload: dict, engine: str, trace_path: str | None) -> dict:
+    record = trace.to_dict()
+    if trace_path:
+        export_jsonl(trace_path, {
+            "time": time.time(),
+            "dataset": payload["dataset"],
+            "fields": payload.get("fields"),
+            "numClusters": payload["numClusters"],
+            "engine": engine,
+            "trace": record,
+        })
+    return record
+
+
+# fn to run the clustering and get the result arrays (CH_index, centers, labels, stats, trace) without the points
+#   progress gets the events of the run (see K_means_progress.py), cancel (threading.Event) and timeout (seconds)
+#   stop the run with K_means_progress.Cancelled, the trace is described in K_means_trace.py
+#   previous is the result of an earlier run to start from (see apply_warm_start)
+def run_kmeans_arrays(payload: dict, engine: str = "numpy", exe_path: str = DEFAULT_EXE_PATH, progress=None, cancel=None, timeout: float | None = None, use_cache: bool = True, trace_path: str | None = TRACE_PATH, previous: dict | None = None) -> dict:
+    with tracing() as trace:
+        if payload.get("fields"):
+            check_fields(payload["dataset"], payload["fields"])
+        result = run_cached(payload, engine, exe_path, progress_guard(progress, cancel, timeout), use_cache, previous=previous)
+
+    result["trace"] = finish_trace(trace, payload, engine, trace_path)
+    return result
+
+
+# fn to run the clustering and get the same CH_index/centers/C{i} dict as the exe json output, with stats and trace,
+# the binary results also have the labels (for the next warm start), the mini-batch mode never loads the whole
+# dataset so its result has no C{i} point lists (only the arrays, like run_kmeans_arrays)
+def run_kmeans(payload: dict, engine: str = "numpy", exe_path: str = DEFAULT_EXE_PATH, progress=None, cancel=None, timeout: float | None = None, use_cache: bool = True, trace_path: str | None = TRACE_PATH, previous: dict | None = None) -> dict:
+    guard = progress_guard(progress, cancel, timeout)
+
+    with tracing() as trace:
+        # text columns are rejected before any engine work (see K_means_dataset.get_column_index)
+        if payload.get("fields"):
+            check_fields(payload["dataset"], payload["fields"])
+
+        # the debug json output of the exe has the clusters already, it is not cached
+        if engine == "exe" and payload.get("output") == "json":
+            with span("engine"):
+                result = run_exe(payload, exe_path, guard)
+        elif payload.get("mode") == "minibatch":
+            result = run_cached(payload, engine, exe_path, guard, use_cache, previous=previous)
+        else:
+            # binary result, join the labels with the dataset rows
+            data = load_dataset(payload["dataset"], payload["fields"])
+            arrays = run_cached(payload, engine, exe_path, guard, use_cache, data, previous)
+            with span("result_parsing"):
+                result = result_to_dict(data, arrays)
+            result["labels"] = arrays["labels"]
+
+    result["trace"] = finish_trace(trace, payload, engine, trace_path)
+    return result
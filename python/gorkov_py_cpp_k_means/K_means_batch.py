@@ -0,0 +1,222 @@
+# headless batch runner, clusters every job of a manifest without the ui
+#
+# usage:
+#   python K_means_batch.py manifest.json --out results --processes 4
+#
+# the manifest is a list of jobs (or {"jobs": [...]}), every job is the same json the engines read:
+#   {"name": "iris_k3", "dataset": "iris.csv", "fields": ["a", "b", "c"], "numClusters": 3,
+#    "centers": [...], "init": "kmeans++", "seed": 1, "engine": "numpy", "timeout": 600}
+#
+# every job writes <name>.kmb (binary result, see K_means_transport.py) and <name>.json (CH index,
+# centers and stats), or only <name>.json with the clusters too when --format json is used (not for the
+# mini-batch mode, it never loads the whole dataset),
+# summary.json lists the status of every job, the trace of every run (K_means_trace.py) is in <name>.json
+# and with --trace FILE it is appended to FILE as one json line per job
+#
+# --export csv writes <name>.labels.csv (the dataset rows with a cluster column) and --export binary writes
+# <name>.kmx (columnar labels and fields, see K_means_export.py), both can be given, --save-model writes
+# <name>.model.json for scoring new rows later (K_means_model.py)
+# imports
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from K_means_api import DEFAULT_EXE_PATH, build_payload, run_kmeans_arrays
+from K_means_dataset import load_dataset
+from K_means_export import EXPORT_FORMATS, export_result
+from K_means_model import model_from_result, save_model
+from K_means_parallel import mp_context, mark_pool_process
+from K_means_trace import setup_logging, trace_summary
+from K_means_transport import pack_result, result_to_dict
+
+log = logging.getLogger("k_means.batch")
+
+OUTPUT_FORMATS = ("binary", "json")
+
+# file name endings of the exports
+EXPORT_SUFFIXES = {"csv": ".labels.csv", "binary": ".kmx"}
+
+# payload keys of a job that are passed to build_payload
+JOB_OPTIONS = {
+    "init": "init",
+    "seed": "seed",
+    "mode": "mode",
+    "nInit": "n_init",
+    "kRange": "k_range",
+    "warmStart": "warm_start",
+    "assignment": "assignment",
+    "scaling": "scaling",
+    "silhouetteSample": "silhouette_sample",
+    "silhouetteConfidence": "silhouette_confidence",
+}
+
+
+# fn to convert the numpy values in the stats for json
+def json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# fn to write a json file
+def write_json(path: str, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=json_default)
+
+
+# fn to read the jobs from the manifest, relative dataset paths are relative to the manifest
+def read_manifest(manifest_path: str) -> list[dict]:
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    jobs = manifest["jobs"] if isinstance(manifest, dict) else manifest
+    if not isinstance(jobs, list):
+        raise ValueError("The manifest must be a list of jobs or {\"jobs\": [...]}")
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    for i, job in enumerate(jobs):
+        if "dataset" not in job or "numClusters" not in job:
+            raise ValueError(f"Job {i} needs dataset and numClusters")
+        job["dataset"] = os.path.join(base_dir, job["dataset"])
+        job.setdefault("name", f"job_{i}")
+
+    names = [job["name"] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("Job names must be unique")
+
+    return jobs
+
+
+# fn to run one job and write its files, runs inside a pool process
+def run_job(job: dict, out_dir: str, output_format: str, exe_path: str, timeout: float | None = None, use_cache: bool = True, trace_path: str | None = None, export_formats: list[str] | None = None, save_models: bool = False) -> dict:
+    start = time.perf_counter()
+    engine = job.get("engine", "numpy")
+    options = {arg: job[key] for key, arg in JOB_OPTIONS.items() if key in job}
+
+    payload = build_payload(
+        job["dataset"],
+        job["numClusters"],
+        job.get("fields"),
+        job.get("centers"),
+        engine=engine,
+        **options,
+    )
+    # a job over its timeout (seconds) is stopped and reported as failed
+    result = run_kmeans_arrays(payload, engine, exe_path, timeout=job.get("timeout", timeout), use_cache=use_cache, trace_path=trace_path)
+    log.debug("%s : %s", job["name"], trace_summary(result["trace"]))
+
+    base = os.path.join(out_dir, job["name"])
+    files = [base + ".json"]
+    if output_format == "json" and payload["mode"] == "minibatch":
+        # the mini-batch mode never loads the whole dataset, its json has no point lists
+        write_json(base + ".json", {
+            "CH_index": result["CH_index"],
+            "centers": np.asarray(result["centers"]).tolist(),
+            "stats": result.get("stats", {}),
+            "trace": result["trace"],
+        })
+    elif output_format == "json":
+        write_json(base + ".json", dict(result_to_dict(load_dataset(payload["dataset"], payload["fields"]), result), trace=result["trace"]))
+    else:
+        with open(base + ".kmb", "wb") as f:
+            f.write(pack_result(result["CH_index"], result["centers"], result["labels"]))
+        write_json(base + ".json", {
+            "CH_index": result["CH_index"],
+            "centers": np.asarray(result["centers"]).tolist(),
+            "fields": payload["fields"],
+            "stats": result.get("stats", {}),
+            "trace": result["trace"],
+        })
+        files.insert(0, base + ".kmb")
+
+    # the labels joined back to the dataset rows, streamed in blocks
+    for export_format in export_formats or []:
+        export_result(payload["dataset"], payload["fields"], result, base + EXPORT_SUFFIXES[export_format], export_format)
+        files.append(base + EXPORT_SUFFIXES[export_format])
+
+    if save_models:
+        save_model(base + ".model.json", model_from_result(payload, result))
+        files.append(base + ".model.json")
+
+    return {
+        "name": job["name"],
+        "status": "ok",
+        "CH_index": result["CH_index"],
+        "cached": result.get("stats", {}).get("cached", False),
+        "seconds": time.perf_counter() - start,
+        "files": files,
+    }
+
+
+# fn run at the start of every pool process, the spawned processes set up their own logging
+def init_batch_process():
+    mark_pool_process()
+    setup_logging()
+
+
+# fn to run all jobs on a process pool, the results are in the order of the jobs
+def run_batch(jobs: list[dict], out_dir: str, processes: int | None = None, output_format: str = "binary", exe_path: str = DEFAULT_EXE_PATH, timeout: float | None = None, use_cache: bool = True, trace_path: str | None = None, export_formats: list[str] | None = None, save_models: bool = False) -> list[dict]:
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    for export_format in export_formats or []:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {export_format}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    processes = min(processes or os.cpu_count() or 1, len(jobs)) or 1
+    summary = [None] * len(jobs)
+
+    # the jobs themselves are parallel, restarts and k sweeps inside a job run one after another
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=mp_context,
+        initializer=init_batch_process,
+    ) as pool:
+        futures = {
+            pool.submit(run_job, job, out_dir, output_format, exe_path, timeout, use_cache, trace_path, export_formats, save_models): i
+            for i, job in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                summary[i] = future.result()
+            except Exception as e:
+                summary[i] = {"name": jobs[i]["name"], "status": "error", "error": f"{type(e).__name__}: {e}"}
+            print(f"[{summary[i]['status']}] {summary[i]['name']}", file=sys.stderr)
+
+    write_json(os.path.join(out_dir, "summary.json"), summary)
+    return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run k-means jobs from a manifest without the ui")
+    parser.add_argument("manifest", help="json file with the list of jobs")
+    parser.add_argument("--out", default="k_means_results", help="directory for the result files")
+    parser.add_argument("--processes", type=int, default=None, help="number of parallel jobs (default: number of cpus)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="binary", help="binary .kmb results or the full json with the clusters")
+    parser.add_argument("--exe", default=DEFAULT_EXE_PATH, help="path of the c++ build for jobs with \"engine\": \"exe\"")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per job, a job can set its own \"timeout\"")
+    parser.add_argument("--no-cache", action="store_true", help="always run the engine, do not read or store cached results")
+    parser.add_argument("--trace", default=None, help="json lines file, the trace of every job is appended to it")
+    parser.add_argument("--export", choices=EXPORT_FORMATS, action="append", default=None, help="also write the dataset rows with their cluster (csv) or the columnar labels (binary), can be repeated")
+    parser.add_argument("--save-model", action="store_true", help="also write <name>.model.json with the centers, fields and scaling of every job")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    trace_path = os.path.abspath(args.trace) if args.trace else None
+    summary = run_batch(read_manifest(args.manifest), args.out, args.processes, args.format, args.exe, args.timeout, not args.no_cache, trace_path, args.export, args.save_model)
+    failed = sum(1 for s in summary if s["status"] != "ok")
+    print(f"{len(summary) - failed} ok, {failed} failed, results in {args.out}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,29 +11,58 @@ from flet import (
     icons, Radio, RadioGroup, FilePicker, Checkbox, WebView
 )
 import threading
+import time
 import subprocess
 import json
 import csv
 import ast
 import os
 import sys
+import pathlib
+import webbrowser
+import logging
 #import tempfile
 #import asyncio # for flet async
 
-# for new graphing fn
-import plotly.graph_objects as go
+# clustering api (numpy, worker and exe engines), shared with the batch cli
+from K_means_api import ENGINES, build_payload, run_kmeans, run_kmeans_arrays, parse_centers_text, previous_run, INIT_MODES, EXE_INIT_MODES
 
+# progress events and cancellation of a run
+from K_means_progress import Cancelled
 
-# for the graph for old graphing fn
-import matplotlib
-#matplotlib.use("Agg") # if active is stops the interactive graph from showing but fixes the tkinter problems
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
-from mpl_toolkits.mplot3d import Axes3D
+# logging (level from K_MEANS_LOG_LEVEL) and the trace summary of a run
+from K_means_trace import setup_logging, trace_summary
+
+# column index of the dataset (type, NaN count, min/max of every column), sniffed from sample rows
+from K_means_dataset import get_column_index, load_dataset
+
+# cluster summaries and the paged point table of the result
+from K_means_results import ResultView, StreamedResultView, result_view_from_clusters, PAGE_ROWS
+
+# export of the labels joined back to the dataset rows (csv or columnar binary)
+from K_means_export import export_result
+
+# saved model of the result (centers, fields, scaling) for scoring new rows with K_means_model.py
+from K_means_model import model_from_result, save_model
+
+# per-field scaling modes
+from K_means_scaling import SCALING_MODES
+
+# for new graphing fn, plotly is imported by the graph fns on the first graph (slowest import of the app)
+import numpy as np
+
+# projection of any number of fields to the 3 axes of the graph
+from K_means_plot import project_3d, render_graph_html, GRAPH_POINT_BUDGET
+
+
+# the old graphing fn imports matplotlib itself, it is not loaded at startup
 
 # TODO : fix the 3d visualisation
 
 
+# logger of the app, set up in __main__
+log = logging.getLogger("k_means")
+
 # global vars
 global_calc_out = None # the result of the calculation for k-maens
 global_calculation_complete = False
@@ -43,11 +72,25 @@ global_fig_obj = None
 # global calc vars
 global_ch_index_res = ""
 global_centers_res = ""
-global_cluster_list_res = []
+global_sweep_res = None # CH index per k when the run was a k sweep
+global_metrics_res = None # inertia, Davies-Bouldin and sampled silhouette of the numpy engines
+global_result_view = None # points, labels and cluster summaries of the result, the point table is paged from it
+global_table_page = 0 # page of the point table
+
+# run vars
+global_cancel_event = None # set by the cancel button, the running calculation stops on its next progress event
+global_progress_shown_at = 0.0 # time of the last progress update, the label is updated at most every PROGRESS_UPDATE_INTERVAL
+PROGRESS_UPDATE_INTERVAL = 0.1
+global_previous_run = None # dataset, fields, centers and labels of the last result, the next run can start from it (kept on Return)
 
 # path vars
 global_k_means_exe_path = "release_build_v1.0.exe"
 
+# engine vars ("exe" runs the c++ build, "numpy" runs in-process, "worker" runs numpy in a long-lived process)
+# the exe is the default whenever there is one, the numpy loop is still slower per iteration than the c++ loop
+global_k_means_engines = list(ENGINES)
+global_k_means_engine = "exe" if os.path.exists(global_k_means_exe_path) else "numpy"
+
 # functions outside the ui
 
 
@@ -68,19 +111,51 @@ def main(page: Page):
 
     # fn to convert data for graph
     def convert_data_for_graph():
-        print("Called fn to convert data for graph and call the graph")
-
-        # cluster
-        clusters = {
-            f"C{i}": cluster
-            for i, cluster in enumerate(global_cluster_list_res)
-        }
-
-        # centers
-        centroids = global_centers_res
+        log.debug("Called fn to convert data for graph and call the graph")
+
+        # the points and labels of the result as arrays, from the result view (a sample of the rows in the mini-batch mode)
+        fields = get_selected_fields()
+        points, labels = global_result_view.graph_points()
+
+        # project all points and centers to the 3 axes of the graph (chosen fields or PCA)
+        axes = [fields.index(dd.value) for dd in graph_axes_dropdowns if dd.value in fields]
+        points_3d, centers_3d, axis_titles = project_3d(
+            points,
+            np.array(global_centers_res, dtype=np.float64),
+            fields,
+            graph_view_dropdown.value,
+            axes if len(axes) == min(3, len(fields)) else None,
+        )
 
         #show_3d_graph_of_calculation_old(clusters,centroids,"X","Y","Z","Placeholder")
-        show_3d_graph_plotly_browser(clusters,centroids,"K-means graph 3D")
+        show_3d_graph_plotly_browser(points_3d, labels, centers_3d, "K-means graph 3D", axis_titles)
+        
+        if global_sweep_res:
+            show_k_sweep_graph_plotly_browser(global_sweep_res)
+    
+    # fn to draw the CH index and the inertia for every k of a sweep (webbrowser)
+    def show_k_sweep_graph_plotly_browser(sweep: dict):
+        log.debug("Running k sweep graphing fn...")
+        
+        import plotly.graph_objects as go
+        
+        ks = [c["k"] for c in sweep["curve"]]
+        
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=ks, y=[c["CH_index"] for c in sweep["curve"]], mode="lines+markers", name="CH index"))
+        fig.add_trace(go.Scatter(x=ks, y=[c["inertia"] for c in sweep["curve"]], mode="lines+markers", name="Inertia", yaxis="y2"))
+        fig.add_vline(x=sweep["recommended_k"], line_dash="dash", annotation_text="recommended k")
+        
+        fig.update_layout(
+            title="CH index vs k",
+            xaxis_title="k",
+            yaxis=dict(title="CH index"),
+            yaxis2=dict(title="Inertia", overlaying="y", side="right"),
+            margin=dict(l=0, r=0, b=0, t=40),
+        )
+        
+        fig.show()
+        del fig
 
     # new fn to put the graph in webvier(notusable)
     """def show_3d_graph_plotly_webview(cluster_results, centers=None, x_lable="x", y_label="y", z_label="z", title="graph title"):
@@ -152,85 +227,27 @@ def main(page: Page):
         page.update()
     """
     
-    # new fn to draw the graph using plotly (webbrowser)
-    def show_3d_graph_plotly_browser(cluster_results, centers=None, title="graph title"):
-        
-        # global var
-        global global_fig_obj
-        
-        print("Running new graphing fn...")
-        
-        fields_fn_res = get_selected_fields()
-        print("Selected fields :")
-        print(fields_fn_res)
+    # new fn to draw the graph using plotly (webbrowser), one colour-mapped trace, the html is cached per result
+    def show_3d_graph_plotly_browser(points, labels, centers, title="graph title", axis_titles=None):
+        log.debug("Running new graphing fn...")
         
-        fields = fields_fn_res
-        
-        fig = go.Figure()
-
-        #global_fig_obj = fig
-        
-        cluster_names = list(cluster_results.keys())
-        
-        for i, cluster_name in enumerate(cluster_names):
-            
-            points = cluster_results[cluster_name]
-            
-            if not points:
-                continue
-            
-            xs = [p[0] for p in points]
-            ys = [p[1] for p in points]
-            zs = [p[2] for p in points]
-            
-            # cluster points
-            fig.add_trace(
-                go.Scatter3d(
-                    x=xs,
-                    y=ys,
-                    z=zs,
-                    mode="markers",
-                    name=cluster_name,
-                    marker=dict(size=4, opacity=0.6),
-                )
-            )
-            
-            # centroid (if provided)
-            if centers and i < len(centers):
-                cx, cy, cz = centers[i]
-                fig.add_trace(
-                    go.Scatter3d(
-                        x=[cx],
-                        y=[cy],
-                        z=[cz],
-                        mode="markers",
-                        name=f"{cluster_name} center",
-                        marker=dict(
-                            size=2,
-                            symbol="x",
-                            color="black"
-                        ),
-                    )
-                )
+        # without full detail the graph is thinned to GRAPH_POINT_BUDGET points, dense regions first
+        budget = None if full_detail_graph.value else GRAPH_POINT_BUDGET
         
-        fig.update_layout(
-            title=title,
-            scene=dict(
-                xaxis_title=fields[0] if fields else "X",
-                yaxis_title=fields[1] if fields else "Y",
-                zaxis_title=fields[2] if fields else "Z",
-                ),
-                margin=dict(l=0, r=0, b=0, t=40),
-                legend_title="Clusters",
-            )
+        path = render_graph_html(points, labels, centers, axis_titles or ["X", "Y", "Z"], title, budget)
+        log.info("Graph : %s", path)
         
-        fig.show()
-        del fig
-        #global_fig_obj.show()
+        webbrowser.open(pathlib.Path(path).as_uri())
     
     # fn to draw the graph
     def show_3d_graph_of_calculation_old(clusters, centroids, X_lable, Y_label, Z_label, graph_title):
-        print("Running graphing fn....")
+        log.debug("Running graphing fn....")
+
+        # for the graph for old graphing fn
+        import matplotlib
+        #matplotlib.use("Agg") # if active is stops the interactive graph from showing but fixes the tkinter problems
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.mplot3d import Axes3D
 
         # global vars
         global global_plt_obj
@@ -275,14 +292,17 @@ def main(page: Page):
         global_plt_obj.show()
 
     # parse the result from run_kmeans_exe and seperate it into variables
-    def split_ch_and_centers(raw: str):
+    def split_ch_and_centers(raw: str, dataset_path: str, mode: str = "full"):
         
         # global vars
         global global_ch_index_res
         global global_centers_res
-        global global_cluster_list_res
+        global global_sweep_res
+        global global_metrics_res
+        global global_result_view
+        global global_table_page
         
-        print("Running fn to split the result into 2 vars...")
+        log.debug("Running fn to split the result into 2 vars...")
         
         if isinstance(raw, dict):
             data = raw
@@ -291,20 +311,24 @@ def main(page: Page):
         
         global_ch_index_res = data["CH_index"]
         global_centers_res = data["centers"]
-        
-        # Collect C0, C1, C2, ...
-        i = 0
-        while True:
-            key = f"C{i}"
-            if key not in data:
-                break
-            global_cluster_list_res.append(data[key])
-            i += 1
-        
-        print("Values assigned printing...")
-        print(global_ch_index_res)
-        print(global_centers_res)
-        print(global_cluster_list_res)
+        global_sweep_res = data.get("stats", {}).get("sweep")
+        global_metrics_res = data.get("stats", {}).get("metrics")
+        
+        # the summaries are computed once here (calculation thread), the table fetches its pages from the view
+        if "labels" in data and mode == "minibatch":
+            # the dataset is never loaded in the mini-batch mode, the view streams the csv
+            global_result_view = StreamedResultView(dataset_path, get_selected_fields(), global_centers_res, data["labels"])
+        elif "labels" in data:
+            global_result_view = ResultView(load_dataset(dataset_path, get_selected_fields()), global_centers_res, data["labels"])
+        else:
+            # debug json output of the exe, collect C0, C1, C2, ...
+            clusters = []
+            while f"C{len(clusters)}" in data:
+                clusters.append(data[f"C{len(clusters)}"])
+            global_result_view = result_view_from_clusters(clusters, global_centers_res)
+        global_table_page = 0
+        
+        log.debug("Values assigned, CH index : %s, centers : %s, cluster sizes : %s", global_ch_index_res, global_centers_res, [c["size"] for c in global_result_view.summaries])
         set_results_values()
         hide_input_layout_show_result()
         if (auto_open_graph.value):
@@ -312,91 +336,181 @@ def main(page: Page):
     
     
     # full exe function to call the alogrithm
-    def run_kmeans_exe(exe_path: str, dataset_path: str, num_clusters: int, fields: list[str] | None = None, centers: list[dict] | None = None,) -> dict:
-        print("Running k-means exe fn with parametars...")
-        print(dataset_path)
-        print(num_clusters)
-        print(fields)
-        print("Centers for exe are :")
-        print(centers)
+    def run_kmeans_exe(exe_path: str, dataset_path: str, num_clusters: int, fields: list[str] | None = None, centers: list[dict] | None = None, engine: str = "exe", init: str = "random", seed: int | None = None, mode: str = "full", n_init: int = 1, k_range: list[int] | None = None, warm_start: bool = False, cancel: threading.Event | None = None, timeout: float | None = None, previous: dict | None = None, scaling: str = "none") -> dict:
+        log.info(
+            "Running k-means : dataset %s, k %s, fields %s, engine %s, mode %s, scaling %s, seeding %s, seed %s, restarts %s, k sweep %s, warm start %s, timeout %s",
+            dataset_path, num_clusters, fields, engine, mode, scaling, init, seed, n_init, k_range, warm_start, timeout,
+        )
+        log.debug("Centers : %s", centers)
         
         # global var
         global global_calc_out
         global global_calculation_complete
+        global global_previous_run
         
-        # validation
-        if not dataset_path:
-            raise ValueError("dataset_path is required")
-        
-        if not isinstance(num_clusters, int) or num_clusters <= 0:
-            raise ValueError("numClusters must be a positive integer")
-        
-        
-        if fields:
-            if not isinstance(fields, list):
-                raise ValueError("fields must be a list")
-            if len(fields) > 3:
-                raise ValueError("Maximum of 3 fields allowed")
-        
-        if centers:
-            if not isinstance(centers, list):
-                raise ValueError("centers must be a list")
-            for c in centers:
-                if not isinstance(c, dict):
-                    raise ValueError("Each center must be a dict")
-        
-        # build JSON for gorkov c++ algo
-        payload = {
-            "dataset": dataset_path,
-            "numClusters": num_clusters,
-        }
-        
-        if fields:
-            payload["fields"] = fields
-        
-        # if centers is None or empty auto-select in C++
-        if centers:
-            payload["centers"] = centers
-        
-        input_json = json.dumps(payload)
-        
-        # run exe
-        process = subprocess.Popen(
-            exe_path,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding="utf-8",
-        )
-        
-        stdout, stderr = process.communicate(input_json)
+        # the start button is disabled already, it is enabled again in the finally also when the options are invalid
+        try:
+            # validation and the payload are shared with the batch cli
+            payload = build_payload(
+                dataset_path,
+                num_clusters,
+                fields,
+                centers,
+                engine=engine,
+                init=init,
+                seed=seed,
+                mode=mode,
+                n_init=n_init,
+                k_range=k_range,
+                warm_start=warm_start,
+                # the exe has only the plain (lloyd) assignment step, the switch is for the numpy engines
+                assignment="hamerly" if accelerated_assignment.value else "lloyd",
+                output="json" if debug_json_output.value else "binary",
+                scaling=scaling,
+            )
+            
+            # the result arrays (centers and labels) are enough for the view, only the debug json of the exe has the points
+            run = run_kmeans if engine == "exe" and payload["output"] == "json" else run_kmeans_arrays
+            result = run(payload, engine, exe_path, progress=show_progress, cancel=cancel, timeout=timeout, previous=previous)
+        except Cancelled as e:
+            log.warning("From k-means %s engine > %s", engine, e)
+            progress_label.value = str(e)
+            return
+        except ValueError as e:
+            # invalid options (build_payload) or a dataset the engine can not use
+            log.warning("From k-means %s engine > %s", engine, e)
+            progress_label.value = str(e)
+            return
+        except RuntimeError as e:
+            log.error("From k-means %s engine > %s", engine, e)
+            progress_label.value = "Calculation failed"
+            raise
+        finally:
+            cancel_btn.visible = False
+            start_btn.disabled = False
+            page.update()
         
-        if process.returncode != 0:
-            raise RuntimeError(f"K-means executable failed (code {process.returncode}):\n{stderr}")
+        global_calc_out = result
+        log.info("From k-means %s engine > result calculated", engine)
+        
+        # the next run with other k, fields or appended rows starts from this result
+        global_previous_run = previous_run(payload, result)
+        if "warm_start" in result.get("stats", {}):
+            log.info("Warm start : %s", result["stats"]["warm_start"])
+        
+        # a repeated run with a fixed seed or given centers comes from the result cache
+        if result.get("stats", {}).get("cached"):
+            log.info("From k-means result cache")
+            progress_label.value = "Result from the cache"
+        log.info("Stats : %s", result.get("stats"))
+        if "trace" in result:
+            log.info("Trace : %s", trace_summary(result["trace"]))
+        global_calculation_complete = True
+        split_ch_and_centers(global_calc_out, dataset_path, mode)
+    
+    # fn to show the progress of the running calculation, called from the calculation thread
+    def show_progress(event: dict):
+        global global_progress_shown_at
         
-        # handle UTF-8 BOM
-        stdout = stdout.lstrip("\ufeff")
+        now = time.monotonic()
+        if now - global_progress_shown_at < PROGRESS_UPDATE_INTERVAL:
+            return
+        global_progress_shown_at = now
         
-        # parse output JSON
-        try:
-            #return json.loads(stdout)
-            result = json.loads(stdout)
-            global_calc_out = result
-            print("From k-means exe fn > result calculated")
-            global_calculation_complete = True
-            print(global_calc_out)
-            split_ch_and_centers(global_calc_out)
-        except json.JSONDecodeError as e:
-            print("From k-means exe fn > error")
-            raise RuntimeError(f"Failed to parse EXE output as JSON:\n{stdout}") from e
+        if event["event"] == "job":
+            progress_label.value = f"Jobs : {event['done']} / {event['total']}, {event['elapsed']:.1f} s"
+        else:
+            progress_label.value = f"Iteration : {event['iteration']}, eps : {event['eps']:.3g}, {event['elapsed']:.1f} s"
+        page.update()
     
     # fn to set the result values
     def set_results_values():
-        print("Fn called to set the result values!!")
+        log.debug("Fn called to set the result values!!")
         ch_index_label.value = "Index : " + reduce_string(str(global_ch_index_res),150)
-        centers_label.value = "Centers positions : " + reduce_string(str(global_centers_res),150)
-        clusters_label.value = "Clusters values : " + reduce_string(str(global_cluster_list_res),150)
+        centers_label.value = "Centers positions : " + reduce_string(str(np.asarray(global_centers_res).tolist()),150)
+        
+        # one row per cluster, the points are only shown in the paged table
+        fields = get_selected_fields()
+        clusters_table.rows = [
+            flet.DataRow(cells=[
+                flet.DataCell(Text(f"C{c}")),
+                flet.DataCell(Text(str(summary["size"]))),
+                flet.DataCell(Text(f"{summary['spread']:.4g}")),
+                flet.DataCell(Text(format_values(summary["center"]))),
+                flet.DataCell(Text(format_values(summary["min"]))),
+                flet.DataCell(Text(format_values(summary["max"]))),
+            ])
+            for c, summary in enumerate(global_result_view.summaries)
+        ]
+        
+        table_cluster_dropdown.options = [flet.dropdown.Option("All")] + [flet.dropdown.Option(f"C{c}") for c in range(len(global_result_view.summaries))]
+        table_cluster_dropdown.value = "All"
+        points_table.columns = [flet.DataColumn(Text(name)) for name in ["Row", "Cluster", *fields]]
+        show_table_page()
+        
+        # axes of the graph, the first 3 fields by default
+        for i, dd in enumerate(graph_axes_dropdowns):
+            dd.options = [flet.dropdown.Option(f) for f in fields]
+            dd.value = fields[i] if i < len(fields) else None
+        
+        # the exe only gives the CH index
+        if global_metrics_res:
+            metrics_label.value = f"Inertia : {global_metrics_res['inertia']:.6g}, Davies-Bouldin : {global_metrics_res['davies_bouldin']:.4g}"
+            if "silhouette" in global_metrics_res:
+                low, high = global_metrics_res["silhouette_ci"]
+                metrics_label.value += f", silhouette : {global_metrics_res['silhouette']:.3f} ({low:.3f} - {high:.3f}, {global_metrics_res['silhouette_sample']} rows)"
+        else:
+            metrics_label.value = ""
+        
+        if global_sweep_res:
+            sweep_label.value = f"Recommended k : {global_sweep_res['recommended_k']} (elbow : {global_sweep_res['elbow_k']})"
+        else:
+            sweep_label.value = ""
+        page.update()
+    
+    # fn to format a few numbers for a table cell
+    def format_values(values: list) -> str:
+        return reduce_string(", ".join(f"{v:.4g}" for v in values), 60)
+    
+    # fn to show the current page of the point table, only the rows of the page are fetched
+    def show_table_page():
+        cluster = None if table_cluster_dropdown.value in (None, "All") else int(table_cluster_dropdown.value[1:])
+        num_rows = global_result_view.num_rows(cluster)
+        num_pages = global_result_view.num_pages(cluster)
+        
+        rows, labels, values = global_result_view.page(global_table_page, cluster)
+        points_table.rows = [
+            flet.DataRow(cells=[
+                flet.DataCell(Text(str(row))),
+                flet.DataCell(Text(f"C{label}")),
+                *[flet.DataCell(Text(f"{v:.6g}")) for v in point],
+            ])
+            for row, label, point in zip(rows.tolist(), labels.tolist(), values.tolist())
+        ]
+        
+        first = global_table_page * PAGE_ROWS
+        table_page_label.value = f"Rows {first + 1 if num_rows else 0} - {first + len(rows)} of {num_rows} (page {global_table_page + 1} / {num_pages})"
+        table_prev_btn.disabled = global_table_page == 0
+        table_next_btn.disabled = global_table_page >= num_pages - 1
+    
+    # fn to move the point table by a number of pages
+    def table_page_fn(step: int):
+        global global_table_page
+        
+        if global_result_view is None:
+            return
+        global_table_page += step
+        show_table_page()
+        page.update()
+    
+    # fn to show the first page of the chosen cluster
+    def table_cluster_changed(e):
+        global global_table_page
+        
+        if global_result_view is None:
+            return
+        global_table_page = 0
+        show_table_page()
         page.update()
     
     # fn to recuce the text
@@ -409,10 +523,10 @@ def main(page: Page):
         
         return text[:keep + 1] + "..."
     
-    # get current selected fields
+    # get current selected fields, the field name is in the data of the checkbox
     def get_selected_fields() -> list[str]:
         return [
-            cb.label
+            cb.data
             for cb in fields_column.controls
             if cb.value
         ]
@@ -420,77 +534,126 @@ def main(page: Page):
     # fn for running the kmeans
     
     def run_k_means_start_thread():
-        print("Called function to run k-means algorithm...")
+        log.debug("Called function to run k-means algorithm...")
+        
+        # global var
+        global global_cancel_event
+        
         if (dataset_tb.value != "" and int(number_of_clusters_txtb.value) > 0 and get_selected_fields() != None):
-            k_means_thread = threading.Thread(target=run_kmeans_exe, args=(global_k_means_exe_path, dataset_tb.value, int(number_of_clusters_txtb.value), get_selected_fields(), get_centers_or_none()))
+            global_cancel_event = threading.Event()
+            start_btn.disabled = True
+            cancel_btn.visible = True
+            progress_label.value = "Starting..."
+            page.update()
+            
+            k_means_thread = threading.Thread(target=run_kmeans_exe, args=(global_k_means_exe_path, dataset_tb.value, int(number_of_clusters_txtb.value), get_selected_fields(), get_centers_or_none(), engine_dropdown.value, *get_seeding(), mode_dropdown.value, get_n_init() if not continue_last_result_cb.value else 1, get_k_range_or_none(), warm_start_cb.value, global_cancel_event, get_timeout_or_none(), global_previous_run if continue_last_result_cb.value else None, scaling_dropdown.value), daemon=True)
             k_means_thread.start()
-            print("Started k-means thread")
+            log.debug("Started k-means thread")
         else:
-            print("Insufficient data!!!")
+            log.warning("Insufficient data!!!")
 
     # get centers fn
     def get_centers_or_none():
         
-        centers = []
-        
         # Skip title + spacer (first 2 controls)
-        for tf in coordinates_column.controls[2:]:
-            
-            value = (tf.value or "").strip()
-            
-            # Empty field → auto-select
-            if not value:
-                return None
-            
-            # Expect format: x,y or x,y,z
-            parts = [p.strip() for p in value.split(",")]
-            
-            if len(parts) > 3 or len(parts) < 1:
-                return None
-            
-            try:
-                nums = [float(p) for p in parts]
-            except ValueError:
-                return None
-            
-            center = {}
-            
-            if len(nums) >= 1:
-                center["x"] = nums[0]
-            if len(nums) >= 2:
-                center["y"] = nums[1]
-            if len(nums) == 3:
-                center["z"] = nums[2]
-            
-            centers.append(center)
+        return parse_centers_text([tf.value for tf in coordinates_column.controls[2:]])
+
+    # get seed fn, empty or invalid seed → random seed
+    def get_seed_or_none():
+        value = (seed_tb.value or "").strip()
+        
+        if not value.isdigit():
+            return None
         
-        return centers if centers else None
+        return int(value)
+
+    # get init and seed fn, a run that continues the last result has no seeding of its own
+    def get_seeding():
+        if continue_last_result_cb.value:
+            return "random", None
+
+        return init_dropdown.value, get_seed_or_none()
+
+    # get k range fn, format: min-max, empty or invalid → no sweep
+    def get_k_range_or_none():
+        parts = [p.strip() for p in (k_range_tb.value or "").split("-")]
+        
+        if len(parts) != 2 or not all(p.isdigit() for p in parts):
+            return None
+        
+        k_min, k_max = int(parts[0]), int(parts[1])
+        if k_min < 1 or k_max < k_min:
+            return None
+        
+        return [k_min, k_max]
+
+    # get timeout fn, seconds, empty or invalid → no timeout
+    def get_timeout_or_none():
+        try:
+            timeout = float((timeout_tb.value or "").strip())
+        except ValueError:
+            return None
+        
+        return timeout if timeout > 0 else None
+
+    # get number of restarts fn, empty or invalid → 1
+    def get_n_init() -> int:
+        value = (n_init_tb.value or "").strip()
+        
+        if not value.isdigit() or int(value) < 1:
+            return 1
+        
+        return int(value)
 
     # csv file fn
 
-    def get_csv_fields(csv_path: str) -> list[str]:
-        with open(csv_path, newline="", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            headers = next(reader)
-        return headers
+    # fn to read the column index of the dataset, runs in a thread started by dataset_picked
+    def load_csv_fields(csv_path: str):
+        try:
+            column_index = get_column_index(csv_path)
+        except (OSError, ValueError, UnicodeDecodeError, StopIteration) as e:
+            log.error("Could not read the dataset %s : %s", csv_path, e)
+            if dataset_tb.value == csv_path:
+                fields_info_label.value = "Could not read the dataset"
+                page.update()
+            return
+        
+        # another dataset was picked while this one was read
+        if dataset_tb.value != csv_path:
+            return
+        build_fields_selector(column_index)
     
-    def build_fields_selector(headers: list[str]):
+    # fn to offer only the numeric columns, text columns would make every row NaN
+    def build_fields_selector(column_index: dict):
         fields_column.controls.clear()
         
-        for h in headers:
+        skipped = []
+        for c in column_index["columns"]:
+            if c["type"] != "numeric":
+                skipped.append(c["name"])
+                continue
+            label = f"{c['name']}  ({c['min']:g} .. {c['max']:g}"
+            if c["nan"]:
+                label += f", {c['nan']} empty in {column_index['sampled_rows']} sampled rows"
+            label += ")"
             fields_column.controls.append(
-                flet.Checkbox(label=h, value=False, on_change=fields_changed)
+                flet.Checkbox(label=label, data=c["name"], value=False, on_change=fields_changed)
             )
+        
+        fields_info_label.value = f"{column_index['rows']} rows"
+        if skipped:
+            fields_info_label.value += ", not numeric : " + reduce_string(", ".join(skipped), 150)
         page.update()
     
     def fields_changed(e):
         selected = [
-            cb.label
+            cb.data
             for cb in fields_column.controls
             if cb.value
         ]
         
-        if len(selected) > 3:
+        # the bundled exe build reads only 3 fields
+        if len(selected) > 3 and engine_dropdown.value == "exe":
             e.control.value = False
             page.update()
             return
@@ -505,14 +668,15 @@ def main(page: Page):
         path = e.files[0].path
         dataset_tb.value = path
         
-        headers = get_csv_fields(path)
-        build_fields_selector(headers)
-        
+        # the columns are sniffed in the background, big files are hashed and counted too
+        fields_column.controls.clear()
+        fields_info_label.value = "Reading the columns..."
         page.update()
+        threading.Thread(target=load_csv_fields, args=(path,), daemon=True).start()
 
     # open the file picker
     def open_dataset_picker():
-        print("Called file picker fn")
+        log.debug("Called file picker fn")
         file_picker.pick_files(
             allow_multiple=False,
             file_type=flet.FilePickerFileType.CUSTOM,
@@ -521,21 +685,23 @@ def main(page: Page):
     
     # fn for radio group
     def radio_group_change(e):
-        print("Radio group change triggered !!!")
-        print("Currently selected group value : " + radio_group.value)
+        log.debug("Radio group change triggered !!!")
+        log.debug("Currently selected group value : %s", radio_group.value)
         
         if (int(radio_group.value) == 1):
-            print("Selected : Self-select")
+            log.debug("Selected : Self-select")
             coordinates_layout.visible = True
+            seeding_layout.visible = False
         if (int(radio_group.value) == 2):
-            print("Selected : Auto-select")
+            log.debug("Selected : Auto-select")
             coordinates_layout.visible = False
+            seeding_layout.visible = True
         
         page.update()
     
     # fn to dynamicly generate the N number of textFields
     def generate_coordinate_fields(n: int):
-        print("Running textfiled generate function for " + str(n) + " number of textfields")
+        log.debug("Running textfiled generate function for %s number of textfields", n)
 
         # keep title + spacer
         coordinates_column.controls = coordinates_column.controls[:2]
@@ -550,11 +716,11 @@ def main(page: Page):
             )
         
         page.update()
-        print("ran the fn. Page update called !!")
+        log.debug("ran the fn. Page update called !!")
 
     # fn to run when number of clusters changes
     def on_num_clusters_change(e):
-        print("Running fn for when number of clusters changes...")
+        log.debug("Running fn for when number of clusters changes...")
         tb_value = e.control.value
 
         if not tb_value.isdigit():
@@ -564,52 +730,79 @@ def main(page: Page):
 
         generate_coordinate_fields(n)
 
+    # continuing the last result replaces the seeding, so the seeding fields are off while it is checked
+    def on_continue_last_result_change(e):
+        for control in (init_dropdown, seed_tb, n_init_tb):
+            control.disabled = e.control.value
+        page.update()
+
+    # the exe has no kmeans|| seeding, its dropdown offers only the exe seedings
+    def on_engine_change(e):
+        modes = EXE_INIT_MODES if e.control.value == "exe" else INIT_MODES
+        init_dropdown.options = [flet.dropdown.Option(i) for i in modes]
+        if init_dropdown.value not in modes:
+            init_dropdown.value = "kmeans++"
+        page.update()
+
     # open dataset button
     def open_button_fn(e):
-        print("Open button pressed !!!")
+        log.debug("Open button pressed !!!")
         open_dataset_picker()
 
     # start button function
     def start_btn_fn(e):
-        print("Start button pressed !!!")
+        log.debug("Start button pressed !!!")
         run_k_means_start_thread()
         #page.run_task(set_results_async)
         #hide_input_layout_show_result()
 
+    # cancel button function, the exe and the worker are killed, the numpy engine stops on its next iteration
+    def cancel_btn_fn(e):
+        log.debug("Cancel button pressed !!!")
+        if global_cancel_event is not None:
+            global_cancel_event.set()
+            progress_label.value = "Cancelling..."
+            page.update()
+
     def return_btn_fn(e):
-        print("Return btn fn called !!!")
+        log.debug("Return btn fn called !!!")
 
         # global var
         global global_calculation_complete
         global global_ch_index_res
         global global_centers_res
-        global global_cluster_list_res
+        global global_sweep_res
+        global global_metrics_res
+        global global_result_view
 
         global_calculation_complete = False
         global_ch_index_res = ""
         global_centers_res = ""
-        global_cluster_list_res = []
+        global_sweep_res = None
+        global_metrics_res = None
+        global_result_view = None
+        export_label.value = ""
         #global_plt_obj.close("all") # old close graph call from mathplotlib (hanging thread issue)
         
         hide_result_layout_show_input_section()
 
     # show result layout fn
     def hide_input_layout_show_result():
-        print("Called fn to hide input layout and show result")
+        log.debug("Called fn to hide input layout and show result")
         input_section_layout.visible = False
         result_layout.visible = True
         page.update()
     
     # hide result layout fn
     def hide_result_layout_show_input_section():
-        print("Called fn to hide result layout and show input section")
+        log.debug("Called fn to hide result layout and show input section")
         input_section_layout.visible = True
         result_layout.visible = False
         page.update()
     
     # change theme btn
     def change_theme_fn():
-        print("Change theme fn called !!")
+        log.debug("Change theme fn called !!")
         if (page.theme_mode == "light"):
             page.theme_mode = "dark"
         else:
@@ -617,17 +810,76 @@ def main(page: Page):
         page.update()
     
     def fn_for_change_theme_menu_btn(e):
-        print("Menu button pressed fn called !!!")
+        log.debug("Menu button pressed fn called !!!")
         change_theme_fn()
     
     # fn for showing graph btn
     def show_graph_btn_fn(e):
-        print("Pressed show graph button!!!")
+        log.debug("Pressed show graph button!!!")
         convert_data_for_graph()
     
+    # fn to open the save dialog for the export, .kmx is the columnar binary file and anything else is csv
+    def export_btn_fn(e):
+        log.debug("Pressed export button!!!")
+        
+        if global_previous_run is None or global_previous_run.get("labels") is None:
+            export_label.value = "This result has no labels to export (debug json output)"
+            page.update()
+            return
+        export_picker.save_file(
+            dialog_title="Export the result",
+            file_name="k_means_result.csv",
+            allowed_extensions=["csv", "kmx"],
+        )
+    
+    # fn to call when the export file has been picked, the rows are streamed from the dataset in the background
+    def export_picked(e: flet.FilePickerResultEvent):
+        if not e.path:
+            return
+        
+        export_format = "binary" if e.path.lower().endswith(".kmx") else "csv"
+        export_label.value = "Exporting..."
+        page.update()
+        threading.Thread(target=export_result_thread, args=(e.path, export_format), daemon=True).start()
+    
+    def export_result_thread(path: str, export_format: str):
+        run = global_previous_run
+        try:
+            rows = export_result(run["dataset"], run["fields"], run, path, export_format)
+            export_label.value = f"Exported {rows} rows to {path}"
+            log.info("Exported %s rows to %s", rows, path)
+        except (OSError, ValueError) as e:
+            log.error("Export failed > %s", e)
+            export_label.value = f"Export failed : {e}"
+        page.update()
+    
+    # fn to open the save dialog for the model of the result
+    def save_model_btn_fn(e):
+        log.debug("Pressed save model button!!!")
+        model_picker.save_file(
+            dialog_title="Save the model",
+            file_name="k_means_model.json",
+            allowed_extensions=["json"],
+        )
+    
+    # fn to write the model when the file has been picked
+    def model_picked(e: flet.FilePickerResultEvent):
+        if not e.path or global_previous_run is None:
+            return
+        
+        try:
+            model = model_from_result(global_previous_run, global_calc_out)
+            save_model(e.path, model)
+            export_label.value = f"Model saved to {e.path}"
+            log.info("Model saved to %s", e.path)
+        except (OSError, ValueError) as ex:
+            log.error("Saving the model failed > %s", ex)
+            export_label.value = f"Saving the model failed : {ex}"
+        page.update()
+    
     # fn to restart the app
     def restart_app():
-        print("Restart fn app called !!!")
+        log.debug("Restart fn app called !!!")
         python = sys.executable
         os.execl(python, python, *sys.argv)
     
@@ -636,6 +888,18 @@ def main(page: Page):
     auto_open_graph = Switch()
     auto_open_graph.value = True
 
+    # switch for the accelerated assignment step
+    accelerated_assignment = Switch()
+    accelerated_assignment.value = True
+
+    # switch for drawing every point in the graph, off → at most GRAPH_POINT_BUDGET points
+    full_detail_graph = Switch()
+    full_detail_graph.value = False
+
+    # switch for the debug json output of the exe
+    debug_json_output = Switch()
+    debug_json_output.value = False
+
     # app bar
     page.appbar = AppBar(
         #bgcolor="#1A1C1E",
@@ -654,6 +918,30 @@ def main(page: Page):
                             ]
                         ),
                     ),
+                    PopupMenuItem(
+                        content= Row(
+                            [
+                                Text("Full detail graph"),
+                                full_detail_graph,
+                            ]
+                        ),
+                    ),
+                    PopupMenuItem(
+                        content= Row(
+                            [
+                                Text("Accelerated assignment"),
+                                accelerated_assignment,
+                            ]
+                        ),
+                    ),
+                    PopupMenuItem(
+                        content= Row(
+                            [
+                                Text("Debug JSON output"),
+                                debug_json_output,
+                            ]
+                        ),
+                    ),
                     PopupMenuItem(text="Version : 1.0v"),
                 ]
             )
@@ -712,9 +1000,13 @@ def main(page: Page):
     # select fields 
     fields_column = Column(spacing=5)
     
+    # number of rows and the skipped text columns of the dataset
+    fields_info_label = Text("",font_family="Roboto",weight=flet.FontWeight.W_500,size=14,text_align=flet.TextAlign.LEFT)
+    
     fields_layout = Column(
         [
-            Text("Select fields (max 3)",font_family="Roboto",weight=flet.FontWeight.W_700,size=20,text_align=flet.TextAlign.LEFT),
+            Text("Select fields (max 3 for the exe engine)",font_family="Roboto",weight=flet.FontWeight.W_700,size=20,text_align=flet.TextAlign.LEFT),
+            fields_info_label,
             fields_column,
         ],
     )
@@ -731,10 +1023,88 @@ def main(page: Page):
         on_change=on_num_clusters_change,
     )
 
+    # k sweep
+    k_range_tb = TextField(
+        width=300,
+        multiline=False,
+        filled=True,
+        border_width=2,
+        border_radius=20,
+        hint_text="Sweep k range, e.g. 2-10 (optional)",
+    )
+
+    warm_start_cb = Checkbox(label="Warm start", value=False)
+
+    # the next run starts from the last result, its clusters are split or merged to the new k
+    continue_last_result_cb = Checkbox(label="Continue from the last result", value=False, on_change=on_continue_last_result_change)
+
     num_of_clusters_layout = Column(
         [
             Text("Number of clusters",font_family="Roboto",weight=flet.FontWeight.W_700,size=20,text_align=flet.TextAlign.LEFT),
             number_of_clusters_txtb,
+            Row(
+                [
+                    k_range_tb,
+                    warm_start_cb,
+                ],
+            ),
+            continue_last_result_cb,
+        ],
+    )
+
+    # engine layout
+    engine_dropdown = Dropdown(
+        width=500,
+        filled=True,
+        border_width=2,
+        border_radius=20,
+        options=[flet.dropdown.Option(e) for e in global_k_means_engines],
+        value=global_k_means_engine,
+        on_change=on_engine_change,
+    )
+
+    # mode, "minibatch" is for datasets larger than memory
+    mode_dropdown = Dropdown(
+        width=300,
+        filled=True,
+        border_width=2,
+        border_radius=20,
+        options=[flet.dropdown.Option(m) for m in ["full", "minibatch"]],
+        value="full",
+    )
+
+    # per-field scaling, fields in very different units would decide the distance alone
+    scaling_dropdown = Dropdown(
+        width=300,
+        filled=True,
+        border_width=2,
+        border_radius=20,
+        label="Scaling",
+        options=[flet.dropdown.Option(m) for m in SCALING_MODES],
+        value="none",
+    )
+
+    # wall-clock limit of a run
+    timeout_tb = TextField(
+        width=300,
+        multiline=False,
+        filled=True,
+        border_width=2,
+        border_radius=20,
+        hint_text="Timeout in seconds (optional)",
+    )
+
+    engine_layout = Column(
+        [
+            Text("Engine",font_family="Roboto",weight=flet.FontWeight.W_700,size=20,text_align=flet.TextAlign.LEFT),
+            Row(
+                [
+                    engine_dropdown,
+                    mode_dropdown,
+                    scaling_dropdown,
+                    timeout_tb,
+                ],
+            ),
         ],
     )
 
@@ -759,6 +1129,47 @@ def main(page: Page):
         ],
     )
 
+    # seeding layout for auto-select
+    init_dropdown = Dropdown(
+        width=300,
+        filled=True,
+        border_width=2,
+        border_radius=20,
+        options=[flet.dropdown.Option(i) for i in (EXE_INIT_MODES if global_k_means_engine == "exe" else INIT_MODES)],
+        value="kmeans++",
+    )
+
+    seed_tb = TextField(
+        width=300,
+        multiline=False,
+        filled=True,
+        border_width=2,
+        border_radius=20,
+        hint_text="Seed (empty for random)",
+    )
+
+    n_init_tb = TextField(
+        width=300,
+        multiline=False,
+        filled=True,
+        border_width=2,
+        border_radius=20,
+        hint_text="Restarts (default 1)",
+    )
+
+    seeding_layout = Column(
+        [
+            Text("Seeding",font_family="Roboto",weight=flet.FontWeight.W_700,size=20,text_align=flet.TextAlign.LEFT),
+            Row(
+                [
+                    init_dropdown,
+                    seed_tb,
+                    n_init_tb,
+                ],
+            ),
+        ],
+    )
+
     # Coordinates input layout
 
     coordinates_column = Column(
@@ -793,11 +1204,55 @@ def main(page: Page):
         ),
         on_click=start_btn_fn
     )
+
+    # progress of the running calculation and the cancel button
+    progress_label = Text("",font_family="Roboto",weight=flet.FontWeight.W_500,size=16,text_align=flet.TextAlign.LEFT)
+
+    cancel_btn = ElevatedButton(
+        text="Cancel",
+        bgcolor="#d95763",
+        color="#14080E",
+        width=150,
+        height=40,
+        style=flet.ButtonStyle(
+            shape=flet.RoundedRectangleBorder(radius=20),
+        ),
+        on_click=cancel_btn_fn
+    )
+    cancel_btn.visible = False
+
+    progress_layout = Row(
+        [
+            cancel_btn,
+            progress_label,
+        ],
+    )
     
     # resulte layout
     ch_index_label = Text("...",font_family="Roboto",weight=flet.FontWeight.W_600,size=25,text_align=flet.TextAlign.LEFT)
     centers_label = Text("...",font_family="Roboto",weight=flet.FontWeight.W_500,size=20,text_align=flet.TextAlign.LEFT)
-    clusters_label = Text("...",font_family="Roboto",weight=flet.FontWeight.W_500,size=20,text_align=flet.TextAlign.LEFT)
+    clusters_table = flet.DataTable(
+        columns=[flet.DataColumn(Text(name)) for name in ["Cluster", "Size", "Spread", "Center", "Min", "Max"]],
+    )
+
+    # paged point table, PAGE_ROWS rows of all points or of one cluster
+    points_table = flet.DataTable(
+        columns=[flet.DataColumn(Text("Row"))],
+    )
+    table_cluster_dropdown = Dropdown(
+        width=200,
+        filled=True,
+        border_width=2,
+        border_radius=20,
+        options=[flet.dropdown.Option("All")],
+        value="All",
+        on_change=table_cluster_changed,
+    )
+    table_prev_btn = OutlinedButton(text="Previous", on_click=lambda e: table_page_fn(-1))
+    table_next_btn = OutlinedButton(text="Next", on_click=lambda e: table_page_fn(1))
+    table_page_label = Text("",font_family="Roboto",weight=flet.FontWeight.W_500,size=16,text_align=flet.TextAlign.LEFT)
+    metrics_label = Text("",font_family="Roboto",weight=flet.FontWeight.W_500,size=20,text_align=flet.TextAlign.LEFT)
+    sweep_label = Text("",font_family="Roboto",weight=flet.FontWeight.W_500,size=20,text_align=flet.TextAlign.LEFT)
 
     return_btn = ElevatedButton(
         text="Return",
@@ -823,9 +1278,65 @@ def main(page: Page):
         on_click=show_graph_btn_fn
     )
 
+    export_btn = ElevatedButton(
+        text="Export",
+        bgcolor="#6CAE75",
+        color="#14080E",
+        width=900,
+        height=50,
+        style=flet.ButtonStyle(
+            shape=flet.RoundedRectangleBorder(radius=20),
+        ),
+        on_click=export_btn_fn
+    )
+    save_model_btn = ElevatedButton(
+        text="Save model",
+        bgcolor="#6CAE75",
+        color="#14080E",
+        width=900,
+        height=50,
+        style=flet.ButtonStyle(
+            shape=flet.RoundedRectangleBorder(radius=20),
+        ),
+        on_click=save_model_btn_fn
+    )
+    export_label = Text("",font_family="Roboto",weight=flet.FontWeight.W_500,size=16,text_align=flet.TextAlign.LEFT)
+
+    # graph view, 3 chosen fields or the first 3 principal components
+    graph_view_dropdown = Dropdown(
+        width=200,
+        filled=True,
+        border_width=2,
+        border_radius=20,
+        options=[flet.dropdown.Option(v) for v in ["fields", "pca"]],
+        value="fields",
+    )
+
+    graph_axes_dropdowns = [
+        Dropdown(
+            width=200,
+            filled=True,
+            border_width=2,
+            border_radius=20,
+            hint_text=axis,
+        )
+        for axis in ["X", "Y", "Z"]
+    ]
+
+    graph_view_layout = Row(
+        [
+            graph_view_dropdown,
+            *graph_axes_dropdowns,
+        ],
+    )
+
     result_btn_sub_layout = Column(
         [
+            graph_view_layout,
             show_graph_btn,
+            export_btn,
+            save_model_btn,
+            export_label,
             return_btn
         ],
         alignment=flet.alignment.center,
@@ -842,12 +1353,23 @@ def main(page: Page):
             Text("Result",font_family="Roboto",weight=flet.FontWeight.W_700,size=20,text_align=flet.TextAlign.LEFT),
             Container(height=10),
             ch_index_label,
+            metrics_label,
             Container(
                 bgcolor=flet.colors.GREY_400,
                 height=1,
             ),
             centers_label,
-            clusters_label,
+            Row([clusters_table], scroll=flet.ScrollMode.AUTO),
+            sweep_label,
+            Row(
+                [
+                    table_cluster_dropdown,
+                    table_prev_btn,
+                    table_next_btn,
+                    table_page_label,
+                ],
+            ),
+            Row([points_table], scroll=flet.ScrollMode.AUTO),
             Container(height=90),
             Row(
                 [
@@ -869,11 +1391,14 @@ def main(page: Page):
             fields_layout,
             Container(height=5),
             num_of_clusters_layout,
+            engine_layout,
             type_of_centroids_layout,
             Container(height=5),
+            seeding_layout,
             coordinates_layout,
             Container(height=10),
             start_btn,
+            progress_layout,
         ],
     )
 
@@ -895,16 +1420,27 @@ def main(page: Page):
 
     # file picker definition
     file_picker = flet.FilePicker(on_result=dataset_picked)
+    export_picker = flet.FilePicker(on_result=export_picked)
+    model_picker = flet.FilePicker(on_result=model_picked)
 
     # append to page
     page.overlay.append(bottom_sheet)
     page.overlay.append(file_picker)
+    page.overlay.append(export_picker)
+    page.overlay.append(model_picker)
 
     # render
     page.add(main_column)
 
+    # startup probe for the startup benchmark (python/benchmarks/bench_startup.py), marks the first frame
+    if os.environ.get("K_MEANS_STARTUP_PROBE"):
+        print("K_MEANS_FIRST_FRAME", flush=True)
 
-flet.app(
-    target=main,
-    #assets_dir="assets",
-)
+
+# guard needed by the worker process, it imports this file on windows
+if __name__ == "__main__":
+    setup_logging()
+    flet.app(
+        target=main,
+        #assets_dir="assets",
+    )
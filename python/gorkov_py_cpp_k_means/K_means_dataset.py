@@ -0,0 +1,563 @@
+# dataset loading with a memory-mapped column cache
+#
+# the first load of a column parses the csv and stores the column as a .npy file,
+# later loads of the same file map the stored columns and skip the parsing, when rows are appended to a
+# known file only the new rows are parsed and added to the stored columns of its earlier version
+#
+# cache layout:
+#   <cache dir>/index.json               file stat key -> content hash, LRU info for every entry
+#   <cache dir>/<hash>/meta.json         headers, number of rows, column types (sniffed from sample rows) and
+#                                        column statistics (K_means_scaling.py) of the csv
+#   <cache dir>/<hash>/<column>.npy      float64 column, non numeric cells are NaN
+# imports
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from K_means_scaling import ColumnStats, column_stats
+from K_means_trace import span, count
+
+# cache vars, the dir can be moved with the K_MEANS_CACHE_DIR environment variable
+CACHE_DIR = os.environ.get("K_MEANS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".k_means_cache", "datasets"))
+CACHE_BUDGET_BYTES = 1 << 30
+
+HASH_BLOCK_SIZE = 1 << 20
+
+# type sniffer vars, rows read from the start of the file and from evenly spaced blocks after it
+SNIFF_HEAD_ROWS = 1000
+SNIFF_BLOCKS = 16
+SNIFF_BLOCK_ROWS = 100
+
+# a column is numeric when at least this part of its non-empty sampled cells are numbers
+NUMERIC_MIN_FRACTION = 0.9
+
+# the ui runs the engine from threads, index updates go through this lock, the parsing of the columns of an
+# entry goes through the lock of the entry (entry_lock) so other datasets are not blocked by it
+cache_lock = threading.Lock()
+entry_locks: dict[str, threading.Lock] = {}
+
+
+# fn to convert a csv cell to float, non numeric cells become NaN (same as rapidcsv ConverterParams(true))
+def to_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+# fn to read only the header of the csv
+def read_csv_headers(dataset_path: str) -> list[str]:
+    with open(dataset_path, newline="", encoding="utf-8-sig") as f:
+        return next(csv.reader(f))
+
+
+# fn to get the index of every field in the headers
+def field_indexes(headers: list[str], fields: list[str]) -> list[int]:
+    indexes = []
+    for name in fields:
+        if name not in headers:
+            raise ValueError(f"Field '{name}' is not in the dataset")
+        indexes.append(headers.index(name))
+    return indexes
+
+
+# fn to convert the csv rows to one array per field
+def rows_to_columns(reader, indexes: list[int]) -> list[np.ndarray]:
+    rows = [
+        [to_float(row[i]) if i < len(row) else math.nan for i in indexes]
+        for row in reader
+    ]
+
+    data = np.array(rows, dtype=np.float64).reshape(-1, len(indexes))
+    return [np.ascontiguousarray(data[:, j]) for j in range(len(indexes))]
+
+
+# fn to parse the selected columns of the csv, one array per field
+def read_csv_columns(dataset_path: str, fields: list[str]) -> list[np.ndarray]:
+    with open(dataset_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        indexes = field_indexes(next(reader), fields)
+        return rows_to_columns(reader, indexes)
+
+
+# fn to parse the selected columns of the rows that start at offset (bytes), the rows appended to a known file
+def read_csv_tail_columns(dataset_path: str, fields: list[str], offset: int) -> list[np.ndarray]:
+    indexes = field_indexes(read_csv_headers(dataset_path), fields)
+    with open(dataset_path, "rb") as raw:
+        raw.seek(offset)
+        with io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+            return rows_to_columns(csv.reader(f), indexes)
+
+
+# fn to hash the content of the file, or only its first size bytes
+def hash_file(dataset_path: str, size: int | None = None) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(dataset_path, "rb") as f:
+        left = size
+        while block := f.read(HASH_BLOCK_SIZE if left is None else min(HASH_BLOCK_SIZE, left)):
+            h.update(block)
+            if left is not None:
+                left -= len(block)
+    return h.hexdigest()
+
+
+# fn to build the key from the path, size and modification time
+def stat_key(dataset_path: str) -> str:
+    st = os.stat(dataset_path)
+    return f"{os.path.abspath(dataset_path)}|{st.st_size}|{st.st_mtime_ns}"
+
+
+# index fns
+def index_path() -> str:
+    return os.path.join(CACHE_DIR, "index.json")
+
+
+def read_index() -> dict:
+    try:
+        with open(index_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}, "entries": {}}
+
+
+def write_index(index: dict):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = temp_path(index_path())
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp, index_path())
+
+
+# fn to get the temporary path a cache file is written to before it is published with os.replace, the batch
+# runner shares the cache between processes so every process and thread gets its own
+def temp_path(path: str) -> str:
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+# fn to write the meta.json of an entry
+def write_meta(meta_path: str, meta: dict):
+    tmp = temp_path(meta_path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+# fn to get the lock of a cache entry
+def entry_lock(content_hash: str) -> threading.Lock:
+    with cache_lock:
+        return entry_locks.setdefault(content_hash, threading.Lock())
+
+
+# fn to get the content hash of the dataset, the hash is stored in the index for the next calls
+def get_fingerprint(dataset_path: str) -> str:
+    key = stat_key(dataset_path)
+    with cache_lock:
+        content_hash = read_index()["files"].get(key)
+    if content_hash is not None:
+        return content_hash
+
+    # the file is hashed outside the lock
+    content_hash = hash_file(dataset_path)
+    with cache_lock:
+        index = read_index()
+        index["files"][key] = content_hash
+        write_index(index)
+    return content_hash
+
+
+# fn to get the identity of the dataset (path, content hash and size) for a warm start from its result
+def dataset_identity(dataset_path: str) -> dict:
+    return {
+        "path": os.path.abspath(dataset_path),
+        "hash": get_fingerprint(dataset_path),
+        "size": os.path.getsize(dataset_path),
+    }
+
+
+# fn to check if the file is the version of the identity or that version with rows appended to it
+def has_rows_of(dataset_path: str, identity: dict) -> bool:
+    if os.path.abspath(dataset_path) != identity["path"]:
+        return False
+
+    size = os.path.getsize(dataset_path)
+    if size == identity["size"]:
+        return get_fingerprint(dataset_path) == identity["hash"]
+    if size < identity["size"]:
+        return False
+
+    # the earlier file has to end with a full row
+    with open(dataset_path, "rb") as f:
+        f.seek(identity["size"] - 1)
+        if f.read(1) != b"\n":
+            return False
+    return hash_file(dataset_path, identity["size"]) == identity["hash"]
+
+
+# fn to hash the content of the file and count its rows (lines after the header) in the same pass
+def hash_and_count_rows(dataset_path: str) -> tuple[str, int]:
+    h = hashlib.blake2b(digest_size=16)
+    lines = 0
+    last = b""
+    with open(dataset_path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            h.update(block)
+            lines += block.count(b"\n")
+            last = block[-1:]
+
+    # the last row does not need a line end
+    if last and last != b"\n":
+        lines += 1
+    return h.hexdigest(), max(lines - 1, 0)
+
+
+# fn to read sample rows of the csv, the first rows and blocks of rows from evenly spaced offsets after them
+def sample_csv_rows(dataset_path: str) -> tuple[list[str], list[list[str]]]:
+    with open(dataset_path, "rb") as f:
+        header = f.readline().decode("utf-8-sig")
+        lines = [line for line in (f.readline() for _ in range(SNIFF_HEAD_ROWS)) if line]
+
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        for i in range(1, SNIFF_BLOCKS):
+            offset = start + (size - start) * i // SNIFF_BLOCKS
+            if offset <= f.tell():
+                continue
+            # the block starts at the next full row
+            f.seek(offset - 1)
+            f.readline()
+            lines.extend(line for line in (f.readline() for _ in range(SNIFF_BLOCK_ROWS)) if line)
+
+    headers = next(csv.reader([header]))
+    rows = list(csv.reader(line.decode("utf-8", errors="replace") for line in lines))
+    return headers, rows
+
+
+# fn to sniff the type of every column from the sample rows, min/max and the NaN cells are of the sample
+def sniff_columns(headers: list[str], rows: list[list[str]]) -> list[dict]:
+    columns = []
+    for i, name in enumerate(headers):
+        numbers = []
+        empty = 0
+        text = 0
+        for row in rows:
+            value = row[i].strip() if i < len(row) else ""
+            if not value:
+                empty += 1
+                continue
+            number = to_float(value)
+            if math.isnan(number):
+                text += 1
+            else:
+                numbers.append(number)
+
+        filled = len(numbers) + text
+        if filled == 0:
+            kind = "empty"
+        elif len(numbers) >= NUMERIC_MIN_FRACTION * filled:
+            kind = "numeric"
+        else:
+            kind = "text"
+
+        columns.append({
+            "name": name,
+            "type": kind,
+            "nan": empty + text,
+            "min": min(numbers) if numbers else None,
+            "max": max(numbers) if numbers else None,
+        })
+    return columns
+
+
+# fn to get the column index of the dataset (headers, rows, type, NaN count and min/max of every column),
+# the columns are sniffed once per file and the index is stored in meta.json
+def get_column_index(dataset_path: str) -> dict:
+    key = stat_key(dataset_path)
+    with cache_lock:
+        content_hash = read_index()["files"].get(key)
+        if content_hash is not None:
+            try:
+                with open(os.path.join(CACHE_DIR, content_hash, "meta.json"), encoding="utf-8") as f:
+                    meta = json.load(f)
+                if "sniff" in meta:
+                    return dict(meta["sniff"], headers=meta["headers"])
+            except (OSError, ValueError):
+                pass
+
+    # the file is read outside the lock, the hash of the same pass saves the hashing of the first load
+    with span("type_sniff"):
+        headers, rows = sample_csv_rows(dataset_path)
+        sniff = {"columns": sniff_columns(headers, rows), "sampled_rows": len(rows)}
+        content_hash, sniff["rows"] = hash_and_count_rows(dataset_path)
+
+    entry_dir = os.path.join(CACHE_DIR, content_hash)
+    meta_path = os.path.join(entry_dir, "meta.json")
+    with entry_lock(content_hash):
+        os.makedirs(entry_dir, exist_ok=True)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {"headers": headers}
+
+        meta["sniff"] = sniff
+        write_meta(meta_path, meta)
+
+    with cache_lock:
+        index = read_index()
+        index["files"][key] = content_hash
+        index["entries"][content_hash] = {
+            "last_used": time.time(),
+            "size": entry_size(entry_dir),
+        }
+        write_index(index)
+
+    return dict(sniff, headers=meta["headers"])
+
+
+# fn to check the fields against the column index before any engine work, text and empty columns would
+# turn every row into NaN and all rows would be dropped
+def check_fields(dataset_path: str, fields: list[str]):
+    columns = {c["name"]: c for c in get_column_index(dataset_path)["columns"]}
+    for name in fields:
+        column = columns.get(name)
+        if column is None:
+            raise ValueError(f"Field '{name}' is not in the dataset")
+        if column["type"] != "numeric":
+            raise ValueError(f"Field '{name}' is not numeric ({column['type']} column), every row would be dropped")
+
+
+# fn to find the cache entry of an earlier version of the file that the file only appended rows to,
+# returns its content hash and its size (the offset of the new rows), None when there is no such entry
+def find_appended_entry(dataset_path: str, index: dict) -> tuple[str, int] | None:
+    path = os.path.abspath(dataset_path)
+    size = os.path.getsize(dataset_path)
+
+    earlier = []
+    for key, content_hash in index["files"].items():
+        key_path, key_size, _ = key.rsplit("|", 2)
+        if key_path == path and 0 < int(key_size) < size and content_hash in index["entries"]:
+            earlier.append((int(key_size), content_hash))
+
+    # the newest version first, the earlier file has to end with a full row
+    for old_size, content_hash in sorted(earlier, reverse=True):
+        with open(dataset_path, "rb") as f:
+            f.seek(old_size - 1)
+            if f.read(1) != b"\n":
+                continue
+        if hash_file(dataset_path, old_size) == content_hash:
+            return content_hash, old_size
+
+    return None
+
+
+# fn to get the columns of the fields, the columns stored for an earlier version of the file are extended
+# with the appended rows and the rest are parsed from the whole file
+def parse_missing_columns(dataset_path: str, fields: list[str], headers: list[str], index: dict) -> list[np.ndarray]:
+    columns = {}
+    appended = find_appended_entry(dataset_path, index)
+    if appended is not None:
+        old_hash, offset = appended
+        old_paths = {name: os.path.join(CACHE_DIR, old_hash, f"{headers.index(name)}.npy") for name in fields}
+        extended = [name for name in fields if os.path.exists(old_paths[name])]
+        if extended:
+            tails = read_csv_tail_columns(dataset_path, extended, offset)
+            for name, tail in zip(extended, tails):
+                columns[name] = np.concatenate([np.load(old_paths[name], mmap_mode="r"), tail])
+            count("appended_rows_parsed", tails[0].shape[0])
+
+    rest = [name for name in fields if name not in columns]
+    if rest:
+        columns.update(zip(rest, read_csv_columns(dataset_path, rest)))
+    return [columns[name] for name in fields]
+
+
+# fn to get the size of all files of an entry
+def entry_size(entry_dir: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(entry_dir, name))
+        for name in os.listdir(entry_dir)
+    )
+
+
+# fn to remove the least recently used entries until the cache fits in the budget
+def evict(index: dict, keep: str):
+    total = sum(e["size"] for e in index["entries"].values())
+    by_age = sorted(index["entries"].items(), key=lambda item: item[1]["last_used"])
+
+    for content_hash, entry in by_age:
+        if total <= CACHE_BUDGET_BYTES:
+            break
+        if content_hash == keep:
+            continue
+
+        shutil.rmtree(os.path.join(CACHE_DIR, content_hash), ignore_errors=True)
+        total -= entry["size"]
+        del index["entries"][content_hash]
+        index["files"] = {k: v for k, v in index["files"].items() if v != content_hash}
+
+
+# fn to get the columns of the dataset from the cache, missing columns are parsed and stored
+#   the columns are parsed under the lock of the entry only and published with os.replace
+def load_columns_cached(dataset_path: str, fields: list[str]) -> list[np.ndarray]:
+    content_hash = get_fingerprint(dataset_path)
+    entry_dir = os.path.join(CACHE_DIR, content_hash)
+    meta_path = os.path.join(entry_dir, "meta.json")
+
+    with entry_lock(content_hash):
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {"headers": read_csv_headers(dataset_path)}
+        # an entry without parsed columns (new or only sniffed) can be a file with appended rows
+        new_entry = "num_rows" not in meta
+
+        indexes = field_indexes(meta["headers"], fields)
+        column_paths = [os.path.join(entry_dir, f"{i}.npy") for i in indexes]
+
+        # parse only the columns that are not stored yet, all of them in one pass
+        missing = [name for name, p in zip(fields, column_paths) if not os.path.exists(p)]
+        count("column_cache_misses", len(missing))
+        if missing:
+            os.makedirs(entry_dir, exist_ok=True)
+            # only a new entry can be a file with appended rows, a known entry just gets new columns
+            if new_entry:
+                with cache_lock:
+                    index = read_index()
+                parsed = parse_missing_columns(dataset_path, missing, meta["headers"], index)
+            else:
+                parsed = read_csv_columns(dataset_path, missing)
+            for name, column in zip(missing, parsed):
+                p = os.path.join(entry_dir, f"{meta['headers'].index(name)}.npy")
+                tmp = temp_path(p)
+                with open(tmp, "wb") as f:
+                    np.save(f, column)
+                os.replace(tmp, p)
+                meta["num_rows"] = column.shape[0]
+
+            write_meta(meta_path, meta)
+
+        with cache_lock:
+            index = read_index()
+            index["entries"][content_hash] = {
+                "last_used": time.time(),
+                "size": entry_size(entry_dir),
+            }
+            if missing:
+                evict(index, content_hash)
+            write_index(index)
+
+        return [np.load(p, mmap_mode="r") for p in column_paths]
+
+
+# fn to get the statistics of the columns of the fields over the rows without NaN in any of the fields,
+#   computed once per set of fields and stored in meta.json, with batch_rows the csv is streamed in batches
+#   (the mini-batch mode) instead of parsing the columns into the cache
+def get_column_stats(dataset_path: str, fields: list[str], batch_rows: int | None = None) -> list[dict]:
+    if batch_rows is None:
+        columns = load_columns_cached(dataset_path, fields)
+
+    content_hash = get_fingerprint(dataset_path)
+    entry_dir = os.path.join(CACHE_DIR, content_hash)
+    meta_path = os.path.join(entry_dir, "meta.json")
+    with entry_lock(content_hash):
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {"headers": read_csv_headers(dataset_path)}
+
+        # the column indexes of the fields in order, the rows kept depend on all of them
+        stored = meta.setdefault("field_stats", {})
+        key = ",".join(str(i) for i in field_indexes(meta["headers"], fields))
+        if key in stored:
+            return stored[key]
+
+        with span("column_stats"):
+            if batch_rows is None:
+                stored[key] = column_stats(columns)
+            else:
+                stats = ColumnStats(len(fields))
+                for batch in iter_csv_batches(dataset_path, fields, batch_rows):
+                    stats.update(batch)
+                stored[key] = stats.to_list()
+        os.makedirs(entry_dir, exist_ok=True)
+        write_meta(meta_path, meta)
+
+    # a streamed file has no columns in the cache, its entry is only the meta.json
+    if batch_rows is not None:
+        with cache_lock:
+            index = read_index()
+            index["entries"][content_hash] = {
+                "last_used": time.time(),
+                "size": entry_size(entry_dir),
+            }
+            write_index(index)
+
+    return stored[key]
+
+
+# fn to get the headers of the dataset, from the cache when the file is already known
+def get_headers(dataset_path: str) -> list[str]:
+    with cache_lock:
+        content_hash = read_index()["files"].get(stat_key(dataset_path))
+
+    if content_hash is not None:
+        try:
+            with open(os.path.join(CACHE_DIR, content_hash, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)["headers"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    return read_csv_headers(dataset_path)
+
+
+# fn to read the selected columns from the dataset, rows with NaN are dropped
+def load_dataset(dataset_path: str, fields: list[str], use_cache: bool = True) -> np.ndarray:
+    with span("csv_load"):
+        if use_cache:
+            columns = load_columns_cached(dataset_path, fields)
+        else:
+            columns = read_csv_columns(dataset_path, fields)
+
+        # column-major (structure of arrays), every field is one contiguous array for any number of fields
+        data = np.empty((columns[0].shape[0], len(columns)), dtype=np.float64, order="F")
+        for j, column in enumerate(columns):
+            data[:, j] = column
+
+        valid = drop_nan_rows(data)
+
+    count("rows_loaded", data.shape[0])
+    count("nan_rows_skipped", data.shape[0] - valid.shape[0])
+    return valid
+
+
+# fn to skip the rows with NaN like the c++ engine does, the layout (row or column-major) is kept
+def drop_nan_rows(data: np.ndarray) -> np.ndarray:
+    valid = data[~np.isnan(data).any(axis=1)]
+    return np.asfortranarray(valid) if data.flags.f_contiguous else valid
+
+
+# fn to stream the selected columns of the csv in batches, only one batch is in memory at a time
+def iter_csv_batches(dataset_path: str, fields: list[str], batch_rows: int):
+    with open(dataset_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        indexes = field_indexes(next(reader), fields)
+
+        rows = []
+        for row in reader:
+            rows.append([to_float(row[i]) if i < len(row) else math.nan for i in indexes])
+            if len(rows) == batch_rows:
+                yield drop_nan_rows(np.array(rows, dtype=np.float64))
+                rows = []
+
+        if rows:
+            yield drop_nan_rows(np.array(rows, dtype=np.float64))
@@ -0,0 +1,746 @@
+# in-process k-means engine, same input/output as the c++ exe (cpp/src/main.cpp)
+# imports
+import time
+
+import numpy as np
+
+from K_means_dataset import iter_csv_batches, get_column_stats
+from K_means_metrics import ClusterMetrics, cluster_metrics, SILHOUETTE_SAMPLE_ROWS, SILHOUETTE_CONFIDENCE
+from K_means_parallel import map_shared
+from K_means_scaling import scaling_from_stats, scaling_weights
+from K_means_trace import span, count, record_iteration
+
+# engine constants, kept the same as the c++ engine
+NUM_ITERATIONS = 100
+EPS2 = 1e-8
+
+# number of rows in one distance block, keeps the (rows x clusters) buffers small
+CHUNK_ROWS = 65536
+
+# number of rows in one block of the center by center assignment, the column slices of a block and the
+# three row buffers stay in the cache while every center is compared
+ASSIGN_CHUNK_ROWS = 32768
+
+# assignment step modes, "hamerly" keeps distance bounds and skips most distance evaluations
+ASSIGNMENT_MODES = ("lloyd", "hamerly")
+
+# seeding modes for when no centers are given
+INIT_MODES = ("random", "kmeans++", "kmeans||")
+
+# k-means|| rounds, every round samples about 2 * numClusters candidates
+KMEANS_PARALLEL_ROUNDS = 5
+
+# clustering modes, "minibatch" streams the csv in batches and never holds the whole dataset
+MODES = ("full", "minibatch")
+
+# mini-batch vars, rows per batch and the maximum number of passes over the file
+MINIBATCH_ROWS = 4096
+MINIBATCH_MAX_PASSES = 10
+
+# how the best of the restarts (nInit) is picked, lowest inertia or highest CH index
+SELECT_BY = ("inertia", "ch")
+
+# names of the center coordinates in the json payload, for more than 3 fields the centers are lists
+CENTER_KEYS = ("x", "y", "z")
+
+
+# fn to convert the centers from the payload ({"x":..,"y":..,"z":..} or lists) to an array
+def parse_centers(centers: list, num_dims: int) -> np.ndarray:
+    parsed = []
+    for c in centers:
+        if isinstance(c, dict):
+            values = [c[key] for key in CENTER_KEYS if key in c]
+        else:
+            values = list(c)
+
+        if len(values) != num_dims:
+            raise ValueError(f"Each center needs {num_dims} coordinates, got {len(values)}")
+        parsed.append(values)
+
+    return np.array(parsed, dtype=np.float64)
+
+
+# fn to calculate the L1 distance (same as cluster::d) from every row of the block to every center, in the preallocated buffers
+#   weights (1 / scale of every dimension, see K_means_scaling.py) give the distance of the scaled data
+def block_distances(block: np.ndarray, centers: np.ndarray, dist: np.ndarray, diff: np.ndarray, weights: np.ndarray | None = None) -> np.ndarray:
+    # accumulate |x - c| one dimension at a time
+    dist.fill(0.0)
+    for j in range(block.shape[1]):
+        np.subtract(block[:, j, None], centers[None, :, j], out=diff)
+        np.abs(diff, out=diff)
+        if weights is not None:
+            diff *= weights[j]
+        dist += diff
+    return dist
+
+
+# fn to calculate the (weighted) L1 distance between rows, the arrays are broadcast against each other
+def l1_distance(a: np.ndarray, b: np.ndarray, weights: np.ndarray | None = None) -> np.ndarray:
+    diff = np.abs(a - b)
+    if weights is not None:
+        diff *= weights
+    return diff.sum(axis=-1)
+
+
+# fn to calculate the (weighted) squared euclidean length of every row
+def squared_norm(diff: np.ndarray, weights: np.ndarray | None = None) -> np.ndarray:
+    if weights is not None:
+        diff = diff * weights
+    return (diff * diff).sum(axis=-1)
+
+
+# fn to assign the rows of a block to the nearest center, one center at a time over the columns of the block
+#   like the tile loop of the c++ engine, the sums and the ties (first center wins) are the same as argmin over
+#   block_distances, nearest gets the distances, dist and diff are buffers of the block size
+def assign_block(block: np.ndarray, centers: np.ndarray, labels: np.ndarray, nearest: np.ndarray, dist: np.ndarray, diff: np.ndarray, weights: np.ndarray | None = None):
+    for k in range(centers.shape[0]):
+        d = nearest if k == 0 else dist
+        np.subtract(block[:, 0], centers[k, 0], out=d)
+        np.abs(d, out=d)
+        if weights is not None:
+            d *= weights[0]
+        for j in range(1, block.shape[1]):
+            np.subtract(block[:, j], centers[k, j], out=diff)
+            np.abs(diff, out=diff)
+            if weights is not None:
+                diff *= weights[j]
+            d += diff
+
+        if k == 0:
+            labels.fill(0)
+        else:
+            closer = d < nearest
+            np.minimum(nearest, d, out=nearest)
+            labels[closer] = k
+
+
+# fn to assign every point to the nearest center, returns the number of distance evaluations
+#   the buffers hold ASSIGN_CHUNK_ROWS (or fewer) rows
+def assign_labels(data: np.ndarray, centers: np.ndarray, labels: np.ndarray, nearest_buf: np.ndarray, dist_buf: np.ndarray, diff_buf: np.ndarray, weights: np.ndarray | None = None) -> int:
+    num_points = data.shape[0]
+
+    for start in range(0, num_points, ASSIGN_CHUNK_ROWS):
+        end = min(start + ASSIGN_CHUNK_ROWS, num_points)
+        n = end - start
+        assign_block(data[start:end], centers, labels[start:end], nearest_buf[:n], dist_buf[:n], diff_buf[:n], weights)
+
+    return num_points * centers.shape[0]
+
+
+# fn to store the nearest center and the two nearest distances (the bounds) for the rows of a distance block
+def set_two_nearest(dist: np.ndarray, rows, labels: np.ndarray, upper: np.ndarray, lower: np.ndarray):
+    best = np.argmin(dist, axis=1)
+    block_rows = np.arange(dist.shape[0])
+
+    labels[rows] = best
+    upper[rows] = dist[block_rows, best]
+    dist[block_rows, best] = np.inf
+    lower[rows] = dist.min(axis=1)
+
+
+# fn for the first accelerated assignment, full distances that also set the bounds
+def init_bounds(data: np.ndarray, centers: np.ndarray, labels: np.ndarray, upper: np.ndarray, lower: np.ndarray, dist_buf: np.ndarray, diff_buf: np.ndarray, weights: np.ndarray | None = None) -> int:
+    num_points = data.shape[0]
+
+    for start in range(0, num_points, CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, num_points)
+        dist = block_distances(data[start:end], centers, dist_buf[:end - start], diff_buf[:end - start], weights)
+        set_two_nearest(dist, slice(start, end), labels, upper, lower)
+
+    return num_points * centers.shape[0]
+
+
+# fn for the accelerated assignment (Hamerly), the triangle inequality skips the points that can not change cluster
+#   upper = distance to the own center (or more), lower = distance to the second closest center (or less)
+def assign_labels_hamerly(data: np.ndarray, centers: np.ndarray, labels: np.ndarray, upper: np.ndarray, lower: np.ndarray, dist_buf: np.ndarray, diff_buf: np.ndarray, weights: np.ndarray | None = None) -> int:
+    num_clusters = centers.shape[0]
+
+    # half of the distance from every center to its closest other center
+    center_dist = l1_distance(centers[:, None, :], centers[None, :, :], weights)
+    np.fill_diagonal(center_dist, np.inf)
+    half_gap = 0.5 * center_dist.min(axis=1)
+
+    bound = np.maximum(half_gap[labels], lower)
+    candidates = np.flatnonzero(upper > bound)
+
+    # tighten the upper bound with the real distance to the own center
+    upper[candidates] = l1_distance(data[candidates], centers[labels[candidates]], weights)
+    evaluations = candidates.size
+    candidates = candidates[upper[candidates] > bound[candidates]]
+
+    # full distances only for the points that can still change cluster
+    for start in range(0, candidates.size, CHUNK_ROWS):
+        rows = candidates[start:start + CHUNK_ROWS]
+        dist = block_distances(data[rows], centers, dist_buf[:rows.size], diff_buf[:rows.size], weights)
+        set_two_nearest(dist, rows, labels, upper, lower)
+        evaluations += rows.size * num_clusters
+
+    return evaluations
+
+
+# fn to move the bounds with the centers after the update
+def update_bounds(old_centers: np.ndarray, centers: np.ndarray, labels: np.ndarray, upper: np.ndarray, lower: np.ndarray, weights: np.ndarray | None = None):
+    shift = l1_distance(centers, old_centers, weights)
+    upper += shift[labels]
+
+    if shift.shape[0] > 1:
+        order = np.argsort(shift)
+        largest, second = order[-1], order[-2]
+        lower -= np.where(labels == largest, shift[second], shift[largest])
+
+
+# fn to move every center to the mean of its points, empty clusters keep their center
+def update_centers(data: np.ndarray, labels: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    num_clusters = centers.shape[0]
+    counts = np.bincount(labels, minlength=num_clusters)
+    non_empty = counts > 0
+
+    for j in range(data.shape[1]):
+        sums = np.bincount(labels, weights=data[:, j], minlength=num_clusters)
+        centers[non_empty, j] = sums[non_empty] / counts[non_empty]
+
+    return counts
+
+
+# fn to get the nearest center and its distance for every point
+def nearest_centers(data: np.ndarray, centers: np.ndarray, weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    num_points = data.shape[0]
+    block_rows = min(ASSIGN_CHUNK_ROWS, num_points)
+    dist_buf = np.empty(block_rows, dtype=np.float64)
+    diff_buf = np.empty(block_rows, dtype=np.float64)
+
+    labels = np.empty(num_points, dtype=np.intp)
+    nearest = np.empty(num_points, dtype=np.float64)
+    for start in range(0, num_points, ASSIGN_CHUNK_ROWS):
+        end = min(start + ASSIGN_CHUNK_ROWS, num_points)
+        n = end - start
+        assign_block(data[start:end], centers, labels[start:end], nearest[start:end], dist_buf[:n], diff_buf[:n], weights)
+
+    return labels, nearest
+
+
+# fn to get the seed of the run, a new random seed when the payload has none, the seed is in the stats so any
+#   run can be repeated
+def run_seed(payload: dict) -> int:
+    seed = payload.get("seed")
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    return seed
+
+
+# fn to derive independent seeds for the jobs of a run (restarts, k sweep) from the seed of the run
+def spawn_seeds(seed: int, count: int) -> list[int]:
+    return [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(count)]
+
+
+# fn to sample distinct random instances from the dataset for centroids
+def sample_centers(data: np.ndarray, num_clusters: int, rng: np.random.Generator) -> np.ndarray:
+    return data[rng.choice(data.shape[0], size=num_clusters, replace=False)]
+
+
+# fn to pick the indexes of the k-means++ centers, every next center is sampled with probability weight * D(x)^2
+def kmeans_plus_plus_indexes(data: np.ndarray, num_clusters: int, rng: np.random.Generator, weights: np.ndarray | None = None, dim_weights: np.ndarray | None = None) -> np.ndarray:
+    num_points = data.shape[0]
+    if weights is None:
+        weights = np.ones(num_points, dtype=np.float64)
+
+    chosen = np.empty(num_clusters, dtype=np.intp)
+    chosen[0] = np.searchsorted(np.cumsum(weights), rng.random() * weights.sum(), side="right")
+    d2 = np.full(num_points, np.inf)
+
+    for i in range(1, num_clusters):
+        d = l1_distance(data, data[chosen[i - 1]], dim_weights)
+        np.minimum(d2, d * d, out=d2)
+        d2[chosen[:i]] = 0.0
+
+        prob = np.cumsum(weights * d2)
+        if prob[-1] > 0.0:
+            chosen[i] = np.searchsorted(prob, rng.random() * prob[-1], side="right")
+        else:
+            # every point is on a center already, take any instance that is not chosen yet
+            chosen[i] = rng.choice(np.setdiff1d(np.arange(num_points), chosen[:i]))
+
+    return chosen
+
+
+# fn for the k-means|| seeding, oversample candidates in a few rounds and reduce them with weighted k-means++
+def kmeans_parallel_centers(data: np.ndarray, num_clusters: int, rng: np.random.Generator, dim_weights: np.ndarray | None = None) -> np.ndarray:
+    num_points = data.shape[0]
+    oversample = 2 * num_clusters
+
+    candidates = [int(rng.integers(num_points))]
+    d = l1_distance(data, data[candidates[0]], dim_weights)
+    d2 = d * d
+
+    for _ in range(KMEANS_PARALLEL_ROUNDS):
+        phi = d2.sum()
+        if phi == 0.0:
+            break
+
+        # every point is picked independently, all of them in one vectorized draw
+        picked = np.flatnonzero(rng.random(num_points) < oversample * d2 / phi)
+        if picked.size == 0:
+            continue
+
+        candidates.extend(picked.tolist())
+        _, d = nearest_centers(data, data[picked], dim_weights)
+        np.minimum(d2, d * d, out=d2)
+
+    candidates = np.unique(candidates)
+    if candidates.size < num_clusters:
+        rest = np.setdiff1d(np.arange(num_points), candidates)
+        candidates = np.concatenate([candidates, rng.choice(rest, num_clusters - candidates.size, replace=False)])
+    if candidates.size == num_clusters:
+        return data[candidates]
+
+    # weight every candidate by the number of points closest to it
+    labels, _ = nearest_centers(data, data[candidates], dim_weights)
+    weights = np.bincount(labels, minlength=candidates.size).astype(np.float64)
+    chosen = kmeans_plus_plus_indexes(data[candidates], num_clusters, rng, weights, dim_weights)
+    return data[candidates[chosen]]
+
+
+# fn to add one center to the existing ones with the k-means++ rule, used to warm-start k + 1 from k
+def add_center(data: np.ndarray, centers: np.ndarray, rng: np.random.Generator, weights: np.ndarray | None = None) -> np.ndarray:
+    _, d = nearest_centers(data, centers, weights)
+    prob = np.cumsum(d * d)
+    if prob[-1] > 0.0:
+        index = np.searchsorted(prob, rng.random() * prob[-1], side="right")
+    else:
+        index = rng.integers(data.shape[0])
+    return np.vstack([centers, data[index]])
+
+
+# fn to split the cluster with the largest within cluster sum of squares in two along its principal axis
+def split_worst_cluster(data: np.ndarray, centers: np.ndarray, labels: np.ndarray, rng: np.random.Generator, weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    k = centers.shape[0]
+    sse = np.bincount(labels, weights=squared_norm(data - centers[labels], weights), minlength=k)
+    worst = int(np.argmax(sse))
+    members = np.flatnonzero(labels == worst)
+
+    points = data[members]
+    if points.shape[0] >= 2:
+        scaled = points if weights is None else points * weights
+        _, vectors = np.linalg.eigh(np.atleast_2d(np.cov(scaled, rowvar=False)))
+        side = (scaled - scaled.mean(axis=0)) @ vectors[:, -1] >= 0.0
+        # both halves need points, all equal points can not be split
+        if side.any() and not side.all():
+            centers = np.vstack([centers, points[side].mean(axis=0)])
+            centers[worst] = points[~side].mean(axis=0)
+            labels = labels.copy()
+            labels[members[side]] = k
+            return centers, labels
+
+    # nothing to split, the new center is a k-means++ pick
+    centers = add_center(data, centers, rng, weights)
+    return centers, nearest_centers(data, centers, weights)[0]
+
+
+# fn to merge the two clusters whose merge adds the least to the inertia (Ward), the clusters after the second move down
+def merge_closest_clusters(centers: np.ndarray, labels: np.ndarray, weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    counts = np.bincount(labels, minlength=centers.shape[0]).astype(np.float64)
+    dist = squared_norm(centers[:, None, :] - centers[None, :, :], weights)
+    pair_counts = counts[:, None] + counts[None, :]
+    cost = np.divide(counts[:, None] * counts[None, :], pair_counts, out=np.zeros_like(dist), where=pair_counts > 0) * dist
+    np.fill_diagonal(cost, np.inf)
+    a, b = sorted(np.unravel_index(int(np.argmin(cost)), cost.shape))
+
+    centers = centers.copy()
+    if counts[a] + counts[b] > 0:
+        centers[a] = (counts[a] * centers[a] + counts[b] * centers[b]) / (counts[a] + counts[b])
+    centers = np.delete(centers, b, axis=0)
+
+    labels = labels.copy()
+    labels[labels == b] = a
+    labels[labels > b] -= 1
+    return centers, labels
+
+
+# fn to get the starting centers for numClusters from a previous result, None when the result does not fit the data
+#   labels of the same rows (e.g. other fields) give the centers as the means of the previous clusters,
+#   previous centers of the same fields are kept and only rows after the previous labels (appended rows) are assigned,
+#   then the worst cluster is split until there are numClusters centers or the closest clusters are merged
+def warm_start_centers(data: np.ndarray, num_clusters: int, centers=None, labels=None, rng: np.random.Generator | None = None, weights: np.ndarray | None = None) -> tuple[np.ndarray, dict] | tuple[None, None]:
+    if num_clusters > data.shape[0]:
+        raise ValueError("numClusters is larger than the number of valid rows")
+
+    if centers is not None:
+        centers = np.array(centers, dtype=np.float64)
+    if labels is not None:
+        labels = np.asarray(labels, dtype=np.intp)
+
+    if labels is not None and labels.shape[0] == data.shape[0] and labels.shape[0] > 0:
+        counts = np.bincount(labels)
+        kept = counts > 0
+        sums = np.stack([np.bincount(labels, weights=data[:, j], minlength=counts.shape[0]) for j in range(data.shape[1])], axis=1)
+        centers = sums[kept] / counts[kept, None]
+        # clusters that lost all rows are dropped, the labels are moved down to match
+        labels = (np.cumsum(kept) - 1)[labels]
+        source = "labels"
+    elif centers is not None and centers.ndim == 2 and centers.shape[1] == data.shape[1] and centers.shape[0] > 0:
+        if labels is not None and labels.shape[0] < data.shape[0]:
+            labels = np.concatenate([labels, nearest_centers(data[labels.shape[0]:], centers, weights)[0]])
+        else:
+            labels = nearest_centers(data, centers, weights)[0]
+        source = "centers"
+    else:
+        return None, None
+
+    rng = rng or np.random.default_rng()
+    previous_k = centers.shape[0]
+    while centers.shape[0] < num_clusters:
+        centers, labels = split_worst_cluster(data, centers, labels, rng, weights)
+    while centers.shape[0] > num_clusters:
+        centers, labels = merge_closest_clusters(centers, labels, weights)
+
+    return centers, {
+        "from": source,
+        "previous_k": previous_k,
+        "split": max(num_clusters - previous_k, 0),
+        "merged": max(previous_k - num_clusters, 0),
+    }
+
+
+# fn to pick the initial centers with the selected seeding mode
+def init_centers(data: np.ndarray, num_clusters: int, init: str, rng: np.random.Generator, weights: np.ndarray | None = None) -> np.ndarray:
+    if init not in INIT_MODES:
+        raise ValueError(f"Unknown seeding mode: {init}")
+
+    if num_clusters > data.shape[0]:
+        raise ValueError("numClusters is larger than the number of valid rows")
+
+    if init == "kmeans++":
+        return data[kmeans_plus_plus_indexes(data, num_clusters, rng, dim_weights=weights)]
+    if init == "kmeans||":
+        return kmeans_parallel_centers(data, num_clusters, rng, weights)
+    return sample_centers(data, num_clusters, rng)
+
+
+# fn to run the clustering on an already loaded dataset
+def kmeans(data: np.ndarray, num_clusters: int, centers: np.ndarray | None = None, rng: np.random.Generator | None = None, assignment: str = "lloyd", init: str = "random", progress=None, weights: np.ndarray | None = None) -> dict:
+    if data.shape[0] == 0:
+        raise ValueError("Dataset has no valid rows")
+
+    if assignment not in ASSIGNMENT_MODES:
+        raise ValueError(f"Unknown assignment mode: {assignment}")
+
+    if centers is None:
+        with span("seeding"):
+            centers = init_centers(data, num_clusters, init, rng or np.random.default_rng(), weights)
+    else:
+        centers = np.array(centers, dtype=np.float64)
+
+    num_points = data.shape[0]
+    labels = np.zeros(num_points, dtype=np.intp)
+    old_centers = np.empty_like(centers)
+
+    # the bounds need the full (rows x clusters) distances, the plain assignment one row of distances per center
+    bounded = assignment == "hamerly"
+    if bounded:
+        upper = np.empty(num_points, dtype=np.float64)
+        lower = np.empty(num_points, dtype=np.float64)
+        block_rows = min(CHUNK_ROWS, num_points)
+        dist_buf = np.empty((block_rows, num_clusters), dtype=np.float64)
+        diff_buf = np.empty((block_rows, num_clusters), dtype=np.float64)
+    else:
+        block_rows = min(ASSIGN_CHUNK_ROWS, num_points)
+        nearest_buf = np.empty(block_rows, dtype=np.float64)
+        dist_buf = np.empty(block_rows, dtype=np.float64)
+        diff_buf = np.empty(block_rows, dtype=np.float64)
+
+    # the clustering algorithm
+    start = time.perf_counter()
+    iteration = 0
+    eps = 1.0
+    evaluations = 0
+    with span("iterations"):
+        while iteration < NUM_ITERATIONS and eps > EPS2:
+            old_centers[:] = centers
+
+            if not bounded:
+                evaluations += assign_labels(data, centers, labels, nearest_buf, dist_buf, diff_buf, weights)
+            elif iteration == 0:
+                evaluations += init_bounds(data, centers, labels, upper, lower, dist_buf, diff_buf, weights)
+            else:
+                evaluations += assign_labels_hamerly(data, centers, labels, upper, lower, dist_buf, diff_buf, weights)
+
+            counts = update_centers(data, labels, centers)
+            if bounded:
+                update_bounds(old_centers, centers, labels, upper, lower, weights)
+
+            # the change of the centers (in scaled units), if its under the threshold stop
+            eps = float(squared_norm(centers - old_centers, weights).max())
+            iteration += 1
+            record_iteration(iteration, eps)
+
+            # progress event, the callback stops the run by raising (see K_means_progress.py)
+            if progress is not None:
+                progress({"event": "iteration", "iteration": iteration, "eps": eps, "elapsed": time.perf_counter() - start})
+
+    count("iterations", iteration)
+    count("distance_evaluations", evaluations)
+
+    return {
+        "centers": centers,
+        "labels": labels,
+        "counts": counts,
+        "iterations": iteration,
+        "eps": eps,
+        "distance_evaluations": evaluations,
+    }
+
+
+# fn to get the scaling of the run (mode, offset and scale of every field), None without scaling
+#   the column statistics come from the dataset cache, the mini-batch mode streams them from the csv once
+def get_scaling(payload: dict, batch_rows: int | None = None) -> dict | None:
+    mode = payload.get("scaling", "none")
+    if mode == "none":
+        return None
+
+    return scaling_from_stats(get_column_stats(payload["dataset"], payload["fields"], batch_rows), mode)
+
+
+# fn for the mini-batch clustering, the csv is streamed in batches so the memory stays bounded by the batch size
+#   every center is moved towards the mean of its batch points with its own learning rate (batch points / all points seen)
+def run_minibatch(payload: dict, progress=None) -> dict:
+    dataset_path = payload["dataset"]
+    fields = payload["fields"]
+    num_clusters = payload["numClusters"]
+    batch_rows = payload.get("batchSize", MINIBATCH_ROWS)
+
+    seed = run_seed(payload)
+    rng = np.random.default_rng(seed)
+
+    scaling = get_scaling(payload, batch_rows)
+    weights = scaling_weights(scaling)
+
+    if payload.get("centers"):
+        centers = parse_centers(payload["centers"], len(fields))
+        if centers.shape[0] != num_clusters:
+            raise ValueError("Number of centers must match numClusters")
+    else:
+        first_batch = next(iter_csv_batches(dataset_path, fields, max(batch_rows, num_clusters)), None)
+        if first_batch is None or first_batch.shape[0] == 0:
+            raise ValueError("Dataset has no valid rows")
+        with span("seeding"):
+            centers = init_centers(first_batch, num_clusters, payload.get("init", "random"), rng, weights)
+
+    seen = np.zeros(num_clusters, dtype=np.float64)
+    evaluations = 0
+
+    # the clustering passes
+    start = time.perf_counter()
+    passes = 0
+    eps = 1.0
+    with span("iterations"):
+        while passes < MINIBATCH_MAX_PASSES and eps > EPS2:
+            old_centers = centers.copy()
+
+            for batch in iter_csv_batches(dataset_path, fields, batch_rows):
+                labels, _ = nearest_centers(batch, centers, weights)
+                evaluations += batch.shape[0] * num_clusters
+
+                batch_counts = np.bincount(labels, minlength=num_clusters)
+                non_empty = batch_counts > 0
+                seen += batch_counts
+                rate = batch_counts[non_empty] / seen[non_empty]
+
+                for j in range(centers.shape[1]):
+                    batch_mean = np.bincount(labels, weights=batch[:, j], minlength=num_clusters)[non_empty] / batch_counts[non_empty]
+                    centers[non_empty, j] += rate * (batch_mean - centers[non_empty, j])
+
+            eps = float(squared_norm(centers - old_centers, weights).max())
+            passes += 1
+            record_iteration(passes, eps)
+
+            if progress is not None:
+                progress({"event": "iteration", "iteration": passes, "eps": eps, "elapsed": time.perf_counter() - start})
+
+    # one more streaming pass for the assignments and the statistics of the metrics
+    with span("metrics"):
+        label_batches = []
+        stats = ClusterMetrics(centers, weights, payload.get("silhouetteSample", SILHOUETTE_SAMPLE_ROWS), seed)
+        for batch in iter_csv_batches(dataset_path, fields, batch_rows):
+            labels, _ = nearest_centers(batch, centers, weights)
+            evaluations += batch.shape[0] * num_clusters
+
+            label_batches.append(labels.astype(np.int32))
+            stats.update(batch, labels)
+
+        num_points = int(stats.counts.sum())
+        if num_points == 0:
+            raise ValueError("Dataset has no valid rows")
+        metrics = stats.to_dict(payload.get("silhouetteConfidence", SILHOUETTE_CONFIDENCE))
+
+    count("rows_loaded", num_points)
+    count("iterations", passes)
+    count("distance_evaluations", evaluations)
+
+    return {
+        "CH_index": metrics["CH_index"],
+        "centers": centers,
+        "labels": np.concatenate(label_batches),
+        "stats": {
+            "seed": seed,
+            "iterations": passes,
+            "distance_evaluations": evaluations,
+            "inertia": metrics["inertia"],
+            "metrics": metrics,
+            "scaling": scaling,
+        },
+    }
+
+
+# fn to find the elbow of the inertia curve, the point furthest from the line between the first and the last point
+def elbow_k(ks: list[int], inertias: list[float]) -> int | None:
+    if len(ks) < 3:
+        return None
+
+    x = np.array(ks, dtype=np.float64)
+    y = np.array(inertias, dtype=np.float64)
+    x = (x - x[0]) / (x[-1] - x[0])
+    y_range = y[0] - y[-1]
+    y = (y[0] - y) / y_range if y_range != 0.0 else np.zeros_like(y)
+
+    # distance to the line from (0, 0) to (1, 1)
+    return ks[int(np.argmax(np.abs(y - x)))]
+
+
+# fn to run the clustering for every k in kRange and recommend the one with the best CH index
+#   the dataset is loaded once, without warm start the k values run in parallel,
+#   with warm start every k + 1 starts from the centers of k plus one k-means++ center
+def run_k_sweep(data: np.ndarray, payload: dict, progress=None) -> dict:
+    k_min, k_max = payload["kRange"]
+    if k_min < 1 or k_max < k_min:
+        raise ValueError("kRange must be [min, max] with 1 <= min <= max")
+    ks = list(range(k_min, k_max + 1))
+
+    seed = run_seed(payload)
+    seeds = spawn_seeds(seed, len(ks))
+
+    job = {key: value for key, value in payload.items() if key not in ("kRange", "warmStart", "centers")}
+
+    if payload.get("warmStart"):
+        weights = scaling_weights(get_scaling(payload))
+        results = []
+        centers = None
+        for k, k_seed in zip(ks, seeds):
+            k_payload = dict(job, numClusters=k, seed=k_seed)
+            if centers is not None:
+                k_payload["centers"] = add_center(data, centers, np.random.default_rng(k_seed), weights).tolist()
+            result = run_kmeans_on_data(data, k_payload, progress)
+            centers = result["centers"]
+            results.append(result)
+    else:
+        results = map_shared(data, run_kmeans_on_data, [(dict(job, numClusters=k, seed=k_seed),) for k, k_seed in zip(ks, seeds)], progress=progress)
+
+    curve = [
+        {
+            "k": k,
+            "CH_index": r["CH_index"],
+            "inertia": r["stats"]["inertia"],
+            "davies_bouldin": r["stats"]["metrics"]["davies_bouldin"],
+            "silhouette": r["stats"]["metrics"].get("silhouette"),
+            "iterations": r["stats"]["iterations"],
+        }
+        for k, r in zip(ks, results)
+    ]
+
+    scores = [r["CH_index"] for r in results]
+    best = int(np.nanargmax(scores)) if not np.isnan(scores).all() else 0
+
+    result = results[best]
+    result["stats"] = dict(
+        result["stats"],
+        sweep={
+            "seed": seed,
+            "curve": curve,
+            "recommended_k": ks[best],
+            "elbow_k": elbow_k(ks, [c["inertia"] for c in curve]),
+        },
+    )
+    return result
+
+
+# fn to run nInit restarts with different seeds in parallel and keep the best one
+def run_n_init(data: np.ndarray, payload: dict, progress=None) -> dict:
+    n_init = payload["nInit"]
+    select_by = payload.get("selectBy", "inertia")
+    if select_by not in SELECT_BY:
+        raise ValueError(f"Unknown selectBy: {select_by}")
+
+    # every restart gets its own seed derived from the run seed, so the whole run can be replayed
+    seed = run_seed(payload)
+    seeds = spawn_seeds(seed, n_init)
+
+    jobs = [(dict(payload, seed=s, nInit=1),) for s in seeds]
+    results = map_shared(data, run_kmeans_on_data, jobs, progress=progress)
+
+    if select_by == "ch":
+        scores = [r["CH_index"] for r in results]
+        best = int(np.nanargmax(scores)) if not np.isnan(scores).all() else 0
+    else:
+        best = int(np.argmin([r["stats"]["inertia"] for r in results]))
+
+    result = results[best]
+    result["stats"] = dict(
+        result["stats"],
+        seed=seed,
+        best_restart=best,
+        restarts=[dict(r["stats"], CH_index=r["CH_index"]) for r in results],
+    )
+    return result
+
+
+# fn to run the engine on an already loaded dataset with the options from the payload
+def run_kmeans_on_data(data: np.ndarray, payload: dict, progress=None) -> dict:
+    num_clusters = payload["numClusters"]
+
+    if payload.get("kRange"):
+        return run_k_sweep(data, payload, progress)
+
+    # restarts only make sense when the centers are picked by the engine
+    if payload.get("nInit", 1) > 1 and not payload.get("centers"):
+        return run_n_init(data, payload, progress)
+
+    centers = None
+    if payload.get("centers"):
+        centers = parse_centers(payload["centers"], data.shape[1])
+        if centers.shape[0] != num_clusters:
+            raise ValueError("Number of centers must match numClusters")
+
+    # without a seed one is drawn and reported, so every run can be replayed
+    seed = run_seed(payload)
+
+    scaling = get_scaling(payload)
+    weights = scaling_weights(scaling)
+
+    clustering = kmeans(
+        data, num_clusters, centers,
+        rng=np.random.default_rng(seed),
+        assignment=payload.get("assignment", "lloyd"),
+        init=payload.get("init", "random"),
+        progress=progress,
+        weights=weights,
+    )
+    with span("metrics"):
+        metrics = cluster_metrics(
+            data, clustering["centers"], clustering["labels"], weights,
+            sample_rows=payload.get("silhouetteSample", SILHOUETTE_SAMPLE_ROWS),
+            confidence=payload.get("silhouetteConfidence", SILHOUETTE_CONFIDENCE),
+            seed=seed,
+        )
+    return {
+        "CH_index": metrics["CH_index"],
+        "centers": clustering["centers"],
+        "labels": clustering["labels"],
+        "stats": {
+            "seed": seed,
+            "iterations": clustering["iterations"],
+            "distance_evaluations": clustering["distance_evaluations"],
+            "inertia": metrics["inertia"],
+            "metrics": metrics,
+            "scaling": scaling,
+        },
+    }
+
@@ -0,0 +1,172 @@
+# export of a result joined back to the rows of the source csv
+#
+#   export_csv      every row of the csv with a "cluster" column added, empty for the rows the engine skipped
+#                   (a NaN or non numeric cell in one of the fields), the other cells are written as they were read
+#   export_binary   columnar file with the cluster of every csv row (-1 for the skipped rows) and the fields
+#
+# binary layout (little-endian):
+#   magic        4 bytes  b"KMX1"
+#   header_size  uint32
+#   header       utf-8 json {"rows", "fields", "centers", "columns": [{"name", "dtype", "offset"}]}
+#   columns      one after the other from the first multiple of 8 bytes after the header, the offsets are
+#                relative to that point, every column starts at a multiple of 8 bytes (read_binary maps them)
+#
+# the labels of a result are only for the valid rows, the valid rows come from the cached columns of the
+# dataset, both files are written in blocks of EXPORT_CHUNK_ROWS rows so the memory does not grow with the rows
+# imports
+import csv
+import itertools
+import json
+import os
+import struct
+
+import numpy as np
+
+from K_means_dataset import load_columns_cached
+from K_means_trace import span, count
+
+EXPORT_FORMATS = ("csv", "binary")
+
+MAGIC = b"KMX1"
+HEADER = struct.Struct("<4sI")
+
+# rows in one written block
+EXPORT_CHUNK_ROWS = 65536
+
+# name of the added csv column
+CLUSTER_COLUMN = "cluster"
+
+
+# fn to get the cluster of every row of the csv in blocks, -1 for the rows without a label
+def iter_row_labels(columns: list[np.ndarray], labels: np.ndarray):
+    num_rows = columns[0].shape[0]
+    used = 0
+    for start in range(0, num_rows, EXPORT_CHUNK_ROWS):
+        end = min(start + EXPORT_CHUNK_ROWS, num_rows)
+        valid = np.ones(end - start, dtype=bool)
+        for column in columns:
+            valid &= ~np.isnan(column[start:end])
+
+        num_valid = int(valid.sum())
+        if used + num_valid > labels.shape[0]:
+            raise ValueError(f"Result has {labels.shape[0]} labels but the dataset has more valid rows")
+        block = np.full(end - start, -1, dtype=np.int32)
+        block[valid] = labels[used:used + num_valid]
+        used += num_valid
+        yield block
+
+    # the files are written to a temporary path, a mismatch found at the end leaves no output
+    if used != labels.shape[0]:
+        raise ValueError(f"Result has {labels.shape[0]} labels but the dataset has {used} valid rows")
+
+
+# fn to write the csv with the cluster of every row, the file is written next to the output and moved over it at the end
+def export_csv(dataset_path: str, fields: list[str], labels: np.ndarray, out_path: str, column: str = CLUSTER_COLUMN) -> int:
+    with span("export"):
+        columns = load_columns_cached(dataset_path, fields)
+        tmp = out_path + ".tmp"
+        try:
+            with open(dataset_path, newline="", encoding="utf-8-sig") as src, open(tmp, "w", newline="", encoding="utf-8") as dst:
+                reader = csv.reader(src)
+                writer = csv.writer(dst)
+                headers = next(reader)
+                if column in headers:
+                    raise ValueError(f"The dataset already has a '{column}' column")
+                writer.writerow(headers + [column])
+
+                for block in iter_row_labels(columns, np.asarray(labels)):
+                    cells = ["" if label < 0 else str(label) for label in block.tolist()]
+                    # empty lines stay empty
+                    writer.writerows(row + [cell] if row else row for row, cell in zip(itertools.islice(reader, block.shape[0]), cells))
+            os.replace(tmp, out_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    count("rows_exported", columns[0].shape[0])
+    return columns[0].shape[0]
+
+
+# fn to pad the file to a multiple of 8 bytes
+def pad_to_8(f, position: int) -> int:
+    padding = -position % 8
+    f.write(b"\0" * padding)
+    return position + padding
+
+
+# fn to write the columnar file with the cluster of every row and the fields (NaN kept)
+def export_binary(dataset_path: str, fields: list[str], labels: np.ndarray, out_path: str, centers=None) -> int:
+    with span("export"):
+        columns = load_columns_cached(dataset_path, fields)
+        num_rows = columns[0].shape[0]
+
+        # the offsets are known before writing, every column is padded to 8 bytes
+        specs = [(CLUSTER_COLUMN, "<i4")] + [(name, "<f8") for name in fields]
+        offset = 0
+        header_columns = []
+        for name, dtype in specs:
+            header_columns.append({"name": name, "dtype": dtype, "offset": offset})
+            offset += -(-num_rows * np.dtype(dtype).itemsize // 8) * 8
+
+        header = json.dumps({
+            "rows": num_rows,
+            "fields": fields,
+            "centers": None if centers is None else np.asarray(centers, dtype=np.float64).tolist(),
+            "columns": header_columns,
+        }).encode("utf-8")
+
+        tmp = out_path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(HEADER.pack(MAGIC, len(header)))
+                f.write(header)
+                pad_to_8(f, HEADER.size + len(header))
+
+                position = 0
+                for block in iter_row_labels(columns, np.asarray(labels)):
+                    f.write(block.astype("<i4").tobytes())
+                    position += block.nbytes
+                position = pad_to_8(f, position)
+
+                for column in columns:
+                    for start in range(0, num_rows, EXPORT_CHUNK_ROWS):
+                        chunk = np.asarray(column[start:start + EXPORT_CHUNK_ROWS], dtype="<f8")
+                        f.write(chunk.tobytes())
+                        position += chunk.nbytes
+                    position = pad_to_8(f, position)
+            os.replace(tmp, out_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    count("rows_exported", num_rows)
+    return num_rows
+
+
+# fn to read a columnar file, the columns are memory-mapped
+def read_binary(path: str) -> dict:
+    with open(path, "rb") as f:
+        magic, header_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("File is not a k-means export")
+        header = json.loads(f.read(header_size).decode("utf-8"))
+
+    data_start = HEADER.size + header_size
+    data_start += -data_start % 8
+    header["columns"] = {
+        c["name"]: np.memmap(path, dtype=c["dtype"], mode="r", offset=data_start + c["offset"], shape=(header["rows"],))
+        for c in header["columns"]
+    }
+    return header
+
+
+# fn to export a result in the given format
+def export_result(dataset_path: str, fields: list[str], result: dict, out_path: str, export_format: str = "csv") -> int:
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    if "labels" not in result:
+        raise ValueError("The result has no labels to export")
+
+    if export_format == "csv":
+        return export_csv(dataset_path, fields, result["labels"], out_path)
+    return export_binary(dataset_path, fields, result["labels"], out_path, result.get("centers"))
@@ -0,0 +1,165 @@
+# cluster quality metrics, computed in one pass over the data from per-cluster sufficient statistics
+#
+#   inertia          sum of the squared distances of the points to their centers (the WCSS)
+#   CH_index         Calinski-Harabasz index, (BCSS / (k - 1)) / (WCSS / (n - k)), higher is better
+#   davies_bouldin   mean over the clusters of max_j (s_i + s_j) / |c_i - c_j|, s_i is the mean distance of
+#                    the points of cluster i to its center, lower is better
+#   silhouette       mean silhouette of a uniform sample of the points, every sampled point is compared with
+#                    the other sampled points, with a normal confidence interval around the mean
+#
+# per cluster only the count, the sum of the squared distances and the sum of the distances are kept, so the
+# statistics cost O(n k d) and the silhouette O(m^2 d) for a sample of m rows, the exact silhouette (O(n^2)) is
+# never computed, the rows can come in blocks (ClusterMetrics.update), the mini-batch mode streams them from the csv
+#
+# the distances are euclidean like in the CH index (weighted with 1 / scale with scaling, see K_means_scaling.py)
+# imports
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+# rows of the silhouette sample, 0 turns the silhouette off
+SILHOUETTE_SAMPLE_ROWS = 2000
+
+# confidence level of the silhouette interval
+SILHOUETTE_CONFIDENCE = 0.95
+
+# rows in one block, same as the engine
+CHUNK_ROWS = 65536
+
+
+class ClusterMetrics:
+    def __init__(self, centers: np.ndarray, weights: np.ndarray | None = None, sample_rows: int = SILHOUETTE_SAMPLE_ROWS, seed: int | None = None):
+        num_clusters, num_dims = centers.shape
+        self.centers = centers
+        self.weights = weights
+        self.sample_rows = sample_rows
+
+        self.counts = np.zeros(num_clusters, dtype=np.int64)
+        self.sq_dist = np.zeros(num_clusters, dtype=np.float64)
+        self.dist = np.zeros(num_clusters, dtype=np.float64)
+        self.sums = np.zeros(num_dims, dtype=np.float64)
+
+        # bottom-k sample of the rows and their labels, every row gets a random key and the smallest keys are kept
+        self.rng = np.random.default_rng(seed)
+        self.sample = np.empty((0, num_dims), dtype=np.float64)
+        self.sample_labels = np.empty(0, dtype=np.int64)
+        self.keys = np.empty(0, dtype=np.float64)
+
+    # add a block of rows and their labels
+    def update(self, block: np.ndarray, labels: np.ndarray):
+        if block.shape[0] == 0:
+            return
+
+        num_clusters = self.centers.shape[0]
+        diff = block - self.centers[labels]
+        if self.weights is not None:
+            diff *= self.weights
+        sq = np.einsum("ij,ij->i", diff, diff)
+
+        self.counts += np.bincount(labels, minlength=num_clusters)
+        self.sq_dist += np.bincount(labels, weights=sq, minlength=num_clusters)
+        self.dist += np.bincount(labels, weights=np.sqrt(sq), minlength=num_clusters)
+        self.sums += block.sum(axis=0)
+
+        if self.sample_rows > 0:
+            self.keys = np.concatenate([self.keys, self.rng.random(block.shape[0])])
+            self.sample = np.concatenate([self.sample, block])
+            self.sample_labels = np.concatenate([self.sample_labels, labels])
+            if self.keys.shape[0] > self.sample_rows:
+                kept = np.argpartition(self.keys, self.sample_rows)[:self.sample_rows]
+                self.keys = self.keys[kept]
+                self.sample = self.sample[kept]
+                self.sample_labels = self.sample_labels[kept]
+
+    # all the metrics, NaN when a metric is not defined (one cluster, no spread)
+    def to_dict(self, confidence: float = SILHOUETTE_CONFIDENCE) -> dict:
+        num_points = int(self.counts.sum())
+        num_clusters = self.centers.shape[0]
+        inertia = float(self.sq_dist.sum())
+
+        ch = math.nan
+        if 1 < num_clusters < num_points and inertia > 0.0:
+            diff = self.centers - self.sums / num_points
+            if self.weights is not None:
+                diff = diff * self.weights
+            bcss = float((self.counts * (diff * diff).sum(axis=1)).sum())
+            ch = (bcss / (num_clusters - 1)) / (inertia / (num_points - num_clusters))
+
+        metrics = {
+            "inertia": inertia,
+            "CH_index": ch,
+            "davies_bouldin": davies_bouldin(self.centers, self.counts, self.dist, self.weights),
+        }
+        if self.sample_rows > 0:
+            metrics.update(sampled_silhouette(self.sample, self.sample_labels, num_clusters, self.weights, confidence))
+        return metrics
+
+
+# fn to calculate the Davies-Bouldin index from the centers and the sum of the distances of every cluster
+#   the empty clusters are left out, two clusters on the same center do not count (same as sklearn)
+def davies_bouldin(centers: np.ndarray, counts: np.ndarray, dist: np.ndarray, weights: np.ndarray | None = None) -> float:
+    non_empty = counts > 0
+    if non_empty.sum() < 2:
+        return math.nan
+
+    scatter = dist[non_empty] / counts[non_empty]
+    c = centers[non_empty] if weights is None else centers[non_empty] * weights
+    diff = c[:, None, :] - c[None, :, :]
+    separation = np.sqrt((diff * diff).sum(axis=-1))
+    separation[separation == 0.0] = np.inf
+
+    ratio = (scatter[:, None] + scatter[None, :]) / separation
+    np.fill_diagonal(ratio, 0.0)
+    return float(ratio.max(axis=1).mean())
+
+
+# fn to calculate the silhouette of the sampled rows against each other, with the confidence interval of the mean
+#   a point alone in its cluster (in the sample) has silhouette 0
+def sampled_silhouette(sample: np.ndarray, labels: np.ndarray, num_clusters: int, weights: np.ndarray | None = None, confidence: float = SILHOUETTE_CONFIDENCE) -> dict:
+    num_rows = sample.shape[0]
+    sizes = np.bincount(labels, minlength=num_clusters)
+    if num_rows < 2 or (sizes > 0).sum() < 2:
+        return {"silhouette": math.nan, "silhouette_ci": [math.nan, math.nan], "silhouette_sample": num_rows}
+
+    x = sample if weights is None else sample * weights
+    norms = (x * x).sum(axis=1)
+    one_hot = np.zeros((num_rows, num_clusters), dtype=np.float64)
+    one_hot[np.arange(num_rows), labels] = 1.0
+
+    # sum of the distances from every row to every cluster, in blocks of rows
+    cluster_dist = np.empty((num_rows, num_clusters), dtype=np.float64)
+    block_rows = max(1, CHUNK_ROWS // num_rows)
+    for start in range(0, num_rows, block_rows):
+        end = min(start + block_rows, num_rows)
+        sq = norms[start:end, None] + norms[None, :] - 2.0 * (x[start:end] @ x.T)
+        np.maximum(sq, 0.0, out=sq)
+        cluster_dist[start:end] = np.sqrt(sq) @ one_hot
+
+    rows = np.arange(num_rows)
+    own_size = sizes[labels]
+    a = cluster_dist[rows, labels] / np.maximum(own_size - 1, 1)
+
+    # mean distance to the nearest other cluster
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_dist = cluster_dist / sizes
+    mean_dist[:, sizes == 0] = np.inf
+    mean_dist[rows, labels] = np.inf
+    b = mean_dist.min(axis=1)
+
+    s = np.where(own_size > 1, (b - a) / np.maximum(np.maximum(a, b), np.finfo(np.float64).tiny), 0.0)
+    mean = float(s.mean())
+    half_width = NormalDist().inv_cdf(0.5 + confidence / 2.0) * float(s.std(ddof=1)) / math.sqrt(num_rows)
+    return {
+        "silhouette": mean,
+        "silhouette_ci": [mean - half_width, mean + half_width],
+        "silhouette_sample": num_rows,
+    }
+
+
+# fn to calculate the metrics of a clustering of an in-memory dataset, the rows are added in blocks
+def cluster_metrics(data: np.ndarray, centers: np.ndarray, labels: np.ndarray, weights: np.ndarray | None = None, sample_rows: int = SILHOUETTE_SAMPLE_ROWS, confidence: float = SILHOUETTE_CONFIDENCE, seed: int | None = None) -> dict:
+    metrics = ClusterMetrics(centers, weights, sample_rows, seed)
+    for start in range(0, data.shape[0], CHUNK_ROWS):
+        metrics.update(data[start:start + CHUNK_ROWS], labels[start:start + CHUNK_ROWS])
+    return metrics.to_dict(confidence)
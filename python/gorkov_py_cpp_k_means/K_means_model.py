@@ -0,0 +1,208 @@
+# saved clustering model and batch predict, new rows are assigned to the nearest center of an earlier run
+#
+# usage:
+#   python K_means_model.py model.json new_rows.csv --out scored.csv
+#
+# model file (json):
+#   {"format": "k_means_model", "version": 1, "metric": "l1", "fields": [...], "centers": [[...], ...],
+#    "scaling": {"mode", "offset", "scale"} or null, "dataset": ..., "CH_index": ...}
+#
+# the distance is the same (weighted) L1 distance the engine clusters with, so a row of the training dataset
+# gets the label of the run, for many centers (PREDICT_INDEX_MIN_CLUSTERS) the centers are grouped around
+# about sqrt(k) pivot centers, and a group is only searched for the rows its pivot distance minus the group
+# radius (triangle inequality) does not rule out, rows are scored in blocks of CHUNK_ROWS
+# imports
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from K_means_dataset import field_indexes, to_float
+from K_means_engine import CHUNK_ROWS, block_distances, nearest_centers, kmeans_plus_plus_indexes
+from K_means_scaling import scaling_weights
+from K_means_trace import span, count
+
+MODEL_FORMAT = "k_means_model"
+MODEL_VERSION = 1
+
+# distance of the model, cluster::d of the c++ engine
+METRICS = ("l1",)
+
+# number of centers from which the predict uses the center index
+PREDICT_INDEX_MIN_CLUSTERS = 64
+
+
+# fn to build the model of a result, the scaling comes from the stats of the numpy engines (the exe has none)
+def model_from_result(payload: dict, result: dict) -> dict:
+    stats = result.get("stats") or {}
+    return {
+        "format": MODEL_FORMAT,
+        "version": MODEL_VERSION,
+        "metric": "l1",
+        "fields": list(payload["fields"]),
+        "centers": np.asarray(result["centers"], dtype=np.float64).tolist(),
+        "scaling": stats.get("scaling"),
+        "dataset": payload.get("dataset"),
+        "CH_index": result.get("CH_index"),
+        "created": time.time(),
+    }
+
+
+def save_model(path: str, model: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(model, f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_model(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        model = json.load(f)
+
+    if model.get("format") != MODEL_FORMAT:
+        raise ValueError(f"{path} is not a k-means model")
+    if model.get("version", 0) > MODEL_VERSION:
+        raise ValueError(f"Model version {model['version']} is newer than this build ({MODEL_VERSION})")
+    if model.get("metric") not in METRICS:
+        raise ValueError(f"Unknown metric: {model.get('metric')}")
+    if not model.get("centers") or len(model["centers"][0]) != len(model["fields"]):
+        raise ValueError("Each center needs one coordinate per field")
+    return model
+
+
+class CenterIndex:
+    def __init__(self, centers: np.ndarray, weights: np.ndarray | None = None):
+        self.centers = centers
+        self.weights = weights
+
+        # pivots spread over the centers (k-means++ on the centers), every center belongs to its nearest pivot
+        num_groups = math.ceil(math.sqrt(centers.shape[0]))
+        pivot_indexes = kmeans_plus_plus_indexes(centers, num_groups, np.random.default_rng(0), dim_weights=weights)
+        self.pivots = centers[pivot_indexes]
+        groups, dist = nearest_centers(centers, self.pivots, weights)
+        self.members = [np.flatnonzero(groups == g) for g in range(num_groups)]
+        self.radius = np.array([dist[m].max() if m.shape[0] else 0.0 for m in self.members])
+
+    # fn to search the rows of the block in one group, the labels and distances are updated where a center is closer,
+    #   or as close with a lower index (the members are in index order), so ties go to the lower center like argmin
+    def search_group(self, block: np.ndarray, rows: np.ndarray, group: int, labels: np.ndarray, nearest: np.ndarray) -> int:
+        members = self.members[group]
+        if rows.shape[0] == 0 or members.shape[0] == 0:
+            return 0
+
+        dist = np.empty((rows.shape[0], members.shape[0]), dtype=np.float64)
+        block_distances(block[rows], self.centers[members], dist, np.empty_like(dist), self.weights)
+        best = np.argmin(dist, axis=1)
+        best_dist = dist[np.arange(rows.shape[0]), best]
+        best_labels = members[best]
+
+        closer = (best_dist < nearest[rows]) | ((best_dist == nearest[rows]) & (best_labels < labels[rows]))
+        labels[rows[closer]] = best_labels[closer]
+        nearest[rows[closer]] = best_dist[closer]
+        return dist.size
+
+    # fn to get the nearest center of every row of a block, returns the labels, distances and distance evaluations
+    def nearest(self, block: np.ndarray) -> tuple[np.ndarray, np.ndarray, int]:
+        num_rows = block.shape[0]
+        pivot_dist = np.empty((num_rows, self.pivots.shape[0]), dtype=np.float64)
+        block_distances(block, self.pivots, pivot_dist, np.empty_like(pivot_dist), self.weights)
+        evaluations = pivot_dist.size
+
+        labels = np.full(num_rows, -1, dtype=np.intp)
+        nearest = np.full(num_rows, np.inf)
+
+        # the group of the nearest pivot first, it gives a tight bound for the other groups
+        own = np.argmin(pivot_dist, axis=1)
+        for g in range(len(self.members)):
+            evaluations += self.search_group(block, np.flatnonzero(own == g), g, labels, nearest)
+
+        # d(x, c) >= d(x, pivot) - radius for every center c of the group, a group that can hold a tie is searched too
+        for g in range(len(self.members)):
+            rows = np.flatnonzero((pivot_dist[:, g] - self.radius[g] <= nearest) & (own != g))
+            evaluations += self.search_group(block, rows, g, labels, nearest)
+
+        return labels, nearest, evaluations
+
+
+# fn to assign every row to the nearest center of the model, the rows are the model fields in the dataset units
+#   returns the labels and the (weighted) L1 distance to the center
+def predict(model: dict, data: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    centers = np.asarray(model["centers"], dtype=np.float64)
+    weights = scaling_weights(model.get("scaling"))
+    data = np.asarray(data, dtype=np.float64).reshape(-1, centers.shape[1])
+
+    with span("predict"):
+        if centers.shape[0] < PREDICT_INDEX_MIN_CLUSTERS:
+            labels, nearest = nearest_centers(data, centers, weights)
+            evaluations = data.shape[0] * centers.shape[0]
+        else:
+            index = CenterIndex(centers, weights)
+            labels = np.empty(data.shape[0], dtype=np.intp)
+            nearest = np.empty(data.shape[0], dtype=np.float64)
+            evaluations = 0
+            for start in range(0, data.shape[0], CHUNK_ROWS):
+                end = min(start + CHUNK_ROWS, data.shape[0])
+                labels[start:end], nearest[start:end], block_evaluations = index.nearest(data[start:end])
+                evaluations += block_evaluations
+
+    count("rows_predicted", data.shape[0])
+    count("distance_evaluations", evaluations)
+    return labels.astype(np.int32), nearest
+
+
+# fn to score a csv, the rows are streamed in blocks and written with a "cluster" column
+#   rows with a NaN or non numeric cell in one of the model fields get an empty cluster, returns the number of rows
+def predict_csv(model: dict, dataset_path: str, out_path: str, column: str = "cluster") -> int:
+    num_rows = 0
+    tmp = out_path + ".tmp"
+    try:
+        with open(dataset_path, newline="", encoding="utf-8-sig") as src, open(tmp, "w", newline="", encoding="utf-8") as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst)
+            headers = next(reader)
+            if column in headers:
+                raise ValueError(f"The dataset already has a '{column}' column")
+            indexes = field_indexes(headers, model["fields"])
+            writer.writerow(headers + [column])
+
+            while rows := list(itertools.islice(reader, CHUNK_ROWS)):
+                block = np.array([[to_float(row[i]) if i < len(row) else math.nan for i in indexes] for row in rows], dtype=np.float64).reshape(-1, len(indexes))
+                valid = ~np.isnan(block).any(axis=1)
+
+                cells = np.full(len(rows), "", dtype=object)
+                if valid.any():
+                    labels, _ = predict(model, block[valid])
+                    cells[valid] = labels.astype(str)
+
+                # empty lines stay empty
+                writer.writerows(row + [cell] if row else row for row, cell in zip(rows, cells))
+                num_rows += len(rows)
+        os.replace(tmp, out_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    return num_rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Assign the rows of a csv to the clusters of a saved model")
+    parser.add_argument("model", help="model json written by the ui or K_means_batch.py --save-model")
+    parser.add_argument("dataset", help="csv with the model fields")
+    parser.add_argument("--out", required=True, help="csv written with the rows and their cluster")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    num_rows = predict_csv(load_model(args.model), args.dataset, args.out)
+    print(f"{num_rows} rows scored in {time.perf_counter() - start:.1f} s, results in {args.out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# process pool over a dataset in shared memory
+#
+# the dataset is copied once into a shared memory block, every pool process maps the same block
+# read-only, so the jobs get the dataset without pickling or copying it
+# imports
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from K_means_progress import POLL_INTERVAL
+from K_means_trace import tracing, merge_trace
+
+# spawn works the same on windows and linux and does not fork the ui threads
+mp_context = multiprocessing.get_context("spawn")
+
+# the dataset mapped in a pool process, set by the pool initializer
+shared_data = None
+shared_block = None
+
+# set in every pool process (restarts, k sweep or batch jobs), a pool process does not start another pool
+in_pool_process = False
+
+
+# fn to copy the dataset into a new shared memory block, the caller closes and unlinks it
+def share_dataset(data: np.ndarray) -> tuple[shared_memory.SharedMemory, tuple]:
+    # keep the column-major layout of the engine datasets
+    order = "F" if data.flags.f_contiguous and not data.flags.c_contiguous else "C"
+    block = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+    shared = np.ndarray(data.shape, dtype=data.dtype, buffer=block.buf, order=order)
+    shared[:] = data
+    return block, (block.name, data.shape, data.dtype.str, order)
+
+
+# fn to map a shared dataset, the array is read-only
+def attach_dataset(spec: tuple) -> tuple[shared_memory.SharedMemory, np.ndarray]:
+    name, shape, dtype, order = spec
+    block = shared_memory.SharedMemory(name=name)
+    data = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf, order=order)
+    data.flags.writeable = False
+    return block, data
+
+
+# fn to exit when the parent process is gone, a killed engine worker (cancel) does not leave its pool running
+def exit_with_parent():
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        parent.join()
+        os._exit(1)
+
+
+# pool initializer without a shared dataset
+def mark_pool_process():
+    global in_pool_process
+
+    in_pool_process = True
+    threading.Thread(target=exit_with_parent, daemon=True).start()
+
+
+# pool initializer, maps the dataset once per process
+def init_pool_process(spec: tuple):
+    global shared_block
+    global shared_data
+
+    mark_pool_process()
+    shared_block, shared_data = attach_dataset(spec)
+
+
+# fn that runs inside a pool process, the trace of the job goes back with its result
+def call_with_shared_data(fn, args: tuple):
+    with tracing() as trace:
+        result = fn(shared_data, *args)
+    return result, trace.to_dict()
+
+
+# fn to stop the running pool processes too, not only the queued jobs
+def terminate_pool(pool: ProcessPoolExecutor):
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+
+
+# fn to run fn(data, *job) for every job in parallel, the results are in the order of the jobs
+#
+# progress gets a "job" event for every finished job, when the jobs run here it is passed to fn too
+# (fn(data, *job, progress=...)), an exception from progress stops all jobs and is raised
+def map_shared(data: np.ndarray, fn, jobs: list[tuple], processes: int | None = None, progress=None) -> list:
+    processes = min(processes or os.cpu_count() or 1, len(jobs))
+    start = time.perf_counter()
+
+    def job_done(done: int):
+        if progress is not None:
+            progress({"event": "job", "done": done, "total": len(jobs), "elapsed": time.perf_counter() - start})
+
+    # a daemon process can not start a pool and a pool process should not start another one
+    # (k sweep with restarts, batch jobs), run the jobs one by one there
+    if processes <= 1 or multiprocessing.current_process().daemon or in_pool_process:
+        results = []
+        for job in jobs:
+            results.append(fn(data, *job, progress=progress))
+            job_done(len(results))
+        return results
+
+    block, spec = share_dataset(data)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=mp_context,
+            initializer=init_pool_process,
+            initargs=(spec,),
+        ) as pool:
+            futures = [pool.submit(call_with_shared_data, fn, job) for job in jobs]
+            try:
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    if done:
+                        job_done(len(futures) - len(pending))
+                    elif progress is not None:
+                        progress(None)
+                results = []
+                for f in futures:
+                    result, trace = f.result()
+                    merge_trace(trace)
+                    results.append(result)
+                return results
+            except BaseException:
+                terminate_pool(pool)
+                raise
+    finally:
+        block.close()
+        block.unlink()
@@ -0,0 +1,169 @@
+# helpers for the graphs
+# imports
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# views of the 3d graph, "fields" shows three chosen fields, "pca" the first three principal components
+GRAPH_VIEWS = ("fields", "pca")
+
+
+# fn to get the first three principal components of the points (mean and one row per component)
+def pca_basis(points: np.ndarray, num_components: int = 3) -> tuple[np.ndarray, np.ndarray]:
+    mean = points.mean(axis=0)
+    # the covariance is only d x d, cheap for any number of points
+    cov = np.atleast_2d(np.cov(points, rowvar=False))
+    values, vectors = np.linalg.eigh(cov)
+    order = np.argsort(values)[::-1][:num_components]
+    return mean, vectors[:, order].T
+
+
+# fn to pad the projected values with zero columns when there are less than three dimensions
+def pad_3d(values: np.ndarray) -> np.ndarray:
+    if values.shape[1] >= 3:
+        return values
+    return np.hstack([values, np.zeros((values.shape[0], 3 - values.shape[1]))])
+
+
+# fn to pad the axis titles to three
+def pad_titles(titles: list[str]) -> list[str]:
+    return titles + ["-"] * (3 - len(titles))
+
+
+# fn to project the points and centers to the three axes of the graph, returns the axis titles too
+def project_3d(points: np.ndarray, centers: np.ndarray, fields: list[str], view: str = "fields", axes: list[int] | None = None):
+    if view not in GRAPH_VIEWS:
+        raise ValueError(f"Unknown graph view: {view}")
+
+    if view == "pca" and points.shape[1] > 3:
+        mean, components = pca_basis(points)
+        titles = [f"PC{i + 1}" for i in range(components.shape[0])]
+        return pad_3d((points - mean) @ components.T), pad_3d((centers - mean) @ components.T), pad_titles(titles)
+
+    if axes is None:
+        axes = list(range(min(3, points.shape[1])))
+    titles = [fields[i] for i in axes]
+    return pad_3d(points[:, axes]), pad_3d(centers[:, axes]), pad_titles(titles)
+
+
+# graph vars, the html of every graph is cached, the dir can be moved with the K_MEANS_GRAPH_CACHE_DIR environment variable
+GRAPH_POINT_BUDGET = 20000
+GRAPH_GRID_CELLS = 32
+GRAPH_CACHE_DIR = os.environ.get("K_MEANS_GRAPH_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".k_means_cache", "graphs"))
+GRAPH_CACHE_ENTRIES = 32
+
+
+# fn to pick the points drawn in the graph, at most about budget points (None → all)
+#
+# the points are binned in a grid, every cell keeps at most q points and q is chosen so the kept
+# points fit in the budget, dense cells are thinned and sparse cells (outliers, small clusters) are kept
+def decimate(points: np.ndarray, budget: int | None, grid: int = GRAPH_GRID_CELLS, seed: int = 0) -> np.ndarray:
+    n = points.shape[0]
+    if budget is None or n <= budget:
+        return np.arange(n)
+
+    low = points.min(axis=0)
+    span = points.max(axis=0) - low
+    span[span == 0] = 1.0
+    cells = np.minimum(((points - low) / span * grid).astype(np.int64), grid - 1)
+    cell_ids = np.ravel_multi_index(cells.T, (grid,) * points.shape[1])
+    _, inverse, counts = np.unique(cell_ids, return_inverse=True, return_counts=True)
+
+    # sum(min(count, q)) grows with q, bisect it to the budget
+    low_q, high_q = 0.0, float(counts.max())
+    for _ in range(40):
+        q = (low_q + high_q) / 2
+        if np.minimum(counts, q).sum() < budget:
+            low_q = q
+        else:
+            high_q = q
+
+    keep = np.minimum(1.0, high_q / counts)[inverse]
+    return np.flatnonzero(np.random.default_rng(seed).random(n) < keep)
+
+
+# fn to build the 3d figure, one colour-mapped trace for all points and one for the centers
+def build_figure(points: np.ndarray, labels: np.ndarray, centers: np.ndarray, titles: list[str], title: str):
+    import plotly.graph_objects as go
+
+    k = centers.shape[0]
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scatter3d(
+            x=points[:, 0],
+            y=points[:, 1],
+            z=points[:, 2],
+            mode="markers",
+            name="points",
+            hovertemplate="C%{marker.color}<br>(%{x}, %{y}, %{z})<extra></extra>",
+            marker=dict(
+                size=3,
+                opacity=0.6,
+                color=labels,
+                colorscale="Turbo",
+                cmin=0,
+                cmax=max(k - 1, 1),
+                colorbar=dict(title="Cluster", tickvals=list(range(k)), ticktext=[f"C{i}" for i in range(k)]),
+            ),
+        )
+    )
+    fig.add_trace(
+        go.Scatter3d(
+            x=centers[:, 0],
+            y=centers[:, 1],
+            z=centers[:, 2],
+            mode="markers",
+            name="centers",
+            text=[f"C{i} center" for i in range(k)],
+            marker=dict(size=6, symbol="x", color="black"),
+        )
+    )
+    fig.update_layout(
+        title=title,
+        scene=dict(xaxis_title=titles[0], yaxis_title=titles[1], zaxis_title=titles[2]),
+        margin=dict(l=0, r=0, b=0, t=40),
+        showlegend=False,
+    )
+    return fig
+
+
+# fn to get the key of a graph from everything drawn in it
+def graph_key(points: np.ndarray, labels: np.ndarray, centers: np.ndarray, titles: list[str], title: str, budget: int | None) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for values in (points, labels, centers):
+        h.update(np.ascontiguousarray(values).tobytes())
+    h.update(json.dumps([titles, title, budget]).encode("utf-8"))
+    return h.hexdigest()
+
+
+# fn to remove the oldest graphs when the cache has more than GRAPH_CACHE_ENTRIES
+def evict_graphs():
+    paths = sorted(
+        (os.path.join(GRAPH_CACHE_DIR, name) for name in os.listdir(GRAPH_CACHE_DIR) if name.endswith(".html")),
+        key=os.path.getmtime,
+    )
+    for p in paths[:-GRAPH_CACHE_ENTRIES]:
+        os.remove(p)
+
+
+# fn to get the html file of the graph, built only when the same graph is not in the cache
+def render_graph_html(points: np.ndarray, labels: np.ndarray, centers: np.ndarray, titles: list[str], title: str = "K-means graph 3D", budget: int | None = GRAPH_POINT_BUDGET) -> str:
+    path = os.path.join(GRAPH_CACHE_DIR, graph_key(points, labels, centers, titles, title, budget) + ".html")
+
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    kept = decimate(points, budget)
+    if kept.shape[0] < points.shape[0]:
+        title = f"{title} ({kept.shape[0]} of {points.shape[0]} points)"
+
+    os.makedirs(GRAPH_CACHE_DIR, exist_ok=True)
+    fig = build_figure(points[kept], labels[kept], centers, titles, title)
+    # plotly.min.js is written once next to the graphs, not into every html file
+    fig.write_html(path + ".tmp", include_plotlyjs="directory", full_html=True)
+    os.replace(path + ".tmp", path)
+    evict_graphs()
+    return path
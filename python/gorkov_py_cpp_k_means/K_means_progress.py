@@ -0,0 +1,37 @@
+# progress events, cancellation and timeout of a clustering run
+#
+# the engines call progress(event) while they run, the events are dicts:
+#   {"event": "iteration", "iteration": 3, "eps": 0.0012, "elapsed": 0.41}   one lloyd iteration / mini-batch pass
+#   {"event": "job", "done": 2, "total": 8, "elapsed": 1.7}                  restarts and k sweep jobs
+# progress(None) is a heartbeat from the callers that wait on a process, it only checks the cancellation
+#
+# the callback stops the run by raising Cancelled, in-process runs unwind from the next event and the
+# worker, the exe and the pool processes are killed
+# imports
+import time
+
+# seconds between the checks while waiting on a process
+POLL_INTERVAL = 0.1
+
+
+# raised when the run is cancelled or over its timeout
+class Cancelled(Exception):
+    pass
+
+
+# fn to wrap the progress callback with the cancel event and the timeout (seconds), None when there is nothing to do
+def progress_guard(progress=None, cancel=None, timeout: float | None = None):
+    if progress is None and cancel is None and timeout is None:
+        return None
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def guard(event: dict | None):
+        if cancel is not None and cancel.is_set():
+            raise Cancelled("K-means run was cancelled")
+        if deadline is not None and time.monotonic() > deadline:
+            raise Cancelled(f"K-means run timed out after {timeout} s")
+        if progress is not None and event is not None:
+            progress(event)
+
+    return guard
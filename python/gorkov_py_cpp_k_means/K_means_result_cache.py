@@ -0,0 +1,158 @@
+# result cache, a repeated run with the same configuration returns the stored result
+#
+# the key is the content hash of the dataset (see K_means_dataset.py) and every payload option that
+# changes the result, runs that pick their centers at random are cached only with a fixed seed, exe results
+# are also keyed by the path, size and modification time of the exe so another build does not get them
+#
+# cache layout:
+#   <cache dir>/index.json      key -> size, LRU info and stats of every entry, hit/miss counters
+#   <cache dir>/<key>.kmb       binary result (see K_means_transport.py)
+# imports
+import hashlib
+import json
+import os
+import threading
+import time
+
+from K_means_dataset import get_fingerprint, stat_key, temp_path
+from K_means_transport import pack_result, unpack_result
+
+# cache vars, the dir can be moved with the K_MEANS_RESULT_CACHE_DIR environment variable
+RESULT_CACHE_DIR = os.environ.get("K_MEANS_RESULT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".k_means_cache", "results"))
+RESULT_CACHE_BUDGET_BYTES = 256 << 20
+
+# payload options that change the result, the output format and the progress flag do not
+RESULT_OPTIONS = ("fields", "numClusters", "centers", "seed", "init", "nInit", "selectBy", "kRange", "warmStart", "mode", "batchSize", "assignment", "scaling", "silhouetteSample", "silhouetteConfidence")
+
+# the ui and the batch runner run from threads, index updates go through this lock
+result_cache_lock = threading.Lock()
+
+
+# fn to check if the run gives the same result every time
+def is_deterministic(payload: dict) -> bool:
+    if payload.get("seed") is not None:
+        return True
+    # given centers, nothing is random unless the k sweep picks new ones
+    return bool(payload.get("centers")) and not payload.get("kRange")
+
+
+# fn to get the cache key of a run, None when the run can not be cached
+def result_key(payload: dict, engine: str, exe_path: str | None = None) -> str | None:
+    if not is_deterministic(payload):
+        return None
+
+    # the exe computes in float32, the numpy engine and the worker give the same results
+    options = {name: payload[name] for name in RESULT_OPTIONS if name in payload}
+    key = {
+        "dataset": get_fingerprint(payload["dataset"]),
+        "engine": "exe" if engine == "exe" else "numpy",
+        "options": options,
+    }
+    if engine == "exe":
+        try:
+            key["exe"] = stat_key(exe_path)
+        except (OSError, TypeError):
+            return None
+    return hashlib.blake2b(json.dumps(key, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+# index fns
+def result_index_path() -> str:
+    return os.path.join(RESULT_CACHE_DIR, "index.json")
+
+
+def read_result_index() -> dict:
+    try:
+        with open(result_index_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"hits": 0, "misses": 0, "entries": {}}
+
+
+def write_result_index(index: dict):
+    os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+    tmp = temp_path(result_index_path())
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp, result_index_path())
+
+
+# fn to remove the least recently used results until the cache fits in the budget
+def evict_results(index: dict, keep: str):
+    total = sum(e["size"] for e in index["entries"].values())
+    by_age = sorted(index["entries"].items(), key=lambda item: item[1]["last_used"])
+
+    for key, entry in by_age:
+        if total <= RESULT_CACHE_BUDGET_BYTES:
+            break
+        if key == keep:
+            continue
+
+        try:
+            os.remove(os.path.join(RESULT_CACHE_DIR, key + ".kmb"))
+        except OSError:
+            pass
+        total -= entry["size"]
+        del index["entries"][key]
+
+
+# fn to get a stored result (CH_index, centers, labels, stats), None on a miss
+def get_result(key: str) -> dict | None:
+    with result_cache_lock:
+        index = read_result_index()
+        entry = index["entries"].get(key)
+
+        result = None
+        if entry is not None:
+            try:
+                with open(os.path.join(RESULT_CACHE_DIR, key + ".kmb"), "rb") as f:
+                    result = unpack_result(f.read())
+            except (OSError, ValueError):
+                del index["entries"][key]
+
+        if result is None:
+            index["misses"] += 1
+        else:
+            index["hits"] += 1
+            entry["last_used"] = time.time()
+            result["stats"] = dict(entry["stats"], cached=True)
+        write_result_index(index)
+
+        return result
+
+
+# fn to store a result
+def put_result(key: str, result: dict):
+    buf = pack_result(result["CH_index"], result["centers"], result["labels"])
+
+    with result_cache_lock:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        p = os.path.join(RESULT_CACHE_DIR, key + ".kmb")
+        tmp = temp_path(p)
+        with open(tmp, "wb") as f:
+            f.write(buf)
+        os.replace(tmp, p)
+
+        index = read_result_index()
+        index["entries"][key] = {
+            "last_used": time.time(),
+            "size": len(buf),
+            "stats": result.get("stats", {}),
+        }
+        evict_results(index, key)
+        write_result_index(index)
+
+
+# fn to get the hit/miss counters and the size of the cache
+def result_cache_stats() -> dict:
+    with result_cache_lock:
+        index = read_result_index()
+
+    lookups = index["hits"] + index["misses"]
+    return {
+        "hits": index["hits"],
+        "misses": index["misses"],
+        "hit_rate": index["hits"] / lookups if lookups else 0.0,
+        "entries": len(index["entries"]),
+        "bytes": sum(e["size"] for e in index["entries"].values()),
+    }
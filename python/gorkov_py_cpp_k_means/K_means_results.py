@@ -0,0 +1,187 @@
+# result view of a clustering for the ui, the points are never turned into one big list or string
+#
+# the summary of every cluster (size, center, spread, bounding box) is computed once in one blocked pass over
+# the rows, the point table fetches one page of rows at a time, either all rows in file order or the rows of
+# one cluster, the rows of a cluster are found block by block only as far as the requested page needs
+#
+# the mini-batch mode never loads the dataset, its view (StreamedResultView) streams the csv for the summaries
+# and for every page, and keeps only a uniform sample of GRAPH_SAMPLE_ROWS rows for the graph
+# imports
+import numpy as np
+
+from K_means_dataset import iter_csv_batches
+
+# rows on one page of the point table
+PAGE_ROWS = 50
+
+# rows in one block, same as the engine
+CHUNK_ROWS = 65536
+
+# rows of the graph sample of a streamed view
+GRAPH_SAMPLE_ROWS = 100000
+
+
+# fn to calculate the size, spread (root mean square distance to the center) and bounding box of every cluster
+def cluster_summaries(data: np.ndarray, centers: np.ndarray, labels: np.ndarray) -> list[dict]:
+    blocks = ((data[start:start + CHUNK_ROWS], labels[start:start + CHUNK_ROWS]) for start in range(0, data.shape[0], CHUNK_ROWS))
+    return summaries_from_blocks(blocks, centers)
+
+
+# fn to calculate the summaries from the blocks of rows and their labels
+def summaries_from_blocks(blocks, centers: np.ndarray) -> list[dict]:
+    num_clusters, num_dims = centers.shape
+    counts = np.zeros(num_clusters, dtype=np.int64)
+    sq_dist = np.zeros(num_clusters, dtype=np.float64)
+    mins = np.full((num_clusters, num_dims), np.inf)
+    maxs = np.full((num_clusters, num_dims), -np.inf)
+
+    for block, block_labels in blocks:
+        block = np.asarray(block, dtype=np.float64)
+        if block.shape[0] == 0:
+            continue
+
+        diff = block - centers[block_labels]
+        counts += np.bincount(block_labels, minlength=num_clusters)
+        sq_dist += np.bincount(block_labels, weights=np.einsum("ij,ij->i", diff, diff), minlength=num_clusters)
+
+        # the rows of the block sorted by cluster, min and max of every run of the same cluster
+        order = np.argsort(block_labels, kind="stable")
+        sorted_labels = block_labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        present = sorted_labels[starts]
+        sorted_block = block[order]
+        mins[present] = np.minimum(mins[present], np.minimum.reduceat(sorted_block, starts))
+        maxs[present] = np.maximum(maxs[present], np.maximum.reduceat(sorted_block, starts))
+
+    summaries = []
+    for c in range(num_clusters):
+        size = int(counts[c])
+        summaries.append({
+            "size": size,
+            "center": centers[c].tolist(),
+            "spread": float(np.sqrt(sq_dist[c] / size)) if size else float("nan"),
+            "min": mins[c].tolist() if size else [float("nan")] * num_dims,
+            "max": maxs[c].tolist() if size else [float("nan")] * num_dims,
+        })
+    return summaries
+
+
+class ResultView:
+    def __init__(self, data: np.ndarray, centers, labels: np.ndarray):
+        if labels.shape[0] != data.shape[0]:
+            raise ValueError(f"Result has {labels.shape[0]} labels but the dataset has {data.shape[0]} rows")
+
+        self.data = data
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, data.shape[1])
+        self.labels = labels
+        self.summaries = cluster_summaries(data, self.centers, labels)
+
+        # rows of a cluster found so far and the first row that is not scanned yet
+        self.found = {}
+
+    # number of rows in the table, all rows or the rows of one cluster
+    def num_rows(self, cluster: int | None = None) -> int:
+        if cluster is None:
+            return self.labels.shape[0]
+        return self.summaries[cluster]["size"]
+
+    def num_pages(self, cluster: int | None = None, page_rows: int = PAGE_ROWS) -> int:
+        return max(1, -(-self.num_rows(cluster) // page_rows))
+
+    # fn to get the first needed rows of a cluster, the labels are scanned block by block only as far as needed
+    def cluster_rows(self, cluster: int, needed: int) -> np.ndarray:
+        rows, scanned = self.found.get(cluster, (np.empty(0, dtype=np.int64), 0))
+        num_points = self.labels.shape[0]
+
+        blocks = [rows]
+        have = rows.shape[0]
+        while have < needed and scanned < num_points:
+            end = min(scanned + CHUNK_ROWS, num_points)
+            block_rows = np.flatnonzero(self.labels[scanned:end] == cluster) + scanned
+            blocks.append(block_rows)
+            have += block_rows.shape[0]
+            scanned = end
+
+        if len(blocks) > 1:
+            rows = np.concatenate(blocks)
+            self.found[cluster] = (rows, scanned)
+        return rows[:needed]
+
+    # fn to get one page of the table, returns the row numbers, the labels and the values of the rows
+    def page(self, page: int, cluster: int | None = None, page_rows: int = PAGE_ROWS) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        start = page * page_rows
+        if cluster is None:
+            rows = np.arange(start, min(start + page_rows, self.labels.shape[0]))
+        else:
+            rows = self.cluster_rows(cluster, start + page_rows)[start:]
+        return rows, self.labels[rows], self.row_values(rows)
+
+    # fn to get the values of the rows (ascending row numbers)
+    def row_values(self, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(self.data[rows])
+
+    # fn to get the points and labels drawn in the graph
+    def graph_points(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.data, self.labels
+
+
+class StreamedResultView(ResultView):
+    def __init__(self, dataset_path: str, fields: list[str], centers, labels: np.ndarray, seed: int | None = None):
+        self.dataset_path = dataset_path
+        self.fields = fields
+        self.data = None
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, len(fields))
+        self.labels = labels
+        self.found = {}
+
+        # the rows of the graph sample are chosen before the pass, they are picked up while the csv is streamed
+        num_points = labels.shape[0]
+        rng = np.random.default_rng(seed)
+        self.sample_rows = np.sort(rng.choice(num_points, min(num_points, GRAPH_SAMPLE_ROWS), replace=False))
+        self.sample = np.empty((self.sample_rows.shape[0], len(fields)), dtype=np.float64)
+
+        self.summaries = summaries_from_blocks(self.iter_blocks(), self.centers)
+        num_valid = sum(summary["size"] for summary in self.summaries)
+        if num_valid != num_points:
+            raise ValueError(f"Result has {num_points} labels but the dataset has {num_valid} valid rows")
+
+    # fn to stream the valid rows of the csv with their labels, the graph sample is filled on the way
+    def iter_blocks(self):
+        start = 0
+        for block in iter_csv_batches(self.dataset_path, self.fields, CHUNK_ROWS):
+            end = start + block.shape[0]
+            if end > self.labels.shape[0]:
+                raise ValueError(f"Result has {self.labels.shape[0]} labels but the dataset has more valid rows")
+
+            lo, hi = np.searchsorted(self.sample_rows, [start, end])
+            self.sample[lo:hi] = block[self.sample_rows[lo:hi] - start]
+            yield block, self.labels[start:end]
+            start = end
+
+    # fn to get the values of the rows (ascending row numbers), the csv is read only up to the last row
+    def row_values(self, rows: np.ndarray) -> np.ndarray:
+        values = np.empty((rows.shape[0], len(self.fields)), dtype=np.float64)
+        if rows.shape[0] == 0:
+            return values
+
+        start = 0
+        for block in iter_csv_batches(self.dataset_path, self.fields, CHUNK_ROWS):
+            end = start + block.shape[0]
+            lo, hi = np.searchsorted(rows, [start, end])
+            values[lo:hi] = block[rows[lo:hi] - start]
+            if hi == rows.shape[0]:
+                break
+            start = end
+        return values
+
+    def graph_points(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.sample, self.labels[self.sample_rows]
+
+
+# fn to build the view from the C0, C1, ... point lists of the debug json output of the exe
+def result_view_from_clusters(clusters: list[list], centers) -> ResultView:
+    num_dims = len(centers[0]) if len(centers) else 0
+    sizes = [len(cluster) for cluster in clusters]
+    points = np.array([p for cluster in clusters for p in cluster], dtype=np.float64).reshape(-1, num_dims)
+    labels = np.repeat(np.arange(len(sizes), dtype=np.int32), sizes)
+    return ResultView(points, centers, labels)
@@ -0,0 +1,134 @@
+# feature scaling, columns in very different units (price vs mpg) would decide the L1 distance alone
+#
+# modes:
+#   "zscore"  (x - mean) / std
+#   "minmax"  (x - min) / (max - min)
+#   "robust"  (x - median) / (q3 - q1)
+#
+# the scaled data is never built, the engine weights every dimension of the L1 distance with 1 / scale
+# (the offsets cancel in x - c), so the centers stay in the original units of the dataset
+#
+# the statistics of the fields are computed in one streaming pass (ColumnStats) over the rows the engine
+# clusters (no NaN in any of the fields, in the full and the mini-batch mode) and stored with the parsed
+# columns in the dataset cache, the quartiles come from a sample of at most STATS_SAMPLE_ROWS rows
+# imports
+import numpy as np
+
+SCALING_MODES = ("none", "zscore", "minmax", "robust")
+
+# rows kept for the quartiles, smaller columns get exact quartiles
+STATS_SAMPLE_ROWS = 1 << 20
+
+# rows per update when a whole column is read
+STATS_CHUNK_ROWS = 1 << 20
+
+
+class ColumnStats:
+    def __init__(self, num_columns: int):
+        self.count = 0
+        self.mean = np.zeros(num_columns, dtype=np.float64)
+        self.m2 = np.zeros(num_columns, dtype=np.float64)
+        self.min = np.full(num_columns, np.inf)
+        self.max = np.full(num_columns, -np.inf)
+
+        # reservoir sample (algorithm R) in a buffer of STATS_SAMPLE_ROWS rows, allocated once
+        self.rng = np.random.default_rng(0)
+        self.sample = np.empty((STATS_SAMPLE_ROWS, num_columns), dtype=np.float64)
+        self.filled = 0
+
+    # add a block of rows without NaN, mean and variance are merged with the parallel (Chan) update
+    def update(self, block: np.ndarray):
+        n = block.shape[0]
+        if n == 0:
+            return
+
+        self.add_to_sample(block)
+
+        block_mean = block.mean(axis=0)
+        block_m2 = ((block - block_mean) ** 2).sum(axis=0)
+        total = self.count + n
+        delta = block_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += block_m2 + delta * delta * self.count * n / total
+        self.count = total
+
+        np.minimum(self.min, block.min(axis=0), out=self.min)
+        np.maximum(self.max, block.max(axis=0), out=self.max)
+
+    # the rows fill the buffer first, after that row i (counted from 0 over all blocks) replaces a random slot
+    # of the buffer with probability STATS_SAMPLE_ROWS / (i + 1)
+    def add_to_sample(self, block: np.ndarray):
+        free = min(STATS_SAMPLE_ROWS - self.filled, block.shape[0])
+        self.sample[self.filled:self.filled + free] = block[:free]
+        self.filled += free
+
+        rest = block[free:]
+        if rest.shape[0] == 0:
+            return
+
+        seen = self.count + free + np.arange(rest.shape[0])
+        slots = self.rng.integers(0, seen + 1)
+        replacing = np.flatnonzero(slots < STATS_SAMPLE_ROWS)
+        # a slot drawn twice in the block keeps the later row, like one row after another
+        slots, last = np.unique(slots[replacing][::-1], return_index=True)
+        self.sample[slots] = rest[replacing[::-1][last]]
+
+    # statistics of every column
+    def to_list(self) -> list[dict]:
+        if self.count == 0:
+            raise ValueError("Column has no numeric values")
+
+        q1, median, q3 = np.percentile(self.sample[:self.filled], [25.0, 50.0, 75.0], axis=0)
+        std = np.sqrt(self.m2 / self.count)
+        return [
+            {
+                "count": self.count,
+                "mean": float(self.mean[j]),
+                "std": float(std[j]),
+                "min": float(self.min[j]),
+                "max": float(self.max[j]),
+                "q1": float(q1[j]),
+                "median": float(median[j]),
+                "q3": float(q3[j]),
+            }
+            for j in range(self.mean.shape[0])
+        ]
+
+
+# fn to get the statistics of the columns, rows with a NaN in any of the columns are skipped
+def column_stats(columns: list[np.ndarray]) -> list[dict]:
+    stats = ColumnStats(len(columns))
+    for start in range(0, columns[0].shape[0], STATS_CHUNK_ROWS):
+        chunk = np.column_stack([np.asarray(column[start:start + STATS_CHUNK_ROWS]) for column in columns])
+        stats.update(chunk[~np.isnan(chunk).any(axis=1)])
+    return stats.to_list()
+
+
+# fn to get the offset and the scale of every field from the column statistics
+def scaling_from_stats(stats: list[dict], mode: str) -> dict:
+    if mode not in SCALING_MODES:
+        raise ValueError(f"Unknown scaling mode: {mode}")
+
+    if mode == "zscore":
+        offset = [s["mean"] for s in stats]
+        scale = [s["std"] for s in stats]
+    elif mode == "minmax":
+        offset = [s["min"] for s in stats]
+        scale = [s["max"] - s["min"] for s in stats]
+    elif mode == "robust":
+        offset = [s["median"] for s in stats]
+        scale = [s["q3"] - s["q1"] for s in stats]
+    else:
+        offset = [0.0] * len(stats)
+        scale = [1.0] * len(stats)
+
+    # a constant column has nothing to scale
+    scale = [value if value > 0.0 else 1.0 for value in scale]
+    return {"mode": mode, "offset": offset, "scale": scale}
+
+
+# fn to get the distance weights (1 / scale) of a scaling, None for no scaling
+def scaling_weights(scaling: dict | None) -> np.ndarray | None:
+    if scaling is None or scaling["mode"] == "none":
+        return None
+    return 1.0 / np.asarray(scaling["scale"], dtype=np.float64)
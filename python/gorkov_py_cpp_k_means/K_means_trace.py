@@ -0,0 +1,180 @@
+# instrumentation of a run, phase spans and counters
+#
+# a run is traced with `with tracing() as trace:`, the engine code inside it calls span(name) and
+# count(name, value) and the calls are no-ops when there is no active trace, trace.to_dict() gives:
+#   {"spans": [{"name": "csv_load", "start": 0.0, "seconds": 0.012, "pid": ...}, ...],
+#    "counters": {"rows_loaded": 17379, "nan_rows_skipped": 0, "iterations": 29, ...},
+#    "iterations": [{"iteration": 1, "eps": 0.31}, ...],
+#    "seconds": 0.2, "peak_memory_bytes": ...}
+#
+# the trace is per thread (contextvars), the worker and the pool processes send their trace back and
+# it is merged into the trace of the caller
+# imports
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# logging, the level comes from the K_MEANS_LOG_LEVEL environment variable (WARNING by default)
+LOG_LEVEL = os.environ.get("K_MEANS_LOG_LEVEL", "WARNING").upper()
+
+# the trace of the run in this thread
+current_trace = contextvars.ContextVar("k_means_trace", default=None)
+
+# jsonl exports from the ui threads and the batch runner go through this lock
+export_lock = threading.Lock()
+
+
+# fn to get the peak resident memory of this process in bytes, None when the platform has no way to read it
+def peak_memory_bytes() -> int | None:
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # linux reports kilobytes, macos bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+
+    return None
+
+
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self.iterations = []
+        self.peak_memory = None
+
+    # add the trace of another process (worker, pool process)
+    def merge(self, other: dict):
+        self.spans.extend(other["spans"])
+        for name, value in other["counters"].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.iterations.extend(other["iterations"])
+        if other.get("peak_memory_bytes") is not None:
+            self.peak_memory = max(self.peak_memory or 0, other["peak_memory_bytes"])
+
+    def to_dict(self) -> dict:
+        peak = peak_memory_bytes()
+        if self.peak_memory is not None:
+            peak = max(peak or 0, self.peak_memory)
+
+        return {
+            "spans": self.spans,
+            "counters": self.counters,
+            "iterations": self.iterations,
+            "seconds": time.perf_counter() - self.start,
+            "peak_memory_bytes": peak,
+        }
+
+
+# context manager that makes a new trace the active one
+@contextlib.contextmanager
+def tracing():
+    trace = Trace()
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+# context manager for a phase of the run
+@contextlib.contextmanager
+def span(name: str):
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append({
+            "name": name,
+            "start": start - trace.start,
+            "seconds": time.perf_counter() - start,
+            "pid": os.getpid(),
+        })
+
+
+# fn to add to a counter
+def count(name: str, value: int = 1):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + int(value)
+
+
+# fn to record the max center shift of an iteration
+def record_iteration(iteration: int, eps: float):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.iterations.append({"iteration": iteration, "eps": eps})
+
+
+# fn to merge the trace of another process into the active trace
+def merge_trace(other: dict | None):
+    trace = current_trace.get()
+    if trace is not None and other is not None:
+        trace.merge(other)
+
+
+# fn to append a trace as one json line
+def export_jsonl(path: str, record: dict):
+    line = json.dumps(record)
+    with export_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# fn to set up the logging of the app and the batch runner
+def setup_logging(level: str = LOG_LEVEL):
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+
+# fn to get a one line summary of a trace for the logs, time per phase and the counters
+def trace_summary(trace: dict) -> str:
+    phases = {}
+    for s in trace["spans"]:
+        phases[s["name"]] = phases.get(s["name"], 0.0) + s["seconds"]
+
+    parts = [f"{name} {seconds * 1000:.1f} ms" for name, seconds in phases.items()]
+    parts += [f"{name}={value}" for name, value in trace["counters"].items()]
+    if trace.get("peak_memory_bytes") is not None:
+        parts.append(f"peak memory {trace['peak_memory_bytes'] / (1 << 20):.1f} MiB")
+    return ", ".join(parts)
@@ -0,0 +1,104 @@
+# compact binary result format shared by the engines and the ui
+#
+# layout (little-endian):
+#   magic        4 bytes  b"KMB1"
+#   num_points   uint32
+#   num_clusters uint32
+#   num_dims     uint32
+#   ch_index     float64
+#   centers      float64[num_clusters * num_dims]
+#   labels       int32[num_points]
+#
+# the points are not sent, the reader already has the dataset and the labels are in row order
+# imports
+import struct
+
+import numpy as np
+
+MAGIC = b"KMB1"
+HEADER = struct.Struct("<4sIIId")
+
+
+# fn to check if a buffer holds a binary result
+def is_binary_result(buf: bytes) -> bool:
+    return bytes(buf[:len(MAGIC)]) == MAGIC
+
+
+# fn to pack a result into bytes
+def pack_result(ch_index: float, centers: np.ndarray, labels: np.ndarray) -> bytes:
+    centers = np.ascontiguousarray(centers, dtype="<f8")
+    labels = np.ascontiguousarray(labels, dtype="<i4")
+    num_clusters, num_dims = centers.shape
+
+    header = HEADER.pack(MAGIC, labels.shape[0], num_clusters, num_dims, ch_index)
+    return header + centers.tobytes() + labels.tobytes()
+
+
+# fn to read a result from bytes, the arrays are views over the buffer (no copy)
+def unpack_result(buf) -> dict:
+    magic, num_points, num_clusters, num_dims, ch_index = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("Buffer is not a binary k-means result")
+
+    offset = HEADER.size
+    centers = np.frombuffer(buf, dtype="<f8", count=num_clusters * num_dims, offset=offset)
+    offset += centers.nbytes
+    labels = np.frombuffer(buf, dtype="<i4", count=num_points, offset=offset)
+
+    return {
+        "CH_index": ch_index,
+        "centers": centers.reshape(num_clusters, num_dims),
+        "labels": labels,
+    }
+
+
+# fn to join a binary result with the dataset rows and build the CH_index/centers/C{i} dict
+def result_to_dict(data: np.ndarray, result: dict) -> dict:
+    labels = result["labels"]
+    if labels.shape[0] != data.shape[0]:
+        raise ValueError(f"Result has {labels.shape[0]} labels but the dataset has {data.shape[0]} rows")
+
+    centers = result["centers"]
+    out = {
+        "CH_index": result["CH_index"],
+        "centers": centers.tolist(),
+    }
+    for i in range(centers.shape[0]):
+        out[f"C{i}"] = data[labels == i].tolist()
+
+    # engine counters (iterations, distance evaluations), only the in-process engines have them
+    if "stats" in result:
+        out["stats"] = result["stats"]
+
+    return out
+
+
+# fn to get the binary result arrays from the CH_index/centers/C{i} json of an exe build without the binary
+# output (release_build_v1.0.exe), every dataset row is matched with the cluster point of the same float32 value
+def result_from_dict(data: np.ndarray, result: dict) -> dict:
+    centers = np.array(result["centers"], dtype=np.float64)
+    if centers.ndim == 1:
+        centers = centers.reshape(-1, data.shape[1])
+    num_dims = centers.shape[1]
+
+    clusters = [np.array(result.get(f"C{i}", []), dtype=np.float32).reshape(-1, num_dims) for i in range(centers.shape[0])]
+    points = np.concatenate(clusters)
+    point_labels = np.repeat(np.arange(len(clusters), dtype=np.int32), [c.shape[0] for c in clusters])
+    if points.shape[0] != data.shape[0]:
+        raise ValueError(f"Result has {points.shape[0]} points but the dataset has {data.shape[0]} rows")
+
+    # the rows as raw float32 bytes, equal points have equal keys (a point is only in one cluster)
+    row_key = np.dtype((np.void, 4 * num_dims))
+    point_keys = np.ascontiguousarray(points).view(row_key).ravel()
+    data_keys = np.ascontiguousarray(data, dtype=np.float32).view(row_key).ravel()
+
+    order = np.argsort(point_keys, kind="stable")
+    found = np.minimum(np.searchsorted(point_keys[order], data_keys), order.shape[0] - 1)
+    if not np.array_equal(point_keys[order][found], data_keys):
+        raise ValueError("The points of the result do not match the dataset rows")
+
+    return {
+        "CH_index": result["CH_index"],
+        "centers": centers,
+        "labels": point_labels[order][found],
+    }
@@ -0,0 +1,224 @@
+# long-lived engine worker, started once and reused for every run
+#
+# protocol over a multiprocessing pipe, every request gets one (status, value) reply:
+#   {"cmd": "ping"}                  -> ("ok", {"pid": ..., "datasets": [...]})
+#   {"cmd": "run", "payload": {...}} -> ("ok", (binary result bytes, stats, trace)) or ("error", error)
+#                                       with "progress": true ("progress", event) messages come before the reply
+#   the error is {"type": ..., "message": ..., "input": ..., "traceback": ...}, input errors (ValueError) are
+#   raised as ValueError by KMeansWorker.run and everything else as RuntimeError
+#   {"cmd": "stop"}                  -> ("ok", None) and the worker exits
+# imports
+import multiprocessing
+import os
+import threading
+import traceback
+from collections import OrderedDict
+
+from K_means_dataset import load_dataset, stat_key
+from K_means_engine import run_kmeans_on_data, run_minibatch
+from K_means_progress import POLL_INTERVAL
+from K_means_trace import tracing, span, merge_trace
+from K_means_transport import pack_result, unpack_result
+
+# number of loaded datasets kept in the worker memory
+WARM_DATASETS = 4
+
+# seconds to wait for the worker to answer a ping
+PING_TIMEOUT = 5.0
+
+# spawn works the same on windows and linux and does not fork the ui threads
+mp_context = multiprocessing.get_context("spawn")
+
+
+# fn to get a dataset from the warm datasets or load it, the least recently used one is dropped
+def get_warm_dataset(datasets: OrderedDict, dataset_path: str, fields: list[str]):
+    key = (stat_key(dataset_path), tuple(fields))
+    if key in datasets:
+        datasets.move_to_end(key)
+        return datasets[key]
+
+    data = load_dataset(dataset_path, fields)
+    datasets[key] = data
+    while len(datasets) > WARM_DATASETS:
+        datasets.popitem(last=False)
+    return data
+
+
+# fn to get the error reply of an exception
+def error_reply(e: Exception) -> tuple[str, dict]:
+    return "error", {
+        "type": type(e).__name__,
+        "message": str(e),
+        "input": isinstance(e, ValueError),
+        "traceback": traceback.format_exc(),
+    }
+
+
+# the loop that runs inside the worker process
+def worker_loop(conn):
+    datasets = OrderedDict()
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        cmd = request.get("cmd")
+        if cmd == "stop":
+            conn.send(("ok", None))
+            break
+
+        if cmd == "ping":
+            conn.send(("ok", {"pid": os.getpid(), "datasets": [key[0] for key in datasets]}))
+            continue
+
+        if cmd == "run":
+            try:
+                payload = request["payload"]
+                if not payload.get("fields"):
+                    raise ValueError("fields are required")
+
+                # the events go to the ui as they happen, a cancelled run is stopped by killing this process
+                progress = None
+                if request.get("progress"):
+                    progress = lambda event: conn.send(("progress", event))
+
+                with tracing() as trace:
+                    # the mini-batch mode streams the csv, it does not use the warm datasets
+                    if payload.get("mode") == "minibatch":
+                        result = run_minibatch(payload, progress)
+                    else:
+                        data = get_warm_dataset(datasets, payload["dataset"], payload["fields"])
+                        result = run_kmeans_on_data(data, payload, progress)
+                    with span("serialization"):
+                        buf = pack_result(result["CH_index"], result["centers"], result["labels"])
+                conn.send(("ok", (buf, result["stats"], trace.to_dict())))
+            except Exception as e:
+                conn.send(error_reply(e))
+            continue
+
+        conn.send(("error", {"type": "RuntimeError", "message": f"Unknown command: {cmd}", "input": False, "traceback": ""}))
+
+    conn.close()
+
+
+class KMeansWorker:
+    def __init__(self):
+        self.process = None
+        self.conn = None
+        # one request at a time on the pipe
+        self.lock = threading.Lock()
+
+    # start the worker process, not as a daemon so it can start the restart and k sweep pool
+    #   it is stopped with stop() (at exit of the ui or the batch runner) and exits by itself when the pipe closes
+    def start(self):
+        parent_conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(target=worker_loop, args=(child_conn,), daemon=False)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    # stop the worker process, kill it if it does not exit by itself
+    def stop(self):
+        if self.process is None:
+            return
+
+        try:
+            self.conn.send({"cmd": "stop"})
+            if self.conn.poll(PING_TIMEOUT):
+                self.conn.recv()
+        except (EOFError, OSError):
+            pass
+
+        self.process.join(PING_TIMEOUT)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    # kill the worker process without waiting for it, used to stop a cancelled run
+    def kill(self):
+        if self.process is None:
+            return
+
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    # send one request and wait for the reply, raises on a dead worker or a timeout
+    def request(self, message: dict, timeout: float | None = None):
+        self.conn.send(message)
+        if not self.conn.poll(timeout):
+            raise TimeoutError("K-means worker did not answer in time")
+        return self.conn.recv()
+
+    # health check
+    def ping(self, timeout: float = PING_TIMEOUT) -> dict | None:
+        with self.lock:
+            if self.process is None or not self.process.is_alive():
+                return None
+            try:
+                status, info = self.request({"cmd": "ping"}, timeout)
+            except (EOFError, OSError, TimeoutError):
+                return None
+            return info if status == "ok" else None
+
+    # start or restart the worker when the health check fails
+    def ensure_alive(self):
+        if self.ping() is None:
+            with self.lock:
+                self.restart()
+
+    # wait for the reply of a run, the progress events before it go to progress
+    def wait_reply(self, progress):
+        while True:
+            if not self.conn.poll(POLL_INTERVAL):
+                if progress is not None:
+                    progress(None)
+                continue
+
+            status, value = self.conn.recv()
+            if status != "progress":
+                return status, value
+            if progress is not None:
+                progress(value)
+
+    # run a clustering job, the worker is restarted once if it died
+    #   when progress raises (cancel, timeout) the worker is killed and started again on the next run
+    def run(self, payload: dict, progress=None) -> dict:
+        with self.lock:
+            for attempt in range(2):
+                if self.process is None or not self.process.is_alive():
+                    self.restart()
+                try:
+                    self.conn.send({"cmd": "run", "payload": payload, "progress": progress is not None})
+                    status, value = self.wait_reply(progress)
+                    break
+                except (EOFError, OSError):
+                    if attempt == 1:
+                        raise RuntimeError("K-means worker died while running the job")
+                    self.restart()
+                except BaseException:
+                    self.kill()
+                    raise
+
+        if status != "ok":
+            if value["input"]:
+                raise ValueError(value["message"])
+            raise RuntimeError(f"K-means worker failed with {value['type']}: {value['message']}\n{value['traceback']}")
+
+        buf, stats, trace = value
+        merge_trace(trace)
+        result = unpack_result(buf)
+        result["stats"] = stats
+        return result
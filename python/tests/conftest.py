@@ -0,0 +1,61 @@
+# shared fixtures of the tests, the modules are imported from the source dir (same as the benchmarks)
+# imports
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gorkov_py_cpp_k_means")
+CPP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cpp")
+sys.path.insert(0, SOURCE_DIR)
+
+# the caches are read from the environment when the modules are imported, every test run gets its own dirs
+CACHE_ROOT = tempfile.mkdtemp(prefix="k_means_tests_")
+os.environ["K_MEANS_CACHE_DIR"] = os.path.join(CACHE_ROOT, "columns")
+os.environ["K_MEANS_RESULT_CACHE_DIR"] = os.path.join(CACHE_ROOT, "results")
+os.environ["K_MEANS_GRAPH_CACHE_DIR"] = os.path.join(CACHE_ROOT, "graphs")
+
+# gaussian blobs of the csv fixture
+BLOB_CENTERS = np.array([[0.0, 0.0, 0.0], [8.0, 8.0, 0.0], [0.0, 8.0, 8.0]])
+BLOB_ROWS = 300
+
+
+# fn to write a csv with the given header and rows, empty cells for NaN
+def write_csv(path: str, headers: list[str], rows) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(headers) + "\n")
+        for row in rows:
+            f.write(",".join("" if isinstance(v, float) and np.isnan(v) else repr(v) if isinstance(v, float) else str(v) for v in row) + "\n")
+    return path
+
+
+# small csv with 3 gaussian blobs in x, y, z, a text column and a row with a missing cell
+@pytest.fixture
+def blobs_csv(tmp_path) -> str:
+    rng = np.random.default_rng(0)
+    points = BLOB_CENTERS[rng.integers(0, len(BLOB_CENTERS), BLOB_ROWS)] + rng.normal(0.0, 0.5, (BLOB_ROWS, 3))
+    points = np.round(points, 4)
+    rows = [[float(x), float(y), float(z), f"r{i}"] for i, (x, y, z) in enumerate(points)]
+    rows[10][1] = float("nan")
+    return write_csv(str(tmp_path / "blobs.csv"), ["x", "y", "z", "name"], rows)
+
+
+# the c++ engine built from cpp/src with g++, the tests that need it are skipped without a compiler
+@pytest.fixture(scope="session")
+def exe_path(tmp_path_factory) -> str:
+    compiler = shutil.which("g++")
+    if compiler is None:
+        pytest.skip("g++ is not installed")
+
+    out = str(tmp_path_factory.mktemp("exe") / "kmeans")
+    process = subprocess.run(
+        [compiler, "-O2", "-std=c++17", "-pthread", os.path.join(CPP_DIR, "src", "main.cpp"), "-o", out],
+        capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        pytest.skip(f"the c++ engine does not build: {process.stderr[-500:]}")
+    return out
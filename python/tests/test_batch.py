@@ -0,0 +1,43 @@
+# batch cli, every engine runs its jobs and the process exits
+# imports
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import SOURCE_DIR
+
+BATCH_TIMEOUT = 120
+
+
+def run_batch_cli(tmp_path, jobs: list[dict], *args: str) -> subprocess.CompletedProcess:
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps(jobs), encoding="utf-8")
+    return subprocess.run(
+        [sys.executable, "K_means_batch.py", str(manifest), "--out", str(tmp_path / "out"), *args],
+        cwd=SOURCE_DIR, capture_output=True, text=True, timeout=BATCH_TIMEOUT,
+    )
+
+
+@pytest.mark.parametrize("engine", ["numpy", "worker"])
+def test_batch_exits(tmp_path, blobs_csv, engine):
+    jobs = [
+        {"name": "k3", "dataset": blobs_csv, "fields": ["x", "y", "z"], "numClusters": 3, "seed": 1, "engine": engine},
+        {"name": "k2", "dataset": blobs_csv, "fields": ["x", "y"], "numClusters": 2, "seed": 1, "nInit": 2, "engine": engine},
+    ]
+    process = run_batch_cli(tmp_path, jobs, "--processes", "2")
+    assert process.returncode == 0, process.stderr
+
+    summary = json.loads((tmp_path / "out" / "summary.json").read_text(encoding="utf-8"))
+    assert [job["status"] for job in summary] == ["ok", "ok"]
+    assert (tmp_path / "out" / "k3.kmb").exists()
+
+
+def test_batch_reports_failed_job(tmp_path, blobs_csv):
+    jobs = [{"name": "bad", "dataset": blobs_csv, "fields": ["name"], "numClusters": 3}]
+    process = run_batch_cli(tmp_path, jobs)
+    assert process.returncode == 1
+
+    summary = json.loads((tmp_path / "out" / "summary.json").read_text(encoding="utf-8"))
+    assert summary[0]["status"] == "error"
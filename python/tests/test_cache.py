@@ -0,0 +1,121 @@
+# tests of the dataset column cache (K_means_dataset.py) and the result cache (K_means_result_cache.py)
+# imports
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import K_means_dataset
+import K_means_result_cache
+from K_means_api import build_payload, run_kmeans
+from K_means_dataset import load_columns_cached, read_csv_columns, get_fingerprint
+from K_means_result_cache import result_key
+from K_means_trace import tracing
+from conftest import write_csv
+
+
+# every test starts with empty caches, the fixture csv has the same content in every test
+@pytest.fixture(autouse=True)
+def empty_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(K_means_dataset, "CACHE_DIR", str(tmp_path / "columns"))
+    monkeypatch.setattr(K_means_result_cache, "RESULT_CACHE_DIR", str(tmp_path / "results"))
+
+
+# fn to load the columns in a trace, returns the columns and the counters
+def traced_load(csv_path: str, fields: list[str]) -> tuple[list[np.ndarray], dict]:
+    with tracing() as trace:
+        columns = load_columns_cached(csv_path, fields)
+    return columns, trace.to_dict()["counters"]
+
+
+def test_columns_are_parsed_once(blobs_csv):
+    columns, counters = traced_load(blobs_csv, ["x", "y"])
+    assert counters["column_cache_misses"] == 2
+    for cached, parsed in zip(columns, read_csv_columns(blobs_csv, ["x", "y"])):
+        np.testing.assert_array_equal(cached, parsed)
+
+    _, counters = traced_load(blobs_csv, ["y", "x"])
+    assert counters.get("column_cache_misses", 0) == 0
+
+    # only the new field is parsed
+    _, counters = traced_load(blobs_csv, ["x", "z"])
+    assert counters["column_cache_misses"] == 1
+
+
+def test_appended_rows_extend_the_cached_columns(blobs_csv):
+    traced_load(blobs_csv, ["x", "y"])
+    with open(blobs_csv, "a", encoding="utf-8") as f:
+        f.write("1.5,2.5,3.5,extra\n2.5,3.5,4.5,extra\n")
+
+    columns, counters = traced_load(blobs_csv, ["x", "y"])
+    assert counters["appended_rows_parsed"] == 2
+    for cached, parsed in zip(columns, read_csv_columns(blobs_csv, ["x", "y"])):
+        np.testing.assert_array_equal(cached, parsed)
+
+
+def test_rewritten_file_is_parsed_again(tmp_path):
+    csv_path = write_csv(str(tmp_path / "same_size.csv"), ["x", "y"], [[1.0, 2.0], [3.0, 4.0]])
+    before = get_fingerprint(csv_path)
+    traced_load(csv_path, ["x", "y"])
+
+    # same size, other content and a later modification time
+    write_csv(csv_path, ["x", "y"], [[5.0, 6.0], [7.0, 8.0]])
+    st = os.stat(csv_path)
+    os.utime(csv_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    assert get_fingerprint(csv_path) != before
+    columns, counters = traced_load(csv_path, ["x", "y"])
+    assert counters["column_cache_misses"] == 2
+    np.testing.assert_array_equal(columns[0], [5.0, 7.0])
+
+
+def test_concurrent_loads_agree(blobs_csv):
+    results = [None] * 4
+
+    def load(i: int):
+        results[i] = [np.array(column) for column in load_columns_cached(blobs_csv, ["x", "y", "z"])]
+
+    threads = [threading.Thread(target=load, args=(i,)) for i in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for columns in results[1:]:
+        for a, b in zip(results[0], columns):
+            np.testing.assert_array_equal(a, b)
+
+
+def test_result_key(blobs_csv, tmp_path):
+    payload = build_payload(blobs_csv, 3, ["x", "y"], seed=1)
+    key = result_key(payload, "numpy")
+
+    assert result_key(build_payload(blobs_csv, 3, ["x", "y"]), "numpy") is None
+    assert result_key(payload, "worker") == key
+    assert result_key(build_payload(blobs_csv, 4, ["x", "y"], seed=1), "numpy") != key
+    assert result_key(build_payload(blobs_csv, 3, ["x", "y"], seed=2), "numpy") != key
+
+    # the exe results are keyed by the exe build
+    exe = tmp_path / "kmeans"
+    exe.write_bytes(b"v1")
+    exe_key = result_key(payload, "exe", str(exe))
+    assert exe_key != key
+    exe.write_bytes(b"v2.0")
+    assert result_key(payload, "exe", str(exe)) != exe_key
+    assert result_key(payload, "exe", str(tmp_path / "missing")) is None
+
+    with open(blobs_csv, "a", encoding="utf-8") as f:
+        f.write("1.0,1.0,1.0,extra\n")
+    assert result_key(payload, "numpy") != key
+
+
+def test_cached_result_is_reused(blobs_csv):
+    payload = build_payload(blobs_csv, 3, ["x", "y"], seed=3)
+    first = run_kmeans(payload, trace_path=None)
+    second = run_kmeans(payload, trace_path=None)
+
+    assert not first["stats"].get("cached")
+    assert second["stats"]["cached"]
+    np.testing.assert_array_equal(first["labels"], second["labels"])
+    assert first["CH_index"] == second["CH_index"]
@@ -0,0 +1,67 @@
+# the numpy engine against the c++ engine on the same csv and the same starting centers
+# imports
+import numpy as np
+import pytest
+
+from K_means_api import build_payload, run_kmeans_arrays, run_kmeans
+from K_means_dataset import load_dataset
+
+START_CENTERS = [[0.5, 0.5, 0.5], [7.5, 7.5, 0.5], [0.5, 7.5, 7.5]]
+
+
+# fn to run the payload without the caches and the trace file
+def run(payload: dict, engine: str, exe_path: str | None = None) -> dict:
+    kwargs = {"exe_path": exe_path} if exe_path else {}
+    return run_kmeans_arrays(payload, engine, use_cache=False, trace_path=None, **kwargs)
+
+
+def test_numpy_matches_exe(blobs_csv, exe_path):
+    fields = ["x", "y", "z"]
+    numpy_result = run(build_payload(blobs_csv, 3, fields, centers=START_CENTERS), "numpy")
+    exe_result = run(build_payload(blobs_csv, 3, fields, centers=START_CENTERS, engine="exe"), "exe", exe_path)
+
+    # the row with the missing cell is skipped by both
+    assert len(numpy_result["labels"]) == len(exe_result["labels"]) == len(load_dataset(blobs_csv, fields))
+    np.testing.assert_array_equal(numpy_result["labels"], exe_result["labels"])
+    # the exe computes in float32
+    np.testing.assert_allclose(numpy_result["centers"], exe_result["centers"], rtol=1e-5, atol=1e-5)
+    assert numpy_result["CH_index"] == pytest.approx(exe_result["CH_index"], rel=1e-4)
+
+
+def test_exe_json_output(blobs_csv, exe_path):
+    payload = build_payload(blobs_csv, 3, ["x", "y"], centers=[c[:2] for c in START_CENTERS], engine="exe", output="json")
+    exe_result = run_kmeans(payload, "exe", exe_path, use_cache=False, trace_path=None)
+    numpy_result = run_kmeans(build_payload(blobs_csv, 3, ["x", "y"], centers=[c[:2] for c in START_CENTERS]), use_cache=False, trace_path=None)
+
+    for i in range(3):
+        assert len(exe_result[f"C{i}"]) == len(numpy_result[f"C{i}"])
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_exe_seeding_is_reproducible(blobs_csv, exe_path, seed):
+    payload = build_payload(blobs_csv, 3, ["x", "y", "z"], engine="exe", init="kmeans++", seed=seed)
+    first = run(payload, "exe", exe_path)
+    second = run(payload, "exe", exe_path)
+
+    np.testing.assert_array_equal(first["labels"], second["labels"])
+
+
+@pytest.mark.parametrize("k", [3, 12])
+def test_exe_hamerly_matches_lloyd(blobs_csv, exe_path, k):
+    results = [
+        run(build_payload(blobs_csv, k, ["x", "y", "z"], engine="exe", init="kmeans++", seed=4, assignment=assignment), "exe", exe_path)
+        for assignment in ("lloyd", "hamerly")
+    ]
+
+    np.testing.assert_array_equal(results[0]["labels"], results[1]["labels"])
+    np.testing.assert_array_equal(results[0]["centers"], results[1]["centers"])
+
+
+@pytest.mark.parametrize("options", [{}, {"n_init": 3}, {"mode": "minibatch"}])
+def test_reported_seed_repeats_the_run(blobs_csv, options):
+    first = run(build_payload(blobs_csv, 3, ["x", "y"], **options), "numpy")
+    seed = first["stats"]["seed"]
+    second = run(build_payload(blobs_csv, 3, ["x", "y"], seed=seed, **options), "numpy")
+
+    assert isinstance(seed, int)
+    np.testing.assert_array_equal(first["labels"], second["labels"])
@@ -0,0 +1,64 @@
+# tests of the label export (K_means_export.py) against the predictions of the saved model (K_means_model.py)
+# imports
+import csv
+
+import numpy as np
+import pytest
+
+import K_means_model
+from K_means_api import build_payload, run_kmeans_arrays
+from K_means_export import export_csv, export_binary, read_binary
+from K_means_model import model_from_result, predict_csv
+
+FIELDS = ["x", "y", "z"]
+
+
+# fn to read the cluster column of a csv
+def read_clusters(path: str) -> list[str]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row["cluster"] for row in csv.DictReader(f)]
+
+
+# fn to run the clustering of the fixture csv
+def fixture_run(csv_path: str, scaling: str = "none") -> tuple[dict, dict]:
+    payload = build_payload(csv_path, 3, FIELDS, seed=7, scaling=scaling)
+    return payload, run_kmeans_arrays(payload, use_cache=False, trace_path=None)
+
+
+@pytest.mark.parametrize("index_min_clusters", [K_means_model.PREDICT_INDEX_MIN_CLUSTERS, 2])
+@pytest.mark.parametrize("scaling", ["none", "robust"])
+def test_predict_matches_export(blobs_csv, tmp_path, monkeypatch, scaling, index_min_clusters):
+    # with 2 the center index of predict is used for the 3 clusters
+    monkeypatch.setattr(K_means_model, "PREDICT_INDEX_MIN_CLUSTERS", index_min_clusters)
+    payload, result = fixture_run(blobs_csv, scaling)
+
+    exported = str(tmp_path / "exported.csv")
+    predicted = str(tmp_path / "predicted.csv")
+    export_csv(blobs_csv, FIELDS, result["labels"], exported)
+    predict_csv(model_from_result(payload, result), blobs_csv, predicted)
+
+    clusters = read_clusters(exported)
+    assert clusters == read_clusters(predicted)
+    # the row with the missing cell has no cluster
+    assert clusters[10] == "" and clusters.count("") == 1
+
+
+def test_binary_export_matches_csv(blobs_csv, tmp_path):
+    _, result = fixture_run(blobs_csv)
+    export_csv(blobs_csv, FIELDS, result["labels"], str(tmp_path / "labels.csv"))
+    export_binary(blobs_csv, FIELDS, result["labels"], str(tmp_path / "labels.kmx"), result["centers"])
+
+    exported = read_binary(str(tmp_path / "labels.kmx"))
+    clusters = exported["columns"]["cluster"]
+    assert [str(c) if c >= 0 else "" for c in clusters.tolist()] == read_clusters(str(tmp_path / "labels.csv"))
+    np.testing.assert_array_equal(exported["centers"], result["centers"])
+    assert np.isnan(exported["columns"]["y"][10])
+
+
+def test_export_rejects_labels_of_another_dataset(blobs_csv, tmp_path):
+    _, result = fixture_run(blobs_csv)
+    out = tmp_path / "labels.csv"
+
+    with pytest.raises(ValueError):
+        export_csv(blobs_csv, FIELDS, result["labels"][:-1], str(out))
+    assert not out.exists()
@@ -0,0 +1,39 @@
+# tests of the saved models and the center index of predict (K_means_model.py)
+# imports
+import numpy as np
+import pytest
+
+from K_means_engine import nearest_centers
+from K_means_model import CenterIndex
+
+
+# fn to get centers on an integer grid, every center twice, and rows on the half grid, most rows have tied centers
+def grid_ties(num_centers: int, num_rows: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    centers = rng.integers(0, 12, (num_centers, 3)).astype(np.float64)
+    centers = np.concatenate([centers, centers[rng.permutation(num_centers)]])
+    rows = rng.integers(0, 24, (num_rows, 3)) / 2.0
+    return centers, rows
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_center_index_matches_nearest_centers(seed):
+    centers, rows = grid_ties(120, 5000, seed)
+    labels, nearest = nearest_centers(rows, centers)
+
+    index_labels, index_nearest, evaluations = CenterIndex(centers).nearest(rows)
+
+    np.testing.assert_array_equal(index_nearest, nearest)
+    np.testing.assert_array_equal(index_labels, labels)
+    assert evaluations < rows.shape[0] * centers.shape[0]
+
+
+def test_center_index_with_weights():
+    centers, rows = grid_ties(80, 3000, 3)
+    weights = np.array([1.0, 0.5, 2.0])
+    labels, nearest = nearest_centers(rows, centers, weights)
+
+    index_labels, index_nearest, _ = CenterIndex(centers, weights).nearest(rows)
+
+    np.testing.assert_array_equal(index_nearest, nearest)
+    np.testing.assert_array_equal(index_labels, labels)
@@ -0,0 +1,23 @@
+# tests of the payload checks of build_payload (K_means_api.py)
+# imports
+import pytest
+
+from K_means_api import build_payload
+
+
+@pytest.mark.parametrize("engine", ["numpy", "worker", "exe"])
+def test_unknown_init_is_rejected(blobs_csv, engine):
+    with pytest.raises(ValueError, match="Unknown seeding mode"):
+        build_payload(blobs_csv, 3, ["x", "y"], engine=engine, init="kmeans+++")
+
+
+def test_exe_seedings(blobs_csv):
+    for init in ("random", "kmeans++"):
+        assert build_payload(blobs_csv, 3, ["x", "y"], engine="exe", init=init)["init"] == init
+
+    with pytest.raises(ValueError, match="numpy or worker engine"):
+        build_payload(blobs_csv, 3, ["x", "y"], engine="exe", init="kmeans||")
+
+    # given centers need no seeding
+    payload = build_payload(blobs_csv, 2, ["x", "y"], centers=[[0.0, 0.0], [8.0, 8.0]], engine="exe", init="kmeans||")
+    assert "init" not in payload
@@ -0,0 +1,69 @@
+# tests of the column statistics of the feature scaling (K_means_scaling.py, get_column_stats)
+# imports
+import numpy as np
+import pytest
+
+import K_means_dataset
+import K_means_scaling
+from K_means_api import build_payload
+from K_means_dataset import load_dataset, get_column_stats
+from K_means_engine import get_scaling
+from K_means_scaling import ColumnStats
+from K_means_trace import tracing
+
+
+# fn to stream the rows through ColumnStats in blocks
+def streamed(data: np.ndarray, block_rows: int) -> ColumnStats:
+    stats = ColumnStats(data.shape[1])
+    for start in range(0, data.shape[0], block_rows):
+        stats.update(data[start:start + block_rows])
+    return stats
+
+
+def test_small_columns_are_exact():
+    data = np.random.default_rng(0).normal(size=(1000, 2))
+    stats = streamed(data, 128).to_list()
+
+    for j in range(2):
+        assert stats[j]["mean"] == pytest.approx(data[:, j].mean())
+        assert stats[j]["std"] == pytest.approx(data[:, j].std())
+        assert stats[j]["min"] == data[:, j].min()
+        assert stats[j]["median"] == pytest.approx(np.median(data[:, j]))
+
+
+def test_reservoir_sample(monkeypatch):
+    monkeypatch.setattr(K_means_scaling, "STATS_SAMPLE_ROWS", 2000)
+    data = np.random.default_rng(1).uniform(size=(50_000, 2))
+    stats = streamed(data, 3000)
+
+    # the buffer is never grown, every kept row is a row of the data
+    assert stats.sample.shape == (2000, 2) and stats.filled == 2000
+    rows = {tuple(row) for row in data}
+    assert all(tuple(row) in rows for row in stats.sample)
+
+    # the sample is spread over the whole stream, not only its first or last blocks
+    kept = np.isin(data[:, 0], stats.sample[:, 0]).nonzero()[0]
+    assert kept.min() < 5000 and kept.max() > 45_000
+
+    q1, median, q3 = (stats.to_list()[0][name] for name in ("q1", "median", "q3"))
+    assert q1 == pytest.approx(0.25, abs=0.05)
+    assert median == pytest.approx(0.5, abs=0.05)
+    assert q3 == pytest.approx(0.75, abs=0.05)
+
+
+def test_streamed_stats_are_cached(blobs_csv, tmp_path, monkeypatch):
+    monkeypatch.setattr(K_means_dataset, "CACHE_DIR", str(tmp_path / "columns"))
+    payload = build_payload(blobs_csv, 3, ["x", "y"], mode="minibatch", scaling="robust")
+
+    with tracing() as trace:
+        first = get_scaling(payload, batch_rows=64)
+        second = get_scaling(payload, batch_rows=64)
+    spans = [s["name"] for s in trace.to_dict()["spans"]]
+    assert spans.count("column_stats") == 1
+    assert first == second
+
+    # the full mode reads the same entry, computed over the same rows
+    stats = get_column_stats(blobs_csv, ["x", "y"])
+    data = load_dataset(blobs_csv, ["x", "y"])
+    assert stats[0]["count"] == data.shape[0]
+    assert stats[1]["mean"] == pytest.approx(data[:, 1].mean())
@@ -0,0 +1,66 @@
+# tests of the KMB1 binary result format (K_means_transport.py)
+# imports
+import json
+import subprocess
+
+import numpy as np
+import pytest
+
+from K_means_dataset import load_dataset
+from K_means_transport import HEADER, is_binary_result, pack_result, unpack_result, result_to_dict, result_from_dict
+
+
+def test_round_trip():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(4, 5))
+    labels = rng.integers(0, 4, 1000)
+
+    buf = pack_result(12.5, centers, labels)
+    assert is_binary_result(buf)
+    assert len(buf) == HEADER.size + centers.size * 8 + labels.size * 4
+
+    result = unpack_result(buf)
+    assert result["CH_index"] == 12.5
+    np.testing.assert_array_equal(result["centers"], centers)
+    np.testing.assert_array_equal(result["labels"], labels)
+    assert result["labels"].dtype == np.dtype("<i4")
+
+
+def test_empty_and_invalid_buffers():
+    result = unpack_result(pack_result(0.0, np.zeros((2, 3)), np.empty(0, dtype=np.int32)))
+    assert result["labels"].shape == (0,) and result["centers"].shape == (2, 3)
+
+    assert not is_binary_result(b'{"CH_index": 1.0}')
+    with pytest.raises(ValueError):
+        unpack_result(b"KMX1" + bytes(HEADER.size))
+
+
+def test_dict_round_trip():
+    rng = np.random.default_rng(1)
+    data = np.round(rng.normal(size=(200, 3)), 3)
+    centers = rng.normal(size=(3, 3))
+    labels = rng.integers(0, 3, 200).astype(np.int32)
+
+    as_dict = result_to_dict(data, {"CH_index": 3.0, "centers": centers, "labels": labels})
+    assert sum(len(as_dict[f"C{i}"]) for i in range(3)) == 200
+
+    back = result_from_dict(data, json.loads(json.dumps(as_dict)))
+    np.testing.assert_array_equal(back["labels"], labels)
+    np.testing.assert_array_equal(back["centers"], centers)
+
+    with pytest.raises(ValueError):
+        result_to_dict(data[:10], {"CH_index": 3.0, "centers": centers, "labels": labels})
+
+
+def test_exe_binary_output_matches_json_output(blobs_csv, exe_path):
+    payload = {"dataset": blobs_csv, "fields": ["x", "y", "z"], "numClusters": 3, "seed": 2, "init": "kmeans++"}
+    outputs = {
+        output: subprocess.run([exe_path], input=json.dumps(dict(payload, output=output)).encode(), capture_output=True, check=True).stdout
+        for output in ("binary", "json")
+    }
+
+    binary = unpack_result(outputs["binary"])
+    from_json = result_from_dict(load_dataset(blobs_csv, ["x", "y", "z"]), json.loads(outputs["json"]))
+    np.testing.assert_array_equal(binary["labels"], from_json["labels"])
+    np.testing.assert_allclose(binary["centers"], from_json["centers"], rtol=1e-6)
+    assert binary["CH_index"] == pytest.approx(json.loads(outputs["json"])["CH_index"])
@@ -0,0 +1,59 @@
+# tests of the warm start from the last result (apply_warm_start in K_means_api.py)
+# imports
+import numpy as np
+
+from K_means_api import build_payload, run_kmeans, apply_warm_start, previous_run
+from conftest import write_csv
+
+
+# fn to run k=3 on the csv and keep the result for the next run
+def last_run(csv_path: str) -> dict:
+    payload = build_payload(csv_path, 3, ["x", "y"], seed=1)
+    return previous_run(payload, run_kmeans(payload, use_cache=False, trace_path=None))
+
+
+def test_continues_the_same_file(blobs_csv):
+    previous = last_run(blobs_csv)
+    payload, info = apply_warm_start(build_payload(blobs_csv, 4, ["x", "y"]), previous)
+
+    assert info is not None
+    assert len(payload["centers"]) == 4
+    assert "init" not in payload
+
+
+def test_continues_appended_rows(blobs_csv):
+    previous = last_run(blobs_csv)
+    with open(blobs_csv, "a", encoding="utf-8") as f:
+        f.write("1.0,1.0,1.0,extra\n")
+
+    _, info = apply_warm_start(build_payload(blobs_csv, 3, ["x", "y"]), previous)
+
+    assert info is not None
+
+
+def test_skips_another_file_with_the_same_fields(blobs_csv, tmp_path):
+    previous = last_run(blobs_csv)
+    other = write_csv(str(tmp_path / "other.csv"), ["x", "y", "z", "name"], [[float(i), float(-i), 0.0, "a"] for i in range(50)])
+    payload = build_payload(other, 3, ["x", "y"])
+
+    assert apply_warm_start(payload, previous) == (payload, None)
+
+
+def test_skips_a_rewritten_file(blobs_csv):
+    previous = last_run(blobs_csv)
+    rng = np.random.default_rng(5)
+    write_csv(blobs_csv, ["x", "y", "z", "name"], [[float(v), float(v), 0.0, "a"] for v in rng.normal(size=400)])
+    payload = build_payload(blobs_csv, 3, ["x", "y"])
+
+    assert apply_warm_start(payload, previous) == (payload, None)
+
+
+def test_skips_a_chosen_seeding(blobs_csv):
+    previous = last_run(blobs_csv)
+
+    for payload in (
+        build_payload(blobs_csv, 3, ["x", "y"], init="kmeans++"),
+        build_payload(blobs_csv, 3, ["x", "y"], seed=7),
+        build_payload(blobs_csv, 3, ["x", "y"], n_init=4),
+    ):
+        assert apply_warm_start(payload, previous) == (payload, None)
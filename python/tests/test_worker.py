@@ -0,0 +1,60 @@
+# tests of the long-lived worker process (K_means_worker.py)
+# imports
+import numpy as np
+import pytest
+
+from K_means_api import build_payload
+from K_means_dataset import load_dataset
+from K_means_engine import run_kmeans_on_data
+from K_means_worker import KMeansWorker
+
+
+@pytest.fixture
+def worker():
+    worker = KMeansWorker()
+    worker.start()
+    yield worker
+    worker.stop()
+
+
+def test_worker_matches_numpy(worker, blobs_csv):
+    payload = build_payload(blobs_csv, 3, ["x", "y"], seed=5)
+    result = worker.run(payload)
+    expected = run_kmeans_on_data(load_dataset(blobs_csv, ["x", "y"]), payload)
+
+    np.testing.assert_array_equal(result["labels"], expected["labels"])
+    np.testing.assert_allclose(result["centers"], expected["centers"])
+
+    # the dataset stays loaded for the next run
+    assert worker.ping()["datasets"]
+
+
+def test_worker_restarts(worker, blobs_csv):
+    payload = build_payload(blobs_csv, 2, ["x", "y"], seed=1)
+    pid = worker.ping()["pid"]
+
+    worker.kill()
+    assert worker.ping() is None
+    worker.ensure_alive()
+    assert worker.ping()["pid"] != pid
+
+    # a run on a dead worker starts it again
+    worker.process.kill()
+    worker.process.join()
+    assert worker.run(payload)["labels"].shape[0] == load_dataset(blobs_csv, ["x", "y"]).shape[0]
+
+
+def test_worker_input_error_is_value_error(worker, blobs_csv):
+    with pytest.raises(ValueError, match="numClusters is larger than the number of valid rows"):
+        worker.run(build_payload(blobs_csv, 1000, ["x", "y"]))
+
+    # the worker keeps running after an error
+    assert worker.ping() is not None
+
+
+def test_worker_other_error_is_runtime_error(worker, blobs_csv):
+    payload = build_payload(blobs_csv, 2, ["x", "y"])
+    payload["dataset"] = blobs_csv + ".missing"
+
+    with pytest.raises(RuntimeError, match="FileNotFoundError"):
+        worker.run(payload)